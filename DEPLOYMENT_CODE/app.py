@@ -1,37 +1,53 @@
-import pandas as pd
-import joblib
-from fastapi import FastAPI
-from pydantic import BaseModel
+import os
+import sys
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import create_model
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from batch_io import UnsupportedFormat, predict_batch
+from model_registry import REGISTRY_DIR, LiveModel
+from scoring_pipeline import SchemaError
 
-# Load the trained model
-model = joblib.load("models/k8s_failure_model.pkl")
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../models/k8s_failure_model.pkl")
+
+# The registry's current model (flattened for scoring), swapped in without a restart when a
+# new version is promoted; the single model file is used until one is published
+live_model = LiveModel(os.getenv("MODEL_REGISTRY", REGISTRY_DIR), fallback_path=MODEL_PATH)
+# Seconds a prediction may take: an ensemble answers with its fastest model when both would not fit
+PREDICT_BUDGET = float(os.getenv("PREDICT_BUDGET", "0.05"))
 
 app = FastAPI()
 
-# Define request model
-class PredictionRequest(BaseModel):
-    cpu_usage: float
-    memory_usage: float
-    container_network_receive_bytes_total: float
-    container_network_transmit_bytes_total: float
-    container_fs_usage_bytes: float
-    cpu_usage_avg: float
-    memory_usage_avg: float
-    container_network_receive_bytes_total_avg: float
-    container_network_transmit_bytes_total_avg: float
-    container_fs_usage_bytes_avg: float
-    container_restart_count_avg: float
+# Request model: one required field per feature of the model served at startup (null for a
+# value that is missing, filled with its training mean)
+PredictionRequest = create_model("PredictionRequest",
+                                 **{str(feature): (float | None, ...) for feature in live_model.get().features})
 
 @app.post("/predict")
 async def predict_failure(data: PredictionRequest):
-    # Convert request data to a DataFrame
-    input_data = pd.DataFrame([data.dict()])
-
-    # Temporary fix: Add a dummy 'target_avg' column
-    input_data["target_avg"] = 0  
-
-    # Make prediction
-    prediction = model.predict(input_data)
-    
+    try:
+        prediction = live_model.get().predict(data.model_dump(), budget=PREDICT_BUDGET)
+    except SchemaError as e:  # a version promoted since startup needs other features
+        raise HTTPException(status_code=422, detail=str(e))
     return {"failure_predicted": "YES" if prediction[0] == 1 else "NO"}
 
+@app.post("/predict/batch")
+async def predict_failure_batch(request: Request):
+    """
+    Many samples in one request, as a JSON array, NDJSON or an Arrow IPC stream (by
+    Content-Type, see batch_io.decode_batch), scored together; returns every sample's
+    prediction (1 = failure) and failure probability in request order
+    """
+    model = live_model.get()
+    body = await request.body()
+    try:
+        # Decoding and scoring run in a worker thread so the event loop keeps serving
+        content = await run_in_threadpool(predict_batch, model, body, request.headers.get("content-type"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except SchemaError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content, media_type="application/json")
+
@@ -1,14 +1,23 @@
 import streamlit as st
-import requests
 import pandas as pd
 import os
-from datetime import datetime, timezone
+import sys
 import threading
 import time
 import subprocess
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from scrape_pool import fetch_all, format_timings
+import metrics_store
+import rollups
+from series_align import align
+from prom_decode import decode_matrix
+from watermarks import Watermarks
 
 # Constants
 PROMETHEUS_URL = "http://192.168.49.2:32745/api/v1/query"
+PROMETHEUS_RANGE_URL = PROMETHEUS_URL + "_range"
+SCRAPE_STEP = 15  # resolution of the samples pulled each cycle
+MAX_LOOKBACK = 3600  # how far back the first fetch reaches
 
 SAVE_DIR = os.path.join(os.path.dirname(__file__), "../data")
 os.makedirs(SAVE_DIR, exist_ok=True)
@@ -40,69 +49,51 @@ if "model_trained" not in st.session_state:
     st.session_state.model_trained = False
 if "prediction_done" not in st.session_state:
     st.session_state.prediction_done = False
-
-# Function to fetch a single metric from Prometheus
-def fetch_metric(query, label):
-    try:
-        response = requests.get(PROMETHEUS_URL, params={"query": query})
-        data = response.json()
-    except Exception as e:
-        st.error(f"❌ Failed to fetch metric {label}: {e}")
-        return pd.DataFrame()
-
-    results = []
-    for item in data.get("data", {}).get("result", []):
-        try:
-            timestamp = datetime.fromtimestamp(float(item["value"][0]), tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-            value = float(item["value"][1])
-            entry = {"timestamp": timestamp, label: value}
-
-            # Optional fields
-            instance = item["metric"].get("instance")
-            container = item["metric"].get("container")
-
-            if instance:
-                entry["instance"] = instance
-            if container:
-                entry["container"] = container
-
-            results.append(entry)
-        except Exception as e:
-            st.error(f"❌ Error processing {label}: {e}")
-
-    df = pd.DataFrame(results)
-    if not df.empty:
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    return df
+if "watermarks" not in st.session_state:
+    st.session_state.watermarks = Watermarks()
 
 # Fetch all metrics and save them to a CSV file
 def fetch_and_save_metrics():
     st.session_state.metrics_in_progress = True
     st.info("Fetching live metrics... Please wait.")
-    all_data = None
-
-    for key, query in METRICS.items():
-        df = fetch_metric(query, key)
+    watermarks = st.session_state.watermarks
+    frames = {}
+
+    # Only ask for samples newer than what is already stored
+    now = time.time()
+    ranges = {
+        key: {"start": watermarks.next_start(key, SCRAPE_STEP, now - MAX_LOOKBACK), "end": now, "step": SCRAPE_STEP}
+        for key in METRICS
+    }
+    due = {key: query for key, query in METRICS.items() if ranges[key]["start"] <= now}
+    responses, timings, errors = fetch_all(PROMETHEUS_RANGE_URL, due, per_query_params=ranges)
+    print(f"⏱️ Query timings:\n{format_timings(timings)}")
+
+    for key in due:
+        if key in errors:
+            st.error(f"❌ Failed to fetch metric {key}: {errors[key]}")
+            continue
+        try:
+            df = watermarks.filter_new(key, decode_matrix(responses[key], key))
+        except Exception as e:
+            st.error(f"❌ Error processing {key}: {e}")
+            continue
 
         if df.empty:
-            st.warning(f"⚠️ No data for {key}, skipping.")
             continue
 
-        if all_data is None:
-            all_data = df
-        else:
-            common_cols = list(set(all_data.columns).intersection(set(df.columns)))
-            if "timestamp" not in common_cols:
-                st.warning(f"⚠️ No common timestamp found for {key}, skipping merge.")
-                continue
-            all_data = pd.merge(all_data, df, on=common_cols, how="outer")
+        frames[key] = df
+
+    all_data = align(frames)
 
     if all_data is not None and not all_data.empty:
-        save_path = os.path.join(SAVE_DIR, "k8s_live_metrics.csv")
-        all_data.to_csv(save_path, index=False)
-        st.success(f"✅ Metrics fetched and saved to {save_path}")
+        rollups.ingest(all_data)
+        for key, df in frames.items():
+            watermarks.advance(key, df)
+        watermarks.save()
+        st.success(f"✅ {len(all_data)} new rows appended to {metrics_store.STORE_DIR}")
         st.session_state.metrics_fetched = True
-    else:
+    elif not st.session_state.metrics_fetched:
         st.warning("⚠️ No metrics fetched.")
 
     st.session_state.metrics_in_progress = False
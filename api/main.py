@@ -1,15 +1,35 @@
-from fastapi import FastAPI
-import pickle
+import os
+import sys
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from batch_io import UnsupportedFormat, predict_batch
+from model_registry import LiveModel
+from scoring_pipeline import SchemaError
 
 app = FastAPI()
 
-# Load Trained Model
-with open("../model/model.pkl", "rb") as file:
-    model = pickle.load(file)
+# Trained model: its own registry next to the pickle, reloaded when a new version is promoted
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../model")
+live_model = LiveModel(os.path.join(MODEL_DIR, "registry"), fallback_path=os.path.join(MODEL_DIR, "model.pkl"))
 
 @app.get("/predict")
 def predict(cpu: float, mem: float):
-    prediction = model.predict(np.array([[cpu, mem]]))
+    prediction = live_model.get().predict(np.array([[cpu, mem]]))
     return {"failure_predicted": bool(prediction[0])}
 
+@app.post("/predict/batch")
+async def predict_many(request: Request):
+    """Many [cpu, mem] rows at once (JSON, NDJSON or Arrow IPC body, see batch_io), one response for all"""
+    model = live_model.get()
+    body = await request.body()
+    try:
+        content = await run_in_threadpool(predict_batch, model, body, request.headers.get("content-type"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except SchemaError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content, media_type="application/json")
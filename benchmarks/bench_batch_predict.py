@@ -0,0 +1,161 @@
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from batch_io import encode_arrow
+from ensemble import EnsemblePredictor
+from model_registry import publish
+from scoring_pipeline import ScoringPipeline
+from train_model_live import make_models
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../DEPLOYMENT_CODE/app.py")
+# The serving features of the synthetic model (the trainer's metrics and their rolling averages)
+FEATURES = ("cpu_usage", "memory_usage", "container_restarts_avg",
+            "cpu_usage_avg", "memory_usage_avg", "container_restarts_avg_avg")
+CONTENT_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def load_app(registry_dir):
+    """
+    DEPLOYMENT_CODE/app.py as a module (src/ has an app.py of its own, so not by name),
+    serving the registry in `registry_dir`
+    """
+    os.environ["MODEL_REGISTRY"] = registry_dir
+    spec = importlib.util.spec_from_file_location("deployment_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic(n, features, seed=0):
+    """Request-shaped rows with a nonlinear failure rule"""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.gamma(2.0, 0.2, (n, len(features))).astype(np.float32), columns=features)
+    y = ((X.iloc[:, 0] + X.iloc[:, 1] * X.iloc[:, -1] + rng.normal(0, 0.1, n)) > 0.6).astype(int)
+    return X, y
+
+
+def publish_synthetic(features, rows, registry_dir):
+    """Publish an ensemble fitted on synthetic rows to `registry_dir`"""
+    X, y = synthetic(rows, features, seed=1)
+    rf, xgb = make_models(n_jobs=1)
+    ensemble = EnsemblePredictor({"rf": rf.fit(X, y), "xgb": xgb.fit(X, y)})
+    publish(ScoringPipeline(features, X.mean().to_numpy(), ensemble), registry_dir=registry_dir)
+
+
+def served_features(url):
+    """The running app's request fields (its model's features), from its OpenAPI schema"""
+    import requests
+    schema = requests.get(f"{url}/openapi.json", timeout=10).json()
+    return list(schema["components"]["schemas"]["PredictionRequest"]["properties"])
+
+
+def encode(kind, X):
+    if kind == "arrow":
+        return encode_arrow({column: X[column].to_numpy() for column in X.columns})
+    records = X.to_dict(orient="records")
+    if kind == "ndjson":
+        return "\n".join(json.dumps(record) for record in records).encode()
+    return json.dumps(records).encode()
+
+
+def client_factory(url, app):
+    """post(path, body, content type) on one keep-alive connection per thread"""
+    local = threading.local()
+
+    def post(path, body, content_type):
+        if not hasattr(local, "client"):
+            if url:
+                import requests
+                local.client = requests.Session()
+            else:
+                from fastapi.testclient import TestClient
+                local.client = TestClient(app.app)
+        started = time.perf_counter()
+        response = local.client.post(f"{url or ''}{path}", headers={"Content-Type": content_type},
+                                     **({"data": body} if url else {"content": body}))
+        if response.status_code != 200:
+            raise SystemExit(f"❌ {path}: HTTP {response.status_code} {response.text[:200]}")
+        return time.perf_counter() - started, response.json()
+
+    return post
+
+
+def run(post, jobs, clients):
+    """Send every (path, body, content type) over `clients` connections: (seconds, latencies, responses)"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda job: post(*job), jobs))
+    return time.perf_counter() - started, np.array([r[0] for r in results]), [r[1] for r in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test: single-row /predict vs batch /predict/batch rows per second")
+    parser.add_argument("--url", help="a running DEPLOYMENT_CODE/app.py (e.g. http://localhost:8000); "
+                                      "default: the app in-process with a synthetic model")
+    parser.add_argument("--single", type=int, default=500, help="single-row requests")
+    parser.add_argument("--rows", type=int, default=50_000, help="rows sent through the batch endpoint per format")
+    parser.add_argument("--batch", type=int, default=5000, help="rows per batch request")
+    parser.add_argument("--clients", type=int, default=1, help="concurrent connections")
+    parser.add_argument("--train-rows", type=int, default=20_000, help="rows the in-process synthetic model is fitted on")
+    args = parser.parse_args()
+
+    app = registry_dir = None
+    if args.url:
+        features = served_features(args.url)
+    else:
+        features = list(FEATURES)
+        registry_dir = tempfile.mkdtemp(prefix="bench-registry-")
+        publish_synthetic(features, args.train_rows, registry_dir)
+        app = load_app(registry_dir)
+    try:
+        post = client_factory(args.url, app)
+        X, _ = synthetic(max(args.rows, args.single), features)
+        post("/predict/batch", encode("json", X.iloc[:10]), CONTENT_TYPES["json"])  # model loaded, connection open
+
+        records = X.iloc[:args.single].to_dict(orient="records")
+        seconds, latencies, single = run(post, [("/predict", json.dumps(r).encode(), CONTENT_TYPES["json"])
+                                                for r in records], args.clients)
+        single_rate = args.single / seconds
+        print(f"{'endpoint':<24} {'rows':>7} {'requests':>8} {'rows/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'speedup':>8}")
+        print(f"{'/predict (one row)':<24} {args.single:>7} {args.single:>8} {single_rate:>10.0f} "
+              f"{np.percentile(latencies, 50) * 1e3:>8.2f} {np.percentile(latencies, 99) * 1e3:>8.2f} {1:>7.1f}x")
+
+        expected = np.array([1 if r["failure_predicted"] == "YES" else 0 for r in single])
+        ok = True
+        for kind, content_type in CONTENT_TYPES.items():
+            jobs = [("/predict/batch", encode(kind, X.iloc[i:i + args.batch]), content_type)
+                    for i in range(0, args.rows, args.batch)]
+            seconds, latencies, responses = run(post, jobs, args.clients)
+            rate = args.rows / seconds
+            print(f"{'/predict/batch ' + kind:<24} {args.rows:>7} {len(jobs):>8} {rate:>10.0f} "
+                  f"{np.percentile(latencies, 50) * 1e3:>8.2f} {np.percentile(latencies, 99) * 1e3:>8.2f} "
+                  f"{rate / single_rate:>7.1f}x")
+            labels = np.concatenate([r["failure_predicted"] for r in responses])
+            # Same model and the same rows: the batch answers must be the single-row ones
+            mismatches = int((labels[:len(expected)] != expected).sum())
+            if mismatches:
+                print(f"   ❌ {mismatches} of the first {len(expected)} rows differ from the single-row predictions")
+                ok = False
+        if not ok:
+            raise SystemExit("❌ Batch and single-row predictions differ")
+    finally:
+        if registry_dir:
+            shutil.rmtree(registry_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from prom_decode import decode_vector, loads
+
+RECORD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "responses")
+
+
+def legacy_parse(data, label):
+    """The per-item decode fetch_metric used before prom_decode"""
+    results = []
+    for item in data.get("data", {}).get("result", []):
+        timestamp = datetime.fromtimestamp(float(item["value"][0]), tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        entry = {"timestamp": timestamp, label: float(item["value"][1])}
+        instance = item["metric"].get("instance")
+        container = item["metric"].get("container")
+        if instance:
+            entry["instance"] = instance
+        if container:
+            entry["container"] = container
+        results.append(entry)
+    df = pd.DataFrame(results)
+    if not df.empty:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    return df
+
+
+def synthetic_response(n_series, seed=0):
+    """Instant-query body shaped like cAdvisor's container_memory_usage_bytes"""
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    result = [{
+        "metric": {
+            "__name__": "container_memory_usage_bytes",
+            "container": f"container-{i % 40}",
+            "instance": f"192.168.49.{i % 250}:10250",
+            "namespace": f"ns-{i % 12}",
+            "pod": f"pod-{i}",
+            "id": f"/kubepods/burstable/pod{i}",
+        },
+        "value": [round(now, 3), str(float(rng.integers(1_000_000, 900_000_000)))]
+    } for i in range(n_series)]
+    return json.dumps({"status": "success", "data": {"resultType": "vector", "result": result}}).encode()
+
+
+def record(out_dir=RECORD_DIR):
+    """Save the raw body of every METRICS query so later runs replay real responses"""
+    from fetch_live_metrics import METRICS, PROMETHEUS_URL
+    from scrape_pool import get_session
+    os.makedirs(out_dir, exist_ok=True)
+    for label, query in METRICS.items():
+        body = get_session().get(PROMETHEUS_URL, params={"query": query}, timeout=30).content
+        with open(os.path.join(out_dir, f"{label}.json"), "wb") as f:
+            f.write(body)
+        print(f"💾 {label}: {len(body)} bytes")
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy vs vectorized Prometheus decode")
+    parser.add_argument("--responses", default=os.path.join(RECORD_DIR, "*.json"),
+                        help="glob of recorded response bodies")
+    parser.add_argument("--record", action="store_true", help="record fresh responses from Prometheus first")
+    parser.add_argument("--series", type=int, nargs="+", default=[100, 1000, 10000, 50000],
+                        help="synthetic sizes used when no recordings are found")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.record:
+        record()
+
+    bodies = {os.path.basename(p): open(p, "rb").read() for p in sorted(glob.glob(args.responses))}
+    if not bodies:
+        print("ℹ️ No recorded responses found, using synthetic ones")
+        bodies = {f"synthetic-{n}": synthetic_response(n) for n in args.series}
+
+    print(f"{'response':<32} {'series':>7} {'legacy ms':>10} {'vector ms':>10} {'speedup':>8}   (decode only / with JSON parse)")
+    for name, body in bodies.items():
+        data = loads(body)
+        n = len(data["data"]["result"])
+        legacy = best_of(lambda: legacy_parse(data, "value"), args.repeat)
+        fast = best_of(lambda: decode_vector(data, "value"), args.repeat)
+        print(f"{name:<32} {n:>7} {legacy * 1000:>10.2f} {fast * 1000:>10.2f} {legacy / fast:>7.1f}x   decode")
+        # End to end: fetch_metric used response.json(), decode_vector goes through prom_decode.loads
+        legacy = best_of(lambda: legacy_parse(json.loads(body), "value"), args.repeat)
+        fast = best_of(lambda: decode_vector(loads(body), "value"), args.repeat)
+        print(f"{'':<32} {'':>7} {legacy * 1000:>10.2f} {fast * 1000:>10.2f} {legacy / fast:>7.1f}x   parse + decode")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from labeling import rolling_any_above
+
+LEGACY_MAX_ROWS = 200000  # rolling().apply is ~seconds per 100k rows; don't wait minutes for it
+
+
+def legacy_flags(values, threshold, window):
+    """The rolling().apply labeling load_and_preprocess_data used before labeling.py"""
+    return pd.Series(values).rolling(window=window).apply(lambda x: np.any(x > threshold), raw=True).fillna(False)
+
+
+def synthetic(n, n_series, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.gamma(2.0, 0.2, n)
+    values[rng.random(n) < 0.01] = np.nan
+    series = rng.integers(0, n_series, n)
+    return values, series
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy rolling().apply vs vectorized failure labels")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--series", type=int, default=500)
+    parser.add_argument("--window", type=int, default=2)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>11} {'legacy ms':>10} {'vector ms':>10} {'grouped ms':>11} {'ns/row':>7} {'speedup':>8}")
+    for n in args.rows:
+        values, series = synthetic(n, args.series)
+        fast = best_of(lambda: rolling_any_above(values, args.threshold, args.window), args.repeat)
+        grouped = best_of(lambda: rolling_any_above(values, args.threshold, args.window, series), args.repeat)
+        legacy_ms = speedup = "-"
+        if n <= LEGACY_MAX_ROWS:
+            expected = legacy_flags(values, args.threshold, args.window).to_numpy(dtype=bool)
+            if not np.array_equal(expected, rolling_any_above(values, args.threshold, args.window)):
+                raise SystemExit(f"❌ labels differ from rolling().apply at {n} rows")
+            legacy = best_of(lambda: legacy_flags(values, args.threshold, args.window), 1)
+            legacy_ms, speedup = f"{legacy * 1000:.1f}", f"{legacy / fast:.0f}x"
+        print(f"{n:>11} {legacy_ms:>10} {fast * 1000:>10.1f} {grouped * 1000:>11.1f} "
+              f"{fast * 1e9 / n:>7.1f} {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
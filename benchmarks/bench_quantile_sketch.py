@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from quantile_sketch import GAMMA, QuantileSketches
+
+
+def synthetic(n, n_series, seed=0):
+    """Heavy-tailed memory (Pareto), log-normal CPU and mostly-zero restart counts"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "series": rng.integers(0, n_series, n).astype(str),
+        "cpu_usage": rng.lognormal(-2, 1, n),
+        "memory_usage": (rng.pareto(1.5, n) + 1) * 5e7,
+        "container_restarts_avg": rng.poisson(0.2, n).astype(float),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-series p99 from merged sketches vs exact quantiles")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--series", type=int, default=200)
+    parser.add_argument("--parts", type=int, default=8, help="sketch this many slices separately, then merge")
+    parser.add_argument("--q", type=float, default=0.99)
+    args = parser.parse_args()
+
+    df = synthetic(args.rows, args.series)
+
+    start = time.perf_counter()
+    whole = QuantileSketches(path=None).update(df)
+    update_s = time.perf_counter() - start
+    merged = QuantileSketches(path=None)
+    for part in np.array_split(np.arange(len(df)), args.parts):
+        merged.merge(QuantileSketches(path=None).update(df.iloc[part]))
+    same = all(np.array_equal(whole.table(args.q)[0][whole.keys[key]], merged.table(args.q)[0][merged.keys[key]])
+               for key in whole.keys)
+    print(f"{'✅' if same else '❌'} {args.parts} merged partial sketches give the same thresholds as one sketch")
+
+    merged._tables.clear()
+    start = time.perf_counter()
+    merged.table(args.q)
+    table_ms = (time.perf_counter() - start) * 1e3
+    keys = list(merged.keys)
+    start = time.perf_counter()
+    for key in keys * 100:
+        merged.threshold("memory_usage", key, args.q)
+    lookup_us = (time.perf_counter() - start) / (len(keys) * 100) * 1e6
+    print(f"update {args.rows / update_s / 1e6:.1f}M rows/s, quantile table {table_ms:.1f} ms, "
+          f"one series' threshold {lookup_us:.2f} µs")
+
+    exact = df.groupby("series")[list(merged.columns)].quantile(args.q, interpolation="lower")
+    for column in merged.columns:
+        estimate = np.array([merged.threshold(column, key, args.q) for key in exact.index])
+        truth = exact[column].to_numpy()
+        error = np.abs(estimate - truth) / np.where(truth > 0, truth, 1)
+        naive = df.groupby("series")[column].agg(lambda x: x.mean() + 2 * x.std()).reindex(exact.index).to_numpy()
+        naive_error = np.abs(naive - truth) / np.where(truth > 0, truth, 1)
+        status = "✅" if error.max() <= GAMMA - 1 + 1e-9 else "❌"
+        print(f"{status} {column:<24} max relative error {error.max():.4f} (mean + 2*std is off by {np.median(naive_error):.2f} on median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from rolling_features import add_rolling_features
+
+STATS = ("mean", "max", "std", "slope")
+
+
+def synthetic(n_series, samples, step=15, seed=0):
+    """`samples` rows per series at a fixed step, interleaved the way the store returns them"""
+    rng = np.random.default_rng(seed)
+    ts = pd.Timestamp("2026-01-01") + pd.to_timedelta(np.repeat(np.arange(samples) * step, n_series), unit="s")
+    values = rng.gamma(2.0, 0.2, n_series * samples)
+    values[rng.random(len(values)) < 0.01] = np.nan
+    return pd.DataFrame({"timestamp": ts, "series": np.tile(np.arange(n_series), samples).astype(str), "cpu_usage": values})
+
+
+def pandas_grouped(df, window):
+    """The same features with pandas' grouped rolling, for comparison"""
+    indexed = df.set_index("timestamp") if not isinstance(window, int) else df
+    rolling = indexed.groupby("series")["cpu_usage"].rolling(window, min_periods=1)
+    return rolling.mean(), rolling.max(), rolling.std()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grouped rolling features vs pandas groupby().rolling()")
+    parser.add_argument("--series", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--samples", type=int, default=60, help="samples per series")
+    parser.add_argument("--window", default="5", help="row count or time span such as 5min")
+    args = parser.parse_args()
+    window = int(args.window) if args.window.isdigit() else args.window
+
+    print(f"{'series':>7} {'rows':>10} {'pandas s':>9} {'vector s':>9} {'all stats s':>12}")
+    for n_series in args.series:
+        df = synthetic(n_series, args.samples)
+        slow = timed(lambda: pandas_grouped(df, window))
+        fast = timed(lambda: add_rolling_features(df.copy(), ["cpu_usage"], window, stats=("mean", "max", "std")))
+        full = timed(lambda: add_rolling_features(df.copy(), ["cpu_usage"], window, stats=STATS))
+        print(f"{n_series:>7} {len(df):>10} {slow:>9.2f} {fast:>9.2f} {full:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+import metrics_store
+import rollups
+
+
+def synthetic(n_series, days, step=15, seed=0):
+    """`days` of samples every `step` seconds for `n_series` pods"""
+    rng = np.random.default_rng(seed)
+    stamps = pd.date_range("2026-01-01", periods=int(days * 86400 / step), freq=f"{step}s")
+    n = len(stamps) * n_series
+    return pd.DataFrame({
+        "timestamp": stamps.repeat(n_series),
+        "namespace": "default",
+        "pod": np.tile([f"pod-{i}" for i in range(n_series)], len(stamps)),
+        "cpu_usage": rng.gamma(2.0, 0.2, n),
+        "memory_usage": rng.pareto(1.5, n) * 1e8,
+    })
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raw store scans vs rollup queries over a long window")
+    parser.add_argument("--series", type=int, default=20)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--appends-per-hour", type=int, default=1, help="append batches per hour, like scrape cycles")
+    parser.add_argument("--tmp", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    df = synthetic(args.series, args.days)
+    root = tempfile.mkdtemp(dir=args.tmp)
+    store_dir, rollup_dir = os.path.join(root, "store"), os.path.join(root, "rollups")
+    batches = df.groupby(df["timestamp"].dt.floor(f"{60 // args.appends_per_hour}min"), sort=True)
+    _, append_s = timed(lambda: [metrics_store.append(part, store_dir) for _, part in batches])
+    _, rollup_s = timed(lambda: [rollups.append(part, rollup_dir) for _, part in batches])
+    _, compact_s = timed(lambda: [rollups.compact(r, rollup_dir) for r in rollups.RESOLUTIONS])
+    print(f"{len(df)} raw rows: store append {append_s:.1f}s, rollup append {rollup_s:.1f}s, compaction {compact_s:.1f}s")
+
+    raw, raw_s = timed(lambda: metrics_store.read(store_dir, columns=["cpu_usage"]))
+    print(f"{'raw scan':>12}: {len(raw):>9} rows in {raw_s * 1e3:8.1f} ms")
+    start, end = df["timestamp"].min(), df["timestamp"].max() + pd.Timedelta("1s")
+    for precision in rollups.RESOLUTIONS:
+        (rolled, resolution), query_s = timed(lambda: rollups.query(start, end, precision=precision, columns=["cpu_usage"],
+                                                                    rollup_dir=rollup_dir, store_dir=store_dir))
+        exact = df.groupby([df["timestamp"].dt.floor(resolution), "pod"])["cpu_usage"].mean().to_numpy()
+        same = np.allclose(np.sort(rolled["cpu_usage_mean"].to_numpy()), np.sort(exact))
+        print(f"{resolution:>12}: {len(rolled):>9} rows in {query_s * 1e3:8.1f} ms "
+              f"({len(raw) / max(len(rolled), 1):.0f}x fewer rows, means {'✅ exact' if same else '❌ differ'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src")
+sys.path.append(SRC)
+
+METRICS = ("cpu_usage", "memory_usage", "network_rx", "network_tx", "filesystem_usage", "container_restarts_avg")
+
+# Each pipeline runs in its own interpreter so its peak RSS is its own. The steps are the ones
+# server.py (preprocess_data + impute_data) and train_model_live.py (up to X/y) run; server.py
+# itself needs a cluster to import.
+PRELUDE = """
+import sys, time, numpy as np, pandas as pd, pyarrow.parquet as pq
+sys.path.append({src!r})
+from labeling import FIXED_THRESHOLDS, label_failures
+from rolling_features import add_rolling_features
+from stream_features import _rss_bytes
+started = time.perf_counter()
+"""
+LEGACY = PRELUDE + """
+from sklearn.impute import SimpleImputer
+df = pq.read_table({input!r}).to_pandas()
+loaded = df.memory_usage(deep=True).sum()
+df = df.copy()
+df.columns = df.columns.str.strip().str.replace(r'\\s+', '_', regex=True).str.lower()
+df["timestamp"] = pd.to_datetime(df["timestamp"])
+df.set_index("timestamp", inplace=True)
+numeric_cols = df.select_dtypes(include=[np.number]).columns
+add_rolling_features(df, [col for col in numeric_cols if f"{{col}}_avg" not in df.columns])
+label_failures(df, FIXED_THRESHOLDS, group_by="series")
+df = df.select_dtypes(include=[np.number])
+imputer = SimpleImputer(strategy="mean")
+df_imputed = pd.DataFrame(imputer.fit_transform(df), columns=df.columns)
+X = df_imputed.drop(columns=["target"])
+y = df_imputed["target"]
+"""
+TYPED = PRELUDE + """
+from schema import apply_schema, feature_matrix, numeric_columns
+df = apply_schema(pq.read_table({input!r}).to_pandas(strings_to_categorical=True))
+loaded = df.memory_usage(deep=True).sum()
+df = apply_schema(df.copy(deep=False))
+df.set_index("timestamp", inplace=True)
+numeric_cols = numeric_columns(df)
+add_rolling_features(df, [col for col in numeric_cols if f"{{col}}_avg" not in df.columns])
+label_failures(df, FIXED_THRESHOLDS, group_by="series")
+df_imputed = feature_matrix(df).reset_index(drop=True)
+X = df_imputed.drop(columns=["target"])
+y = df_imputed["target"]
+"""
+REPORT = """
+print(time.perf_counter() - started, loaded // 2**20, _rss_bytes('VmHWM') // 2**20, X.memory_usage(deep=True).sum() // 2**20)
+np.save({out!r}, X.to_numpy(dtype=np.float64)[::max(len(X) // 100000, 1)])
+"""
+
+
+def synthetic(n, n_series=2000, seed=0):
+    """`n` rows of the live metrics layout: string labels repeated on every row, float64 metrics"""
+    rng = np.random.default_rng(seed)
+    per_series = n // n_series
+    series = np.tile(np.arange(n_series), per_series)
+    df = pd.DataFrame({
+        "timestamp": np.repeat(pd.date_range("2026-01-01", periods=per_series, freq="15s"), n_series),
+        "namespace": np.array(["default", "kube-system", "monitoring"])[series % 3],
+        "pod": np.char.add("pod-", series.astype(str)),
+        "container": np.char.add("c-", (series % 7).astype(str)),
+        "instance": "192.168.49.2:10250",
+    })
+    df["series"] = df["namespace"] + "/" + df["pod"] + "/" + df["container"] + "@" + df["instance"]
+    for metric in METRICS:
+        values = rng.gamma(2.0, 0.2, len(df))
+        values[rng.random(len(df)) < 0.01] = np.nan
+        df[metric] = values * (1e8 if metric == "memory_usage" else 1)
+    return df
+
+
+def run(template, **kwargs):
+    # The system allocator hands freed Arrow buffers back, so RSS reflects the pandas frames
+    env = dict(os.environ, ARROW_DEFAULT_MEMORY_POOL="system")
+    result = subprocess.run([sys.executable, "-c", (template + REPORT).format(src=SRC, **kwargs)],
+                            capture_output=True, text=True, env=env)
+    if result.returncode:
+        raise SystemExit(f"❌ {result.stderr.strip()}")
+    seconds, loaded, peak, features = result.stdout.split()
+    return float(seconds), int(loaded), int(peak), int(features)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy float64/object frames vs the compact schema (schema.py)")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--series", type=int, default=2000)
+    parser.add_argument("--tmp", default="/tmp")
+    args = parser.parse_args()
+
+    path = os.path.join(args.tmp, f"schema_bench_{args.rows}.parquet")
+    if not os.path.exists(path):
+        synthetic(args.rows, args.series).to_parquet(path, index=False)
+
+    results = {}
+    for name, template in (("legacy", LEGACY), ("typed", TYPED)):
+        out = os.path.join(args.tmp, f"schema_bench_{name}.npy")
+        results[name] = run(template, input=path, out=out)
+        seconds, loaded, peak, features = results[name]
+        print(f"{name:>7}: {seconds:6.1f}s ({args.rows / seconds / 1e6:.2f}M rows/s), loaded frame {loaded} MB, "
+              f"peak RSS {peak} MB, feature matrix {features} MB")
+
+    legacy, typed = (np.load(os.path.join(args.tmp, f"schema_bench_{n}.npy")) for n in ("legacy", "typed"))
+    close = legacy.shape == typed.shape and np.allclose(legacy, typed, rtol=1e-6, atol=1e-6)
+    print(f"{'✅' if close else '❌'} features match to float32 precision; "
+          f"loaded frame {results['legacy'][1] / max(results['typed'][1], 1):.1f}x smaller, "
+          f"peak RSS {results['legacy'][2] / results['typed'][2]:.1f}x lower, "
+          f"{results['legacy'][0] / results['typed'][0]:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src")
+sys.path.append(SRC)
+
+# Each mode runs in its own interpreter so its peak RSS is its own. In memory is the way
+# train_model_live.label_data reads and labels a CSV.
+FULL = """
+import sys
+sys.path.append({src!r})
+from schema import read_csv
+from stream_features import _rss_bytes, compute_features
+df = compute_features(read_csv({input!r}), window={window!r})
+df.to_parquet({out!r}, index=False)
+print(_rss_bytes('VmHWM') // 2**20)
+"""
+STREAMED = """
+import sys
+sys.path.append({src!r})
+from stream_features import _rss_bytes, csv_chunks, stream_features
+stream_features(csv_chunks({input!r}), {out!r}, window={window!r}, max_memory_mb={budget})
+print(_rss_bytes('VmHWM') // 2**20)
+"""
+
+
+def run(template, **kwargs):
+    result = subprocess.run([sys.executable, "-c", template.format(src=SRC, **kwargs)],
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise SystemExit(f"❌ {result.stderr.strip()}")
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS and parity of chunked vs in-memory feature computation")
+    parser.add_argument("input", help="CSV export to process (e.g. data/k8s_history_metrics.csv)")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[300, 600], help="max memory in MB")
+    parser.add_argument("--window", default="5")
+    parser.add_argument("--tmp", default="/tmp")
+    args = parser.parse_args()
+    window = int(args.window) if args.window.isdigit() else args.window
+
+    full_path = os.path.join(args.tmp, "features_full.parquet")
+    full_rss = run(FULL, input=args.input, out=full_path, window=window)
+    full = pd.read_parquet(full_path)
+    print(f"in-memory: peak RSS {full_rss} MB, {len(full)} rows")
+
+    for budget in args.budgets:
+        out = os.path.join(args.tmp, f"features_{budget}.parquet")
+        rss = run(STREAMED, input=args.input, out=out, window=window, budget=budget)
+        streamed = pd.read_parquet(out)
+        numeric = full.select_dtypes(include=[np.number]).columns
+        same_labels = (full["target"].to_numpy() == streamed["target"].to_numpy()).all()
+        # Rolling sums start over in every chunk, so float32 averages may differ in the last bit
+        close = np.allclose(full[numeric].to_numpy(dtype=np.float64), streamed[numeric].to_numpy(dtype=np.float64),
+                            rtol=1e-6, atol=1e-9, equal_nan=True)
+        status = "✅" if len(full) == len(streamed) and same_labels and close else "❌"
+        print(f"{status} budget {budget} MB: peak RSS {rss} MB, labels identical: {same_labels}, features match: {close}")
+
+
+if __name__ == "__main__":
+    main()
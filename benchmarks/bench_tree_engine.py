@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from xgboost import DMatrix
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from train_model_live import make_models
+from tree_engine import NATIVE_MIN_ROWS, compile_model
+
+FEATURES = ("cpu_usage", "memory_usage", "network_rx", "network_tx", "filesystem_usage", "container_restarts_avg",
+            "cpu_usage_avg", "memory_usage_avg", "container_restarts_avg_avg")
+
+
+def synthetic(n, features=FEATURES, seed=0):
+    """Feature rows like the training matrix, with a few missing values and a nonlinear failure rule"""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.gamma(2.0, 0.2, (n, len(features))).astype(np.float32), columns=list(features))
+    y = ((X.iloc[:, 0] + X.iloc[:, -2] * X.iloc[:, -1] + rng.normal(0, 0.1, n)) > 0.6).astype(int)
+    if "memory_usage" in X.columns:
+        X["memory_usage"] *= np.float32(1e8)
+    X.iloc[rng.random(n) < 0.01, X.shape[1] // 2] = np.nan
+    return X, y
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def flat(fn, X):
+    """fn over X in batches small enough to stay on the engine's flat arrays"""
+    rows = min(NATIVE_MIN_ROWS.values()) - 1
+    return np.concatenate([fn(X.iloc[i:i + rows]) for i in range(0, len(X), rows)])
+
+
+def parity(name, model, engine, X):
+    """
+    Labels must be identical (the flat arrays are checked: large batches would go to the model). Forest probabilities are compared bit for bit; for XGBoost the
+    margins are, and the probabilities may differ by a float32 step or two (its own expf).
+    """
+    labels = int((model.predict(X) != flat(engine.predict, X)).sum())
+    proba, flat_proba = model.predict_proba(X)[:, 1], flat(engine.predict_proba, X)[:, 1]
+    steps = np.abs(proba.astype(np.float64) - flat_proba) / np.spacing(proba.astype(np.float32)).astype(np.float64)
+    line = f"{name}: {labels} label mismatches in {len(X)} rows, {int((proba != flat_proba).sum())} probabilities differ"
+    ok = labels == 0
+    if hasattr(model, "get_booster"):
+        margins = int((model.get_booster().predict(DMatrix(X), output_margin=True)
+                       != engine._scores(engine._matrix(X))).sum())
+        line += f" (max {steps.max():.0f} float32 step), {margins} margins differ"
+        ok &= margins == 0 and steps.max() <= 2
+    else:
+        ok &= not (proba != flat_proba).any()
+    print(f"{'✅' if ok else '❌'} {line}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flattened tree engine vs sklearn/XGBoost predict: parity and latency")
+    parser.add_argument("--rows", type=int, default=50_000, help="training and scoring rows")
+    parser.add_argument("--model", help="also check a saved model (e.g. models/k8s_failure_model_live.pkl)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    X, y = synthetic(args.rows)
+    rf, xgb = make_models(n_jobs=1)
+    models = {"random forest": rf.fit(X, y), "xgboost": xgb.fit(X, y)}
+    if args.model:
+        models[os.path.basename(args.model)] = joblib.load(args.model)
+
+    ok = True
+    for name, model in models.items():
+        engine = compile_model(model)
+        scored = X if engine.features == list(X.columns) else synthetic(args.rows, engine.features)[0]
+        ok &= parity(name, model, engine, scored)
+        # A saved model file is a scoring pipeline: its transform is the float32 matrix the engine scores
+        row, matrix = scored.iloc[:1], engine.transform(scored) if hasattr(engine, "transform") else engine._matrix(scored)
+        one_model = best_of(lambda: model.predict(row), args.repeat)
+        one_flat = best_of(lambda: engine.predict(row), args.repeat)
+        one_array = best_of(lambda: engine.predict(matrix[:1]), args.repeat)
+        batch_model = best_of(lambda: model.predict(scored), 3)
+        batch_engine = best_of(lambda: engine.predict(matrix), 3)
+        print(f"   one row: predict {one_model * 1e6:8.0f} us, engine {one_flat * 1e6:6.0f} us "
+              f"({one_array * 1e6:.0f} us from an array, {one_model / one_array:.0f}x)")
+        line = (f"   {len(scored)} rows: predict {len(scored) / batch_model / 1e6:.2f}M rows/s, "
+                f"engine {len(scored) / batch_engine / 1e6:.2f}M rows/s")
+        if hasattr(engine, "flat_proba"):
+            batch_flat = best_of(lambda: engine.flat_proba(matrix), 3)
+            line += f" (flat arrays alone {len(scored) / batch_flat / 1e6:.2f}M rows/s)"
+        print(line)
+        # Where the engine hands batches to the model: its rows/s on either side of the crossover
+        for rows in (64, 256, 1024, 4096):
+            part = matrix[:rows]
+            native = best_of(lambda: model.predict(scored.iloc[:rows]), 5)
+            routed = best_of(lambda: engine.predict(part), 5)
+            print(f"   {rows:>5} rows: predict {native * 1e3:7.2f} ms, engine {routed * 1e3:7.2f} ms")
+    if not ok:
+        raise SystemExit("❌ The engine does not match the models")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+import pandas as pd
+from fetch_live_metrics import METRICS, PROMETHEUS_RANGE_URL
+from scrape_pool import fetch_query, make_session
+from series_align import align
+from prom_decode import decode_matrix
+
+BACKFILL_DIR = os.path.join(os.path.dirname(__file__), "../data/backfill")
+HISTORY_CSV = os.path.join(os.path.dirname(__file__), "../data/k8s_history_metrics.csv")
+
+# Prometheus refuses range queries returning more than 11000 points per series
+POINTS_PER_CHUNK = 10000
+
+
+def parse_time(value):
+    """Accept epoch seconds or an ISO-8601 string (UTC when no offset is given)"""
+    try:
+        return int(float(value))
+    except ValueError:
+        ts = pd.Timestamp(value)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize("UTC")
+        return int(ts.timestamp())
+
+
+def plan_chunks(start, end, step, points_per_chunk=POINTS_PER_CHUNK):
+    """
+    Split [start, end] into inclusive (chunk_start, chunk_end) windows of at most
+    `points_per_chunk` samples. Boundaries are aligned to `step` so re-running with
+    the same arguments produces the same chunk names (which is what makes resume work).
+    """
+    start = start - start % step
+    span = step * points_per_chunk
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + span - step, end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start += span
+    return chunks
+
+
+def chunk_path(out_dir, label, chunk_start):
+    return os.path.join(out_dir, label, f"{chunk_start}.csv")
+
+
+def parse_matrix(data, label):
+    """Flatten a query_range matrix response to timestamp/<series labels>/<label> rows"""
+    df = decode_matrix(data, label)
+    if df.empty:
+        # Keep the header so an empty chunk still counts as done on resume
+        return pd.DataFrame(columns=["timestamp", label])
+    return df
+
+
+def fetch_chunk(session, url, label, query, chunk, step, out_dir, timeout):
+    """Fetch one chunk and write it straight to disk. Nothing is kept in memory afterwards."""
+    chunk_start, chunk_end = chunk
+    data, elapsed, error = fetch_query(
+        url, query, session=session, timeout=timeout,
+        params={"start": chunk_start, "end": chunk_end, "step": step}
+    )
+    if error is not None:
+        return label, chunk, 0, elapsed, error
+
+    df = parse_matrix(data, label)
+    path = chunk_path(out_dir, label, chunk_start)
+    tmp_path = path + ".tmp"
+    df.to_csv(tmp_path, index=False)
+    # The rename is atomic, so a chunk file only ever exists once it is complete
+    os.replace(tmp_path, path)
+    return label, chunk, len(df), elapsed, None
+
+
+def backfill(start, end, step=60, metrics=METRICS, url=PROMETHEUS_RANGE_URL, out_dir=BACKFILL_DIR,
+             workers=8, timeout=60, points_per_chunk=POINTS_PER_CHUNK):
+    chunks = plan_chunks(start, end, step, points_per_chunk)
+    pending = []
+    for label in metrics:
+        os.makedirs(os.path.join(out_dir, label), exist_ok=True)
+        for chunk in chunks:
+            if not os.path.exists(chunk_path(out_dir, label, chunk[0])):
+                pending.append((label, chunk))
+
+    total = len(chunks) * len(metrics)
+    print(f"📦 {total} chunks planned, {total - len(pending)} already on disk, {len(pending)} to fetch")
+    if not pending:
+        return []
+
+    session = make_session(pool_size=workers)
+    failed = []
+    rows = 0
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(fetch_chunk, session, url, label, metrics[label], chunk, step, out_dir, timeout)
+            for label, chunk in pending
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            label, chunk, n_rows, elapsed, error = future.result()
+            if error is not None:
+                failed.append((label, chunk))
+                print(f"❌ {label} chunk {chunk[0]} failed after {elapsed:.1f}s: {error}")
+                continue
+            rows += n_rows
+            print(f"✅ [{done}/{len(pending)}] {label} chunk {chunk[0]}: {n_rows} rows in {elapsed:.1f}s")
+
+    print(f"🏁 Backfill wrote {rows} rows in {time.perf_counter() - begin:.1f}s ({len(failed)} chunks failed, re-run to resume)")
+    return failed
+
+
+def load_backfill(out_dir=BACKFILL_DIR, metrics=METRICS):
+    """Combine the per-metric chunk files into one wide frame, one row per series and timestamp"""
+    frames = {}
+    for label in metrics:
+        label_dir = os.path.join(out_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        files = sorted(f for f in os.listdir(label_dir) if f.endswith(".csv"))
+        parts = [pd.read_csv(os.path.join(label_dir, f), parse_dates=["timestamp"]) for f in files]
+        parts = [p for p in parts if not p.empty]
+        if parts:
+            frames[label] = pd.concat(parts, ignore_index=True)
+    return align(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill Prometheus history with query_range")
+    parser.add_argument("--days", type=float, default=14, help="how far back to go when --start is not given")
+    parser.add_argument("--start", help="epoch seconds or ISO time")
+    parser.add_argument("--end", help="epoch seconds or ISO time (default: now)")
+    parser.add_argument("--step", type=int, default=60, help="resolution in seconds")
+    parser.add_argument("--points-per-chunk", type=int, default=POINTS_PER_CHUNK)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--url", default=PROMETHEUS_RANGE_URL)
+    parser.add_argument("--out", default=BACKFILL_DIR)
+    parser.add_argument("--combine", nargs="?", const=HISTORY_CSV,
+                        help=f"also write one wide CSV for training (default {HISTORY_CSV})")
+    args = parser.parse_args()
+
+    end = parse_time(args.end) if args.end else int(datetime.now(timezone.utc).timestamp())
+    start = parse_time(args.start) if args.start else int(end - args.days * 86400)
+    print(f"⏳ Backfilling {datetime.fromtimestamp(start, tz=timezone.utc)} → {datetime.fromtimestamp(end, tz=timezone.utc)} every {args.step}s")
+
+    backfill(start, end, step=args.step, url=args.url, out_dir=args.out, workers=args.workers,
+             timeout=args.timeout, points_per_chunk=args.points_per_chunk)
+
+    if args.combine:
+        wide = load_backfill(args.out)
+        wide.to_csv(args.combine, index=False)
+        print(f"✅ Saved {len(wide)} rows of history to {args.combine}")
+
+
+if __name__ == "__main__":
+    main()
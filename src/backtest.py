@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.metrics import precision_score, recall_score
+import metrics_store
+from labeling import FAILURE_SOURCES
+from series_align import series_key
+from train_model_live import MODELS_DIR, label_data, load_data, make_models, resample
+
+# Rolling-origin backtest: the data is cut into N_FOLDS + 1 consecutive time slices and fold k
+# trains on the slices before slice k + 1 (all of them, or the last --train-window) and tests on it
+BACKTEST_REPORT_PATH = os.path.join(MODELS_DIR, "backtest_report.json")
+N_FOLDS = 5
+HORIZON = "5min"  # the models predict whether a series is failing this long after a sample
+LEAD_LOOKBACK = "30min"  # alerts this long before a failure starts count as predicting it
+VARIANTS = ("rf", "xgb", "ensemble")
+
+
+def horizon_target(failures, series, times, horizon=HORIZON):
+    """
+    The target shifted forward by `horizon`: each row gets the failure label of its series'
+    last sample at or before row time + horizon, so the models learn to warn ahead instead
+    of recognising a failure in progress. -1 where the series' data ends before that time.
+    """
+    horizon = pd.Timedelta(horizon).value
+    order = np.lexsort((times, series))
+    failures, series, times = failures[order], series[order], times[order]
+    boundaries = np.r_[0, np.flatnonzero(series[1:] != series[:-1]) + 1, len(series)]
+    target = np.full(len(times), -1, dtype=np.int8)
+    for first, last in zip(boundaries[:-1], boundaries[1:]):
+        ahead = times[first:last] + horizon
+        at = first + np.searchsorted(times[first:last], ahead, side="right") - 1
+        known = ahead <= times[last - 1]
+        target[first:last][known] = failures[at[known]]
+    shifted = np.empty_like(target)
+    shifted[order] = target
+    return shifted
+
+
+def share(X, y, failures, series, directory):
+    """
+    Write the time-ordered feature matrix (with its NaNs: each fold imputes from its own
+    training rows), horizon labels, current failures, series codes and timestamps as .npy
+    files that fold workers memory-map, so the matrix is never pickled or copied per process.
+    """
+    times = np.asarray(X.index, dtype="datetime64[ns]").view("int64")
+    order = np.argsort(times, kind="stable")
+    matrix = np.lib.format.open_memmap(os.path.join(directory, "X.npy"), mode="w+",
+                                       dtype=X.dtypes.iloc[0], shape=X.shape)
+    for j in range(X.shape[1]):
+        matrix[:, j] = X.iloc[:, j].to_numpy()[order]
+    matrix.flush()
+    del matrix
+    np.save(os.path.join(directory, "y.npy"), np.asarray(y, dtype=np.int8)[order])
+    np.save(os.path.join(directory, "failures.npy"), np.asarray(failures, dtype=np.int8)[order])
+    np.save(os.path.join(directory, "series.npy"), np.asarray(series)[order])
+    np.save(os.path.join(directory, "times.npy"), times[order])
+    return times[order]
+
+
+def load_shared(directory):
+    return tuple(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                 for name in ("X", "y", "failures", "series", "times"))
+
+
+def make_folds(times, n_folds=N_FOLDS, train_window=None):
+    """(train start, origin, test end) row positions of every fold over the sorted `times`"""
+    edges = np.linspace(times[0], times[-1] + 1, n_folds + 2).astype(np.int64)
+    positions = np.searchsorted(times, edges)
+    folds = []
+    for k in range(1, n_folds + 1):
+        origin, end = positions[k], positions[k + 1]
+        if origin >= end:
+            continue
+        start = 0
+        if train_window is not None:
+            start = np.searchsorted(times, times[origin] - pd.Timedelta(train_window).value)
+        if start < origin:
+            folds.append((int(start), int(origin), int(end)))
+    return folds
+
+
+def lead_times(y_true, y_pred, series, times, lookback=LEAD_LOOKBACK):
+    """
+    Seconds between the first alert and the start of every failure episode (a series going
+    from 0 to 1), looking back `lookback` but not into the series' previous episode; NaN for
+    episodes without an alert in that time.
+    """
+    lookback = pd.Timedelta(lookback).value
+    order = np.lexsort((times, series))
+    y_true, y_pred, series, times = y_true[order], y_pred[order], series[order], times[order]
+    same_series = np.r_[False, series[1:] == series[:-1]]
+    onsets = np.flatnonzero(same_series & (y_true == 1) & (np.r_[0, y_true[:-1]] == 0))
+    leads = np.full(len(onsets), np.nan)
+    series_start = np.searchsorted(series, series[onsets])
+    last_failure = np.maximum.accumulate(np.where(y_true == 1, np.arange(len(y_true)), -1))
+    for i, (onset, first) in enumerate(zip(onsets, series_start)):
+        first = max(first, last_failure[onset - 1] + 1)
+        window_start = first + np.searchsorted(times[first:onset + 1], times[onset] - lookback)
+        alerts = np.flatnonzero(y_pred[window_start:onset + 1])
+        if len(alerts):
+            leads[i] = (times[onset] - times[window_start + alerts[0]]) / 1e9
+    return leads
+
+
+def scores(y_true, y_pred, failures, series, times, lookback):
+    """Precision and recall against the horizon labels; lead times before the actual failures"""
+    leads = lead_times(failures, y_pred, series, times, lookback)
+    detected = leads[~np.isnan(leads)]
+    return {
+        "precision": precision_score(y_true, y_pred, zero_division=0),
+        "recall": recall_score(y_true, y_pred, zero_division=0),
+        "episodes": int(len(leads)),
+        "episodes_alerted": int(len(detected)),
+        "median_lead_seconds": float(np.median(detected)) if len(detected) else None,
+    }
+
+
+def run_fold(directory, features, fold, n_jobs=1, lookback=LEAD_LOOKBACK, horizon=HORIZON):
+    """Train every variant on one fold's past and score it on its future; runs in a worker process"""
+    X, y, failures, series, times = load_shared(directory)
+    start, origin, end = fold
+    # Training rows whose label lies `horizon` ahead, past the origin, would see the test period
+    origin_train = int(np.searchsorted(times, times[origin] - pd.Timedelta(horizon).value))
+    # Views of the memory-mapped matrix: only the pages of this fold's rows are read
+    X_train = pd.DataFrame(X[start:origin_train], columns=features, copy=False)
+    y_train = pd.Series(y[start:origin_train], name="target")
+    X_test = pd.DataFrame(X[origin:end], columns=features, copy=False)
+    y_test = np.asarray(y[origin:end])
+    result = {
+        "train_from": str(pd.Timestamp(times[start])), "origin": str(pd.Timestamp(times[origin])),
+        "test_until": str(pd.Timestamp(times[end - 1])), "train_rows": origin_train - start, "test_rows": end - origin,
+    }
+    if len(y_train) == 0 or y_train.nunique() < 2:
+        result["skipped"] = "training data has a single class"
+        return result
+
+    # Missing values get the means of this fold's training rows only, never of its future
+    imputer = SimpleImputer(strategy="mean").set_output(transform="pandas").fit(X_train)
+    X_train, X_test = imputer.transform(X_train), imputer.transform(X_test)
+    X_train, y_train = resample(X_train, y_train, n_jobs)
+    predictions, train_seconds, infer_seconds = {}, {}, {}
+    for name, model in zip(("rf", "xgb"), make_models(n_jobs)):
+        started = time.perf_counter()
+        model.fit(X_train, y_train)
+        train_seconds[name] = time.perf_counter() - started
+        started = time.perf_counter()
+        predictions[name] = model.predict(X_test).astype(int)
+        infer_seconds[name] = time.perf_counter() - started
+    predictions["ensemble"] = (predictions["rf"] + predictions["xgb"]) // 2
+    train_seconds["ensemble"] = train_seconds["rf"] + train_seconds["xgb"]
+    infer_seconds["ensemble"] = infer_seconds["rf"] + infer_seconds["xgb"]
+
+    test_failures = np.asarray(failures[origin:end])
+    test_series, test_times = np.asarray(series[origin:end]), np.asarray(times[origin:end])
+    for name in VARIANTS:
+        result[name] = {
+            **scores(y_test, predictions[name], test_failures, test_series, test_times, lookback),
+            "train_seconds": train_seconds[name],
+            "infer_seconds": infer_seconds[name],
+            "infer_rows_per_second": (end - origin) / max(infer_seconds[name], 1e-9),
+        }
+    return result
+
+
+def summary(results):
+    """One row per variant: the mean of every score over the folds that ran"""
+    rows = {}
+    for name in VARIANTS:
+        folds = pd.DataFrame([r[name] for r in results if name in r])
+        if not folds.empty:
+            rows[name] = folds.drop(columns=["episodes", "episodes_alerted"]).mean(numeric_only=True)
+            rows[name]["alerted"] = folds["episodes_alerted"].sum() / max(folds["episodes"].sum(), 1)
+    return pd.DataFrame(rows).T
+
+
+def backtest(csv_path=metrics_store.CSV_PATH, store_dir=metrics_store.STORE_DIR, precision=None, window="30D",
+             n_folds=N_FOLDS, train_window=None, workers=None, n_jobs=-1, lookback=LEAD_LOOKBACK,
+             report_path=BACKTEST_REPORT_PATH, tmp_dir=None, horizon=HORIZON):
+    """
+    The models predict whether a series fails within `horizon`. The failure flags the target
+    is made of are not features (they would give the answer away), and nothing is imputed
+    before the folds are cut.
+    """
+    started = time.perf_counter()
+    df = load_data(csv_path, store_dir, precision, window)
+    series = df["series"] if "series" in df.columns else series_key(df)[0]
+    series, _ = pd.factorize(series)
+    X, failures = label_data(df, impute=False)
+    del df
+    X = X.drop(columns=[flag for flag in FAILURE_SOURCES if flag in X.columns])
+    failures = failures.to_numpy(dtype=np.int8)
+    times = np.asarray(X.index, dtype="datetime64[ns]").view("int64")
+    y = horizon_target(failures, series, times, horizon)
+    labelled = y >= 0
+    X, y, failures, series = X[labelled], y[labelled], failures[labelled], series[labelled]
+
+    total = (os.cpu_count() or 1) if n_jobs in (None, -1) else n_jobs
+    workers = workers or min(n_folds, total)
+    threads = max(1, total // workers)  # each fold fits with this many threads
+
+    directory = tempfile.mkdtemp(prefix="backtest-", dir=tmp_dir)
+    try:
+        times = share(X, y, failures, series, directory)
+        features = list(X.columns)
+        folds = make_folds(times, n_folds, train_window)
+        del X, y
+        if not folds:
+            raise SystemExit("❌ Not enough data for a single fold")
+        print(f"🧪 {len(folds)} rolling-origin folds on {workers} worker(s) with {threads} thread(s) each")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_fold, directory, features, fold, threads, lookback, horizon)
+                       for fold in folds]
+            results = [future.result() for future in futures]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    for k, result in enumerate(results, 1):
+        print(f"  fold {k}: train {result['train_rows']} rows from {result['train_from']}, "
+              f"test {result['test_rows']} rows from {result['origin']}"
+              + (f" ⚠️ skipped, {result['skipped']}" if "skipped" in result else ""))
+    table = summary(results)
+    print("\n📊 Mean over folds:\n", table.to_string(float_format=lambda v: f"{v:.3f}"))
+
+    report = {
+        "data": {"csv": csv_path, "store": store_dir, "precision": precision},
+        "folds": results,
+        "summary": table.to_dict(orient="index"),
+        "horizon": horizon,
+        "lead_lookback": lookback,
+        "train_window": train_window,
+        "workers": workers,
+        "threads_per_worker": threads,
+        "total_seconds": time.perf_counter() - started,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2, default=float)
+    print(f"🧾 Backtest report written to {report_path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the RF, XGBoost and ensemble failure models")
+    parser.add_argument("--csv", default=metrics_store.CSV_PATH, help="CSV snapshot used while the store is empty")
+    parser.add_argument("--store", default=metrics_store.STORE_DIR, help="metrics store directory")
+    parser.add_argument("--precision", help="backtest on rollup bucket means of this size (e.g. 5min)")
+    parser.add_argument("--window", default="30D", help="with --precision: how far back to read")
+    parser.add_argument("--folds", type=int, default=N_FOLDS)
+    parser.add_argument("--train-window", help="train on this much history before each origin (default: all of it)")
+    parser.add_argument("--horizon", default=HORIZON, help="how far ahead the models predict a failure")
+    parser.add_argument("--lookback", default=LEAD_LOOKBACK, help="how long before a failure an alert counts")
+    parser.add_argument("--workers", type=int, help="folds run at the same time (default: one per core)")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="cores to use in total (-1: all)")
+    parser.add_argument("--report", default=BACKTEST_REPORT_PATH)
+    parser.add_argument("--tmp", help="directory for the memory-mapped fold data")
+    args = parser.parse_args()
+
+    backtest(args.csv, args.store, args.precision, args.window, args.folds, args.train_window, args.workers,
+             args.n_jobs, args.lookback, args.report, args.tmp, args.horizon)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import io
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from prom_decode import loads
+from scoring_pipeline import SchemaError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Request bodies the batch /predict endpoints accept, by Content-Type
+FORMATS = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.arrow.file": "arrow",
+}
+MAX_BATCH_ROWS = 200_000  # larger batches are refused (split them), so one request cannot hold a worker for long
+
+
+class UnsupportedFormat(ValueError):
+    """A Content-Type the endpoints do not decode (HTTP 415)"""
+
+
+class InvalidBatch(ValueError):
+    """A body that does not decode into feature rows (HTTP 400)"""
+
+
+def body_format(content_type):
+    """"json", "ndjson" or "arrow" for a Content-Type header (parameters like charset are ignored)"""
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type not in FORMATS:
+        raise UnsupportedFormat(f"❌ Unsupported Content-Type {media_type!r}, expected one of {', '.join(FORMATS)}")
+    return FORMATS[media_type]
+
+
+def _require(names, present, where):
+    missing = [name for name in names if name not in present]
+    if missing:
+        raise SchemaError(f"❌ {where} without feature(s) {', '.join(missing)}; the model needs {', '.join(names)}")
+
+
+def _from_rows(rows, features):
+    """Rows that are all objects (feature -> value) or all arrays in `features` order"""
+    if not rows:
+        return np.empty((0, len(features)), dtype=np.float32)
+    if isinstance(rows[0], dict):
+        names = [str(f) for f in features]
+        for i, row in enumerate(rows):
+            if len(row.keys() & names) < len(names):
+                _require(names, row, f"Row {i}")
+        return np.array([[row[name] for name in names] for row in rows], dtype=np.float32)
+    X = np.array(rows, dtype=np.float32)
+    if X.ndim != 2 or X.shape[1] != len(features):
+        raise SchemaError(f"❌ Array rows must have the {len(features)} features in order: "
+                          f"{', '.join(map(str, features))}")
+    return X
+
+
+def _from_columns(columns, features):
+    """feature -> values: one column after the other into the matrix"""
+    names = [str(f) for f in features]
+    _require(names, columns, "Columns")
+    lengths = {len(columns[name]) for name in names}
+    if len(lengths) > 1:
+        raise InvalidBatch("❌ All columns must have the same number of values")
+    X = np.empty((lengths.pop() if lengths else 0, len(features)), dtype=np.float32)
+    for j, name in enumerate(names):
+        X[:, j] = columns[name]
+    return X
+
+
+def _from_arrow(body, features):
+    reader = pa.ipc.open_stream(body) if body[:6] != b"ARROW1" else pa.ipc.open_file(body)
+    table = reader.read_all()
+    names = [str(f) for f in features]
+    _require(names, table.column_names, "Arrow table")
+    X = np.empty((table.num_rows, len(features)), dtype=np.float32)
+    for j, name in enumerate(names):
+        # Cast in Arrow (nulls become NaN) and copied once, into the matrix column
+        X[:, j] = pc.cast(table.column(name), pa.float32()).to_numpy()
+    return X
+
+
+def decode_batch(body, content_type, features):
+    """
+    A batch request body -> one C-contiguous float32 matrix, rows x `features` in that order.
+    Every feature must be there (SchemaError otherwise); null values are NaN, which the
+    scoring pipeline fills with training means.
+
+      JSON:   [row, ...], {"rows": [row, ...]} or columnar {"feature": [values], ...}
+      NDJSON: one row per line
+      Arrow:  an IPC stream or file with a numeric column per feature
+
+    A row is an object of feature -> value or an array of the values in `features` order.
+    """
+    kind = body_format(content_type)
+    try:
+        if kind == "arrow":
+            X = _from_arrow(body, features)
+        elif kind == "ndjson":
+            X = _from_rows([loads(line) for line in body.splitlines() if line.strip()], features)
+        else:
+            data = loads(body)
+            if isinstance(data, dict) and "rows" not in data:
+                X = _from_columns(data, features)
+            else:
+                X = _from_rows(data["rows"] if isinstance(data, dict) else data, features)
+    except (InvalidBatch, SchemaError):
+        raise
+    except (AttributeError, TypeError, KeyError, ValueError, pa.ArrowException) as e:
+        raise InvalidBatch(f"❌ Could not decode the {kind} batch: {e}") from e
+    if len(X) > MAX_BATCH_ROWS:
+        raise InvalidBatch(f"❌ {len(X)} rows in one batch, at most {MAX_BATCH_ROWS} are accepted")
+    return X
+
+
+def encode_predictions(version, labels, proba):
+    """The batch response body: every row's prediction and failure probability, in request order"""
+    result = {"model_version": version, "rows": len(labels),
+              "failure_predicted": np.ascontiguousarray(labels, dtype=np.int8),
+              "failure_probability": np.ascontiguousarray(proba, dtype=np.float64)}
+    if orjson is not None:
+        return orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+    result["failure_predicted"] = result["failure_predicted"].tolist()
+    result["failure_probability"] = result["failure_probability"].tolist()
+    return json.dumps(result).encode()
+
+
+def predict_batch(model, body, content_type, budget=None):
+    """Decode, score in one pass with a registry ModelVersion and encode the response body"""
+    X = decode_batch(body, content_type, model.features)
+    labels, proba = model.classify(X, budget=budget)
+    return encode_predictions(model.version, labels, proba)
+
+
+def encode_arrow(columns):
+    """feature -> values as an Arrow IPC stream (what clients send with the arrow Content-Type)"""
+    sink = io.BytesIO()
+    table = pa.table({str(name): np.asarray(values, dtype=np.float32) for name, values in columns.items()})
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
+import pandas as pd
+from tree_engine import TreeEnsemble, compile_model
+
+POLICIES = ("hard", "soft")  # majority of the members' labels / mean of their failure probabilities
+PARALLEL_MIN_ROWS = 2048  # smaller batches score the members one after the other (no thread handoff)
+COST_SMOOTHING = 0.2  # weight of the newest timing in each member's seconds-per-row estimate
+
+
+class EnsemblePredictor:
+    """
+    The random forest and XGBoost models as the one model that training evaluates and
+    servers use. policy "hard": a failure when a strict majority of the members predicts
+    one, which for two members is the (rf + xgb) // 2 the trainer has always reported;
+    "soft": when the members' mean failure probability is above 0.5.
+
+    All members score the same batch, converted once; large batches score the members in
+    parallel threads. With a latency `budget` (seconds) the cheapest member is scored
+    first and the others only while the budget allows; if it runs out the cheapest
+    member's own prediction is returned.
+    """
+
+    def __init__(self, members, policy="hard", features=None):
+        if policy not in POLICIES:
+            raise ValueError(f"❌ Unknown ensemble policy {policy!r}, expected one of {POLICIES}")
+        self.members = dict(members)
+        self.policy = policy
+        first = next(iter(self.members.values()))
+        self.features = list(features if features is not None else
+                             getattr(first, "features", getattr(first, "feature_names_in_", [])))
+        self.classes_ = np.array([0, 1])
+        self.cost = {}  # member -> smoothed seconds per row
+        self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
+
+    def compiled(self):
+        """The same ensemble with every member flattened by tree_engine"""
+        return EnsemblePredictor({name: compile_model(member) for name, member in self.members.items()},
+                                 self.policy, self.features)
+
+    def _matrix(self, X):
+        if isinstance(X, pd.DataFrame) and list(X.columns) != self.features:
+            X = X[self.features]
+        if all(isinstance(member, TreeEnsemble) for member in self.members.values()):
+            # One float32 matrix shared by every member instead of a conversion per member
+            X = np.ascontiguousarray(X, dtype=np.float32).reshape(-1, len(self.features))
+        elif not isinstance(X, pd.DataFrame):
+            # Members fitted on a DataFrame check the column names of what they score
+            X = pd.DataFrame(X, columns=self.features, copy=False)
+        return X
+
+    def _member_proba(self, name, X):
+        started = time.perf_counter()
+        proba = np.asarray(self.members[name].predict_proba(X))
+        per_row = (time.perf_counter() - started) / max(len(proba), 1)
+        self.cost[name] = per_row if name not in self.cost else \
+            (1 - COST_SMOOTHING) * self.cost[name] + COST_SMOOTHING * per_row
+        return proba
+
+    def cheapest(self):
+        """The member with the lowest measured cost per row (the first one before any timing)"""
+        return min(self.members, key=lambda name: self.cost.get(name, 0.0))
+
+    def _combine(self, probas):
+        if len(probas) == 1 or self.policy == "hard":
+            votes = sum(np.argmax(proba, axis=1) for proba in probas.values())
+            labels = (2 * votes > len(probas)).astype(np.int64)
+        else:
+            labels = (np.mean([proba[:, 1] for proba in probas.values()], axis=0) > 0.5).astype(np.int64)
+        return labels, np.mean([proba[:, 1] for proba in probas.values()], axis=0)
+
+    def vote(self, X, budget=None):
+        """
+        (labels, mean failure probability, members used). Without a budget every member is
+        used; with one, members that would not finish within it are left out.
+        """
+        started = time.perf_counter()
+        X = self._matrix(X)
+        order = sorted(self.members, key=lambda name: self.cost.get(name, 0.0))
+        probas = {}
+        if len(X) >= PARALLEL_MIN_ROWS and len(order) > 1:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=len(self.members))
+            futures = {name: self._pool.submit(self._member_proba, name, X) for name in order}
+            probas[order[0]] = futures[order[0]].result()
+            for name in order[1:]:
+                remaining = None if budget is None else max(budget - (time.perf_counter() - started), 0.0)
+                try:
+                    probas[name] = futures[name].result(timeout=remaining)
+                except TimeoutError:
+                    break  # the member finishes in the background; its result is not waited for
+        else:
+            for name in order:
+                if probas and budget is not None and \
+                        self.cost.get(name, 0.0) * len(X) > budget - (time.perf_counter() - started):
+                    break
+                probas[name] = self._member_proba(name, X)
+        labels, proba = self._combine(probas)
+        return labels, proba, list(probas)
+
+    def predict(self, X, budget=None):
+        return self.vote(X, budget)[0]
+
+    def predict_proba(self, X):
+        proba = self.vote(X)[1]
+        return np.column_stack([1 - proba, proba])
@@ -0,0 +1,133 @@
+import hashlib
+import inspect
+import json
+import marshal
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "../data/cache/features")
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def pipeline_version(*parts):
+    """Hash of the source of the functions/modules that build the features; any edit changes it"""
+    digest = hashlib.sha256()
+    for part in parts:
+        try:
+            digest.update(inspect.getsource(part).encode())
+        except (OSError, TypeError):  # no source on disk (frozen or interactive): use the bytecode
+            digest.update(marshal.dumps(part.__code__))
+    return digest.hexdigest()[:16]
+
+
+def content_hash(df, *extra):
+    """
+    Hash of a frame's values, index, columns and dtypes, plus any extra inputs: JSON-able
+    values, or objects with a fingerprint() (e.g. QuantileSketches)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(json.dumps([list(map(str, df.columns)), list(map(str, df.dtypes))]).encode())
+    for item in extra:
+        if hasattr(item, "fingerprint"):
+            digest.update(item.fingerprint().encode())
+        else:
+            digest.update(json.dumps(item, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Computed feature frames keyed by (input content, pipeline version).
+
+    Every entry is a directory with one float32 .npy matrix per frame (the precision the
+    models score at), its index and a small JSON header; hits are memory-mapped instead
+    of read. Least recently used entries are dropped once the cache grows past
+    `max_bytes`.
+    """
+
+    def __init__(self, version, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.version = version
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, df, *extra):
+        return f"{content_hash(df, *extra)}-{self.version}"
+
+    def get(self, key):
+        directory = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        frames = {}
+        for name, info in meta.items():
+            values = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            index = pd.Index(np.load(os.path.join(directory, f"{name}.index.npy")), name=info["index_name"])
+            frame = pd.DataFrame(values, index=index, columns=info["columns"], copy=False)
+            # Other columns (the 0/1 target) were stored as float32 on the way in
+            other = {c: d for c, d in zip(info["columns"], info["dtypes"]) if d != "float32"}
+            frames[name] = frame.astype(other) if other else frame
+        os.utime(directory)  # mark as recently used
+        return frames
+
+    def put(self, key, frames):
+        """Store {name: numeric DataFrame}; a concurrent writer of the same key just wins the rename"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = os.path.join(self.cache_dir, f".{key}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp_dir)
+        meta = {}
+        for name, frame in frames.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), frame.to_numpy(dtype=np.float32))
+            np.save(os.path.join(tmp_dir, f"{name}.index.npy"), frame.index.to_numpy())
+            meta[name] = {
+                "columns": list(frame.columns),
+                "dtypes": [str(d) for d in frame.dtypes],
+                "index_name": frame.index.name,
+            }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.replace(tmp_dir, os.path.join(self.cache_dir, key))
+        except OSError:  # same entry written meanwhile
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """(last used, bytes, path) of every entry, oldest first"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:  # the newest entry always stays
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def load_or_build(self, df, build, *extra):
+        """
+        Frames for `df` from the cache, or `build(df, *extra)` (a dict of numeric frames)
+        stored under its key. Returns (frames, hit).
+        """
+        key = self.key(df, *extra)
+        frames = self.get(key)
+        if frames is not None:
+            return frames, True
+        frames = build(df, *extra)
+        self.put(key, frames)
+        return frames, False
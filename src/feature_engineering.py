@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from rates import add_rates
 
 # Load CPU and Memory Data
 cpu_df = pd.read_csv("data/cpu_usage.csv")
@@ -17,9 +18,10 @@ print("Memory Columns:", memory_df.columns)
 cpu_column = "cpu_usage" if "cpu_usage" in cpu_df.columns else "value"
 memory_column = "memory_usage" if "memory_usage" in memory_df.columns else "value"
 
-# Compute CPU and Memory rate of change
-cpu_df["cpu_rate"] = cpu_df[cpu_column].diff() / cpu_df["timestamp"].diff().dt.total_seconds()
-memory_df["memory_rate"] = memory_df[memory_column].diff() / memory_df["timestamp"].diff().dt.total_seconds()
+# Compute CPU and Memory rate of change per series (NaN, not inf, where samples share a timestamp).
+# CPU is cumulative container_cpu_usage_seconds_total, so drops are counter resets; memory is a gauge.
+add_rates(cpu_df, {cpu_column: "cpu_rate"})
+add_rates(memory_df, {memory_column: "memory_rate"}, counter=False)
 
 # Save individual feature files
 cpu_df.to_csv("data/cpu_features.csv", index=False)
@@ -37,8 +39,7 @@ merged_df["failure"] = (
     (merged_df["memory_rate"] > failure_threshold_memory)
 ).astype(int)
 
-# Handle NaN and Inf values
-merged_df.replace([float("inf"), float("-inf")], float("nan"), inplace=True)
+# Handle NaN values (first sample of each series)
 merged_df.fillna(0, inplace=True)
 
 # Save Processed Data
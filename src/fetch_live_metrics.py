@@ -1,12 +1,26 @@
-import requests
 import pandas as pd
 import os
-from datetime import datetime, timezone
+from datetime import datetime
 import schedule
 import time
+from scrape_pool import fetch_all, format_timings
+import metrics_store
+import rollups
+from series_align import align
+from prom_decode import decode_matrix
+from watermarks import Watermarks
+from ring_buffer import MAX_SERIES, SeriesRing
+from online_features import OnlineFeatures
+from quantile_sketch import QuantileSketches, alerts
+from rates import RAW_SERIES_LABELS, local_rates, rate_queries
 
 #PROMETHEUS_URL = "http://localhost:9090/api/v1/query"  # Update if needed
 PROMETHEUS_URL = "http://192.168.49.2:32745/api/v1/query"
+PROMETHEUS_RANGE_URL = PROMETHEUS_URL + "_range"
+
+SCRAPE_INTERVAL = 300  # seconds between scrape cycles
+SCRAPE_STEP = 15  # resolution of the samples pulled each cycle
+MAX_LOOKBACK = 3600  # how far back the first cycle (or one after a long outage) reaches
 
 METRICS = {
     "cpu_usage": 'rate(container_cpu_usage_seconds_total[1m])',
@@ -22,82 +36,119 @@ METRICS = {
     "container_restarts_avg": 'avg(kube_pod_container_status_restarts_total)'
 }
 
+# rate(...) metrics computed locally from raw counters instead of by Prometheus
+LOCAL_RATES = rate_queries(METRICS)
+
 SAVE_DIR = os.path.join(os.path.dirname(__file__), "../data")
 os.makedirs(SAVE_DIR, exist_ok=True)
 
-def fetch_metric(query, label):
-    try:
-        response = requests.get(PROMETHEUS_URL, params={"query": query})
-        data = response.json()
-    except Exception as e:
-        print(f"❌ Failed to fetch metric {label}: {e}")
-        return pd.DataFrame()
-
-    results = []
-    for item in data.get("data", {}).get("result", []):
-        try:
-            timestamp = datetime.fromtimestamp(float(item["value"][0]), tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-            value = float(item["value"][1])
-            entry = {"timestamp": timestamp, label: value}
-
-            # Optional fields
-            instance = item["metric"].get("instance")
-            container = item["metric"].get("container")
-
-            if instance:
-                entry["instance"] = instance
-            if container:
-                entry["container"] = container
+def report_alerts(df, sketches):
+    """Print the newest sample of every series and metric that is above the series' p99 so far"""
+    found = alerts(df, sketches).drop_duplicates(["series", "metric"], keep="last")
+    for row in found.itertuples(index=False):
+        print(f"🚨 {row.series} {row.metric} = {row.value:.3f} above its p99 {row.threshold:.3f} at {row.timestamp}")
+    return found
 
-            results.append(entry)
-        except Exception as e:
-            print(f"❌ Error processing {label}: {e}")
-
-    df = pd.DataFrame(results)
-    if not df.empty:
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    return df
-
-def fetch_and_save_metrics():
+def fetch_and_save_metrics(watermarks=None, ring=None, features=None, sketches=None):
     print(f"\n⏱️ Running fetch at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    all_data = None
-
-    for key, query in METRICS.items():
-        print(f"📡 Fetching {key}...")
-        df = fetch_metric(query, key)
+    watermarks = watermarks or Watermarks()
+    frames = {}
+
+    # Each metric resumes one step after the newest sample already stored for it
+    now = time.time()
+    ranges = {
+        key: {"start": watermarks.next_start(key, SCRAPE_STEP, now - MAX_LOOKBACK), "end": now, "step": SCRAPE_STEP}
+        for key in METRICS
+    }
+    # Nothing new can exist yet for metrics scraped less than one step ago
+    due = [key for key in METRICS if ranges[key]["start"] <= now]
+
+    # rate() metrics are computed here from their raw counter: one query per counter, reaching
+    # back one rate window so the first new sample has a full window
+    queries, params, counters = {}, {}, {}
+    for key in due:
+        if key in LOCAL_RATES:
+            counter, window, aggregate = LOCAL_RATES[key]
+            counters.setdefault(counter, {})[key] = (window, aggregate)
+        else:
+            queries[key], params[key] = METRICS[key], ranges[key]
+    for counter, uses in counters.items():
+        lookback = max(pd.Timedelta(window).total_seconds() for window, _ in uses.values())
+        start = min(ranges[key]["start"] for key in uses) - lookback
+        queries[counter], params[counter] = counter, {"start": start, "end": now, "step": SCRAPE_STEP}
+
+    print(f"📡 Fetching {len(queries)} queries concurrently...")
+    responses, timings, errors = fetch_all(PROMETHEUS_RANGE_URL, queries, per_query_params=params)
+    print(f"⏱️ Query timings:\n{format_timings(timings)}")
+
+    decoded = {}
+    for key in queries:
+        if key in errors:
+            print(f"❌ Failed to fetch metric {key}: {errors[key]}")
+            continue
+        try:
+            if key in counters:
+                raw = decode_matrix(responses[key], key, labels=RAW_SERIES_LABELS)
+                decoded.update(local_rates(raw, key, counters[key], f"{SCRAPE_STEP}s") if not raw.empty else {})
+            else:
+                decoded[key] = decode_matrix(responses[key], key)
+        except Exception as e:
+            print(f"❌ Error processing {key}: {e}")
 
+    for key, df in decoded.items():
+        df = watermarks.filter_new(key, df)
         if df.empty:
-            print(f"⚠️ No data for {key}, skipping.")
+            print(f"⚠️ No new data for {key}, skipping.")
             continue
 
-        # Ensure all columns exist
-        if all_data is None:
-            all_data = df
-        else:
-            common_cols = list(set(all_data.columns).intersection(set(df.columns)))
-            if "timestamp" not in common_cols:
-                print(f"⚠️ No common timestamp found for {key}, skipping merge.")
-                continue
-            all_data = pd.merge(all_data, df, on=common_cols, how="outer")
+        frames[key] = df
+
+    # One row per series key and timestamp, scalar aggregates broadcast to every row
+    all_data = align(frames)
 
     if all_data is not None and not all_data.empty:
-        save_path = os.path.join(SAVE_DIR, "k8s_live_metrics.csv")
-        all_data.to_csv(save_path, index=False)
-        print(f"✅ Saved metrics to {save_path}")
+        paths = rollups.ingest(all_data)
+        # Watermarks move only after the append, so a crash re-fetches rather than loses samples
+        for key, df in frames.items():
+            watermarks.advance(key, df)
+        watermarks.save()
+        if features is not None:
+            # Only the new rows get feature work; earlier samples live on in the saved state
+            all_data = features.update(all_data)
+            features.save()
+        if sketches is not None:
+            # New samples are checked against the history before they join it
+            if sketches.keys:
+                report_alerts(all_data, sketches)
+            sketches.update(all_data).save()
+        if ring is not None:
+            ring.append(all_data)
+        print(f"✅ Appended {len(all_data)} new rows to {metrics_store.STORE_DIR} ({len(paths)} file(s))")
         print(all_data.head())
     else:
-        print("⚠️ No metrics fetched.")
-
-# Scheduler
-schedule.every(5).minutes.do(fetch_and_save_metrics)
-
-print("🕒 Scheduler started. Fetching metrics every 5 minutes...")
-
-# Initial run
-fetch_and_save_metrics()
-
-# Infinite loop
-while True:
-    schedule.run_pending()
-    time.sleep(1)
-
+        print("⚠️ No new metrics fetched.")
+
+if __name__ == "__main__":
+    # Scheduler
+    watermarks = Watermarks()
+    features = OnlineFeatures(list(METRICS))
+    sketches = QuantileSketches.load() or QuantileSketches()
+    # Latest samples and their features for every series, shared with server.py without going through disk
+    try:
+        ring = SeriesRing.create(features.output_columns, max_series=int(os.getenv("RING_MAX_SERIES", MAX_SERIES)))
+    except MemoryError as e:
+        print(f"{e}; server.py will read the store instead")
+        ring = None
+    schedule.every(SCRAPE_INTERVAL).seconds.do(fetch_and_save_metrics, watermarks, ring, features, sketches)
+    # Rollup partitions that are complete get merged into one file each
+    schedule.every().hour.do(lambda: [rollups.compact(resolution) for resolution in rollups.RESOLUTIONS])
+
+    print(f"🕒 Scheduler started. Fetching new samples every {SCRAPE_INTERVAL} seconds...")
+
+    # Initial run
+    fetch_and_save_metrics(watermarks, ring, features, sketches)
+
+    # Infinite loop
+    while True:
+        schedule.run_pending()
+        time.sleep(1)
@@ -1,8 +1,9 @@
 # scripts/predictgemini.py
 import pandas as pd
 import numpy as np
-import joblib
-from sklearn.impute import SimpleImputer
+from metrics_store import load_metrics
+from model_registry import load_current
+from rolling_features import add_rolling_features
 
 # Paths
 CSV_PATH = "/home/pavithra/k8s-failure-prediction/data/k8s_live_metrics.csv"
@@ -10,30 +11,24 @@ MODEL_PATH = "../models/k8s_failure_model_live.pkl"
 OUTPUT_PATH = "output.csv"
 
 # Load data
-df = pd.read_csv(CSV_PATH)
+df = load_metrics(csv_path=CSV_PATH)
 df.columns = df.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
 df["timestamp"] = pd.to_datetime(df["timestamp"])
 df.set_index("timestamp", inplace=True)
 
-# Compute rolling averages for numeric columns
+# Compute per-series rolling averages for numeric columns
 numeric_cols = df.select_dtypes(include=[np.number]).columns
-for col in numeric_cols:
-    if f"{col}_avg" not in df.columns:
-        df[f"{col}_avg"] = df[col].rolling(window=5, min_periods=1).mean()
+add_rolling_features(df, [col for col in numeric_cols if f"{col}_avg" not in df.columns])
 
 # Drop non-numeric columns
 df = df.select_dtypes(include=[np.number])
 
-# Impute missing values
-imputer = SimpleImputer(strategy="mean")
-df_imputed = pd.DataFrame(imputer.fit_transform(df), columns=df.columns)
-
-# Load trained model
-model = joblib.load(MODEL_PATH)
+# Load trained model (its pipeline fills missing values with the training means)
+model = load_current(fallback_path=MODEL_PATH)
 
 # Predict
-predictions = model.predict(df_imputed)
-df_output = df_imputed.copy()
+predictions = model.predict(df)
+df_output = df.copy()
 df_output["prediction"] = predictions
 
 # Save to output.csv
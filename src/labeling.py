@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# failure flag -> metric it is computed from
+FAILURE_SOURCES = {
+    "cpu_failure": "cpu_usage",
+    "memory_failure": "memory_usage",
+    "restart_failure": "container_restarts_avg",
+}
+LABEL_WINDOW = 2
+
+# Fixed thresholds used by train_model_live.py
+FIXED_THRESHOLDS = {
+    "cpu_usage": 0.8,  # 80% CPU usage
+    "memory_usage": 100000000,  # 100MB memory usage
+    "container_restarts_avg": 3,  # more than 3 restarts
+}
+
+
+def _group_order(groups):
+    """Stable order that makes every group contiguous, plus each row's group start (in that order)"""
+    codes, _ = pd.factorize(groups, use_na_sentinel=False)
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    boundary = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    group_start = np.maximum.accumulate(np.where(boundary, np.arange(len(order)), 0))
+    return order, group_start
+
+
+def _any_above_sorted(values, threshold, window, group_start):
+    """Flags for rows already in group order; group_start[i] is the first row of row i's group"""
+    with np.errstate(invalid="ignore"):
+        above = values > threshold
+    missing = np.isnan(values)
+    above_sum = np.r_[0, np.cumsum(above, dtype=np.int64)]
+    missing_sum = np.r_[0, np.cumsum(missing, dtype=np.int64)]
+
+    end = np.arange(1, len(values) + 1)
+    start = end - window
+    full = start >= group_start
+    start = np.maximum(start, 0)
+    return full & (missing_sum[end] == missing_sum[start]) & (above_sum[end] > above_sum[start])
+
+
+def rolling_any_above(values, threshold, window=LABEL_WINDOW, groups=None):
+    """
+    Vectorized `Series.rolling(window).apply(lambda x: np.any(x > threshold), raw=True).fillna(False)`.
+
+    A row is flagged when any of the last `window` values (within its group, if `groups` is
+    given) exceeds `threshold`. Like the pandas version, rows without a full window of
+    non-NaN values are never flagged. `threshold` may be a scalar or one value per row.
+    Cost is a couple of cumulative sums, so it is linear in the number of rows.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    threshold = np.broadcast_to(np.asarray(threshold, dtype=np.float64), values.shape)
+    if groups is None:
+        return _any_above_sorted(values, threshold, window, 0)
+    order, group_start = _group_order(np.asarray(groups))
+    flagged = np.empty(len(values), dtype=bool)
+    flagged[order] = _any_above_sorted(values[order], threshold[order], window, group_start)
+    return flagged
+
+
+def label_failures(df, thresholds, window=LABEL_WINDOW, group_by=None):
+    """
+    Add cpu_failure / memory_failure / restart_failure (0.0 or 1.0) and the combined `target`.
+    `group_by` names a series column (e.g. "series") so windows never span two series;
+    it is ignored when the frame has no such column.
+    """
+    if group_by is not None and group_by in df.columns:
+        order, group_start = _group_order(df[group_by])
+    else:
+        order, group_start = None, 0
+    target = np.zeros(len(df), dtype=bool)
+    for flag, column in FAILURE_SOURCES.items():
+        values = df[column].to_numpy(dtype=np.float64)
+        threshold = np.broadcast_to(np.asarray(thresholds[column], dtype=np.float64), values.shape)
+        if order is None:
+            flagged = _any_above_sorted(values, threshold, window, group_start)
+        else:
+            flagged = np.empty(len(values), dtype=bool)
+            flagged[order] = _any_above_sorted(values[order], threshold[order], window, group_start)
+        df[flag] = flagged.astype(np.float64)
+        target |= flagged
+    df["target"] = target.astype(int)
+    return df
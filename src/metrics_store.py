@@ -0,0 +1,157 @@
+import os
+import time
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import schema
+
+# Append-only store: one directory per hour, one immutable Parquet file per append.
+#   data/store/date=2025-04-16/hour=11/part-<ns>-<id>.parquet
+STORE_DIR = os.path.join(os.path.dirname(__file__), "../data/store")
+CSV_PATH = os.path.join(os.path.dirname(__file__), "../data/k8s_live_metrics.csv")
+PARTITION_FREQ = "h"
+
+
+def partition_dir(store_dir, hour):
+    return os.path.join(store_dir, f"date={hour:%Y-%m-%d}", f"hour={hour:%H}")
+
+
+def append(df, store_dir=STORE_DIR, freq=PARTITION_FREQ):
+    """
+    Write `df` as new files in the partitions it touches (hourly, or `freq` such as "D"
+    for sparser data). Existing files are never rewritten.
+    """
+    if df is None or df.empty:
+        return []
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df = df.dropna(subset=["timestamp"])
+
+    paths = []
+    for hour, part in df.groupby(df["timestamp"].dt.floor(freq), sort=True):
+        directory = partition_dir(store_dir, hour)
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(directory, name)
+        table = pa.Table.from_pandas(part.sort_values("timestamp", kind="stable"), preserve_index=False)
+        # Readers skip dot-files, so a half-written part is never visible
+        tmp_path = os.path.join(directory, "." + name)
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def list_partitions(store_dir=STORE_DIR, start=None, end=None, freq=PARTITION_FREQ):
+    """Partitions (hour, directory) overlapping [start, end], oldest first; `freq` as given to append"""
+    if not os.path.isdir(store_dir):
+        return []
+    start = pd.Timestamp(start).floor(freq) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    partitions = []
+    for date_dir in os.listdir(store_dir):
+        if not date_dir.startswith("date="):
+            continue
+        for hour_dir in os.listdir(os.path.join(store_dir, date_dir)):
+            if not hour_dir.startswith("hour="):
+                continue
+            hour = pd.Timestamp(f"{date_dir[5:]} {hour_dir[5:]}:00:00")
+            if (start is not None and hour < start) or (end is not None and hour > end):
+                continue
+            partitions.append((hour, os.path.join(store_dir, date_dir, hour_dir)))
+    return sorted(partitions)
+
+
+def list_files(store_dir=STORE_DIR, start=None, end=None):
+    files = []
+    for _, directory in list_partitions(store_dir, start, end):
+        files.extend(sorted(
+            os.path.join(directory, f) for f in os.listdir(directory)
+            if f.endswith(".parquet") and not f.startswith(".")
+        ))
+    return files
+
+
+def latest_timestamp(store_dir=STORE_DIR):
+    """Newest sample in the store, read from the last partition only"""
+    partitions = list_partitions(store_dir)
+    for hour, _ in reversed(partitions):
+        df = read(store_dir, columns=["timestamp"], start=hour, end=hour + pd.Timedelta(1, PARTITION_FREQ))
+        if not df.empty:
+            return df["timestamp"].max()
+    return None
+
+
+def read(store_dir=STORE_DIR, columns=None, start=None, end=None, last=None, typed=False):
+    """
+    Load rows with start <= timestamp < end. `columns` restricts which columns are
+    decoded (timestamp is always included); `last` is a window like "15min" ending
+    at the newest stored sample. Only partitions inside the range are opened.
+    `typed` returns the compact pipeline schema (see schema.py): labels are decoded
+    straight into categoricals and metrics come back as float32.
+    """
+    if last is not None:
+        newest = latest_timestamp(store_dir)
+        if newest is None:
+            return pd.DataFrame()
+        start = newest - pd.Timedelta(last)
+        end = None
+
+    filters = []
+    if start is not None:
+        filters.append(("timestamp", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("timestamp", "<", pd.Timestamp(end)))
+
+    tables = []
+    for path in list_files(store_dir, start, end):
+        available = pq.read_schema(path).names
+        wanted = None
+        if columns is not None:
+            wanted = ["timestamp"] + [c for c in columns if c in available and c != "timestamp"]
+        tables.append(pq.read_table(path, columns=wanted, filters=filters or None))
+
+    if not tables:
+        return pd.DataFrame()
+    # Appends may carry different metric columns; missing ones come back as nulls
+    table = pa.concat_tables(tables, promote_options="default")
+    df = table.to_pandas(strings_to_categorical=typed).sort_values("timestamp", kind="stable").reset_index(drop=True)
+    return schema.apply_schema(df) if typed else df
+
+
+def load_metrics(store_dir=STORE_DIR, csv_path=CSV_PATH, **kwargs):
+    """
+    Read from the store, falling back to the legacy CSV snapshot when the store is still
+    empty; the snapshot is cut to the same start/end/last window the store would be.
+    """
+    df = read(store_dir, **kwargs)
+    if df.empty and csv_path and os.path.exists(csv_path):
+        df = schema.read_csv(csv_path) if kwargs.get("typed") else pd.read_csv(csv_path)
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        start, end = kwargs.get("start"), kwargs.get("end")
+        if kwargs.get("last") is not None and not df.empty:
+            start, end = df["timestamp"].max() - pd.Timedelta(kwargs["last"]), None
+        if start is not None:
+            df = df[df["timestamp"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["timestamp"] < pd.Timestamp(end)]
+        if kwargs.get("columns") is not None:
+            df = df[["timestamp"] + [c for c in kwargs["columns"] if c in df.columns and c != "timestamp"]]
+        df = df.reset_index(drop=True)
+    return df
+
+
+def import_csv(csv_path=CSV_PATH, store_dir=STORE_DIR):
+    """One-off: seed the store from an existing CSV export"""
+    df = pd.read_csv(csv_path)
+    df.columns = df.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
+    paths = append(df, store_dir)
+    print(f"✅ Imported {len(df)} rows from {csv_path} into {len(paths)} partition file(s)")
+    return paths
+
+
+if __name__ == "__main__":
+    import sys
+    import_csv(*sys.argv[1:2])
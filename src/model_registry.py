@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import joblib
+import pandas as pd
+from scoring_pipeline import ScoringPipeline
+from tree_engine import compile_model
+
+# Every published model is a version directory; CURRENT names the one servers use:
+#   models/registry/v0003/{model.joblib, engine.joblib, meta.json}
+#   models/registry/CURRENT  ("v0003")
+# Paths are absolute, so nothing depends on the working directory a server was started from.
+REGISTRY_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../models/registry"))
+CURRENT_FILE = "CURRENT"
+CHECK_INTERVAL = 2.0  # seconds between a LiveModel's looks at CURRENT
+KEEP_VERSIONS = 10  # prune() keeps this many (and always the current one)
+
+
+class ModelVersion:
+    """One loaded model: its scoring pipeline (frozen features, training means, flattened model) and metrics"""
+
+    def __init__(self, version, model, metrics=None, meta=None, directory=None):
+        self.version = version
+        self.model = model
+        self.features = model.features
+        self.metrics = metrics or {}
+        self.meta = meta or {}
+        self.directory = directory
+
+    def predict(self, X, budget=None):
+        return self.model.predict(X, budget=budget)
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(X)
+
+    def classify(self, X, budget=None):
+        """(labels, failure probabilities) in one pass"""
+        return self.model.classify(X, budget=budget)
+
+    def estimator(self):
+        """The original fitted model (for retraining or inspection), loaded on demand"""
+        if self.directory is None:
+            return self.model
+        return joblib.load(os.path.join(self.directory, "model.joblib"))
+
+
+def versions(registry_dir=REGISTRY_DIR):
+    """Published versions, oldest first"""
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(d for d in os.listdir(registry_dir) if d.startswith("v") and d[1:].isdigit())
+
+
+def current_version(registry_dir=REGISTRY_DIR):
+    try:
+        with open(os.path.join(registry_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def publish(pipeline, metrics=None, registry_dir=REGISTRY_DIR, promote_it=True, info=None):
+    """
+    Store a ScoringPipeline as the next version and (with `promote_it`) make it the current one.
+    The version is written under a temporary name and renamed into place, so a reader
+    never sees half an artifact. Returns the version name.
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    tmp_dir = os.path.join(registry_dir, f".tmp-{uuid.uuid4().hex[:8]}")
+    os.makedirs(tmp_dir)
+    joblib.dump(pipeline, os.path.join(tmp_dir, "model.joblib"))
+    # Uncompressed, so the engine's node arrays can be memory-mapped when loaded
+    joblib.dump(compile_model(pipeline), os.path.join(tmp_dir, "engine.joblib"))
+    meta = {
+        "created": pd.Timestamp.now().isoformat(),
+        "model_type": type(pipeline.model).__name__,
+        "features": pipeline.features,
+        "metrics": metrics or {},
+        **(info or {}),
+    }
+    while True:
+        existing = versions(registry_dir)
+        version = f"v{int(existing[-1][1:]) + 1 if existing else 1:04d}"
+        meta["version"] = version
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2, default=str)
+        try:
+            os.rename(tmp_dir, os.path.join(registry_dir, version))
+            break
+        except OSError:  # another publisher took this number first
+            continue
+    print(f"📦 Published model {version} to {registry_dir}")
+    if promote_it:
+        promote(version, registry_dir)
+    return version
+
+
+def promote(version, registry_dir=REGISTRY_DIR):
+    """Make `version` the one servers use (also how to roll back); CURRENT is replaced atomically"""
+    if not os.path.isfile(os.path.join(registry_dir, version, "meta.json")):
+        raise FileNotFoundError(f"❌ No model {version} in {registry_dir}")
+    _write_atomic(os.path.join(registry_dir, CURRENT_FILE), version)
+    print(f"✅ {version} is now the current model")
+
+
+def prune(keep=KEEP_VERSIONS, registry_dir=REGISTRY_DIR):
+    """Delete all but the newest `keep` versions; the current one is always kept"""
+    current = current_version(registry_dir)
+    removed = [v for v in versions(registry_dir)[:-keep or None] if v != current]
+    for version in removed:
+        # Processes still using a removed version keep their mapped pages until they swap
+        shutil.rmtree(os.path.join(registry_dir, version), ignore_errors=True)
+    return removed
+
+
+def load(version=None, registry_dir=REGISTRY_DIR, mmap=True):
+    """
+    A published version (the current one by default), or None if there is none. With `mmap`
+    the engine's arrays are memory-mapped read-only, so every process serving the same
+    version shares one copy of them in the page cache.
+    """
+    version = version or current_version(registry_dir)
+    if version is None:
+        return None
+    directory = os.path.join(registry_dir, version)
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    model = joblib.load(os.path.join(directory, "engine.joblib"), mmap_mode="r" if mmap else None)
+    imputer_path = os.path.join(directory, "imputer.joblib")
+    if not isinstance(model, ScoringPipeline):  # published before models were saved as pipelines
+        model = ScoringPipeline.from_imputer(joblib.load(imputer_path), model, meta["features"]) \
+            if os.path.exists(imputer_path) else ScoringPipeline(meta["features"], None, model)
+    return ModelVersion(version, model, meta.get("metrics"), meta, directory)
+
+
+def load_file(path):
+    """
+    A model saved as a single joblib/pickle file (before the registry), as a ModelVersion.
+    A bare model (saved before pipelines) gets its fitted feature names as the schema and
+    0 for missing values.
+    """
+    model = joblib.load(path)
+    if not isinstance(model, ScoringPipeline):
+        features = getattr(model, "features", getattr(model, "feature_names_in_", None))
+        if features is None:
+            features = range(model.n_features_in_)
+        model = ScoringPipeline(features, None, model)
+    return ModelVersion(os.path.basename(path), compile_model(model))
+
+
+def load_current(registry_dir=REGISTRY_DIR, fallback_path=None, mmap=True):
+    """The current version, or the single-file model at `fallback_path` while the registry is empty"""
+    loaded = load(registry_dir=registry_dir, mmap=mmap)
+    if loaded is None and fallback_path and os.path.exists(fallback_path):
+        loaded = load_file(fallback_path)
+    if loaded is None:
+        raise FileNotFoundError(f"❌ No model published in {registry_dir}" +
+                                (f" and none at {fallback_path}" if fallback_path else ""))
+    return loaded
+
+
+class LiveModel:
+    """
+    The current version for a long-running server, swapped for a new one when CURRENT
+    changes (checked at most every `check_interval` seconds, on use). `get()` hands out a
+    whole ModelVersion and the swap only replaces the reference, so a request keeps scoring
+    with the version it started with and none is dropped or sees a half-loaded model.
+    """
+
+    def __init__(self, registry_dir=REGISTRY_DIR, fallback_path=None, check_interval=CHECK_INTERVAL):
+        self.registry_dir = registry_dir
+        self.fallback_path = fallback_path
+        self.check_interval = check_interval
+        self._current = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._current is None or time.monotonic() - self._checked >= self.check_interval:
+            self._refresh()
+        return self._current
+
+    def _refresh(self):
+        with self._lock:
+            if self._current is not None and time.monotonic() - self._checked < self.check_interval:
+                return  # another thread refreshed while this one waited
+            self._checked = time.monotonic()
+            version = current_version(self.registry_dir)
+            if self._current is not None and version in (None, self._current.version):
+                return
+            try:
+                loaded = load_current(self.registry_dir, self.fallback_path)
+            except (OSError, ValueError, KeyError) as e:
+                if self._current is None:
+                    raise
+                print(f"⚠️ Could not load model {version}, still serving {self._current.version}: {e}")
+                return
+            if self._current is not None:
+                print(f"🔁 Swapped model {self._current.version} -> {loaded.version}")
+            self._current = loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Published failure prediction models")
+    parser.add_argument("command", choices=["list", "promote", "prune"],
+                        help="list: versions and their metrics; promote: make a version current (or roll back); "
+                             "prune: delete old versions")
+    parser.add_argument("version", nargs="?", help="with promote: the version to serve")
+    parser.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="with prune: versions to keep")
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    args = parser.parse_args()
+
+    if args.command == "promote":
+        if not args.version:
+            parser.error("promote needs a version")
+        promote(args.version, args.registry)
+    elif args.command == "prune":
+        removed = prune(args.keep, args.registry)
+        print(f"🗑️ Removed {len(removed)} version(s): {', '.join(removed) or '-'}")
+    else:
+        current = current_version(args.registry)
+        for version in versions(args.registry):
+            with open(os.path.join(args.registry, version, "meta.json")) as f:
+                meta = json.load(f)
+            metrics = ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+                                for k, v in meta.get("metrics", {}).items())
+            print(f"{'*' if version == current else ' '} {version}  {meta['created']}  {meta['model_type']}  {metrics}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import joblib
+import numpy as np
+from metrics_store import STORE_DIR
+
+FEATURE_STATE_PATH = os.path.join(STORE_DIR, "_online_features.joblib")
+AVG_WINDOW = 5  # samples in every *_avg column, same as rolling(window=5, min_periods=1)
+INITIAL_SERIES = 256
+STATE_ARRAYS = ("recent", "pos", "win_sum", "win_count")
+
+
+class OnlineFeatures:
+    """
+    Per-series feature state updated one sample at a time.
+
+    For every series it keeps the last AVG_WINDOW values with their running sum and count
+    (the `*_avg` columns), so each new sample costs O(1) no matter how much history came before.
+    The state is saved next to the watermarks and picked up again on restart.
+    """
+
+    def __init__(self, columns, window=AVG_WINDOW, path=FEATURE_STATE_PATH):
+        self.path = path
+        self.columns = list(columns)
+        self.window = window
+        # Only columns without a precomputed *_avg get one, like load_and_preprocess_data
+        self.avg_columns = [c for c in self.columns if f"{c}_avg" not in self.columns]
+
+        state = joblib.load(path) if path and os.path.exists(path) else None
+        if state is not None and (state["columns"] != self.columns or state["window"] != window):
+            print(f"⚠️ Feature state in {path} was built for other columns, starting over")
+            state = None
+        if state is None:
+            self.keys = {}
+            self._allocate(INITIAL_SERIES)
+        else:
+            self._restore(state)
+
+    @classmethod
+    def load(cls, path=FEATURE_STATE_PATH):
+        """Saved state as-is, with the columns it was built for (None if nothing was saved)"""
+        if not os.path.exists(path):
+            return None
+        state = joblib.load(path)
+        features = cls(state["columns"], state["window"], path=None)
+        features.path = path
+        features._restore(state)
+        return features
+
+    def _restore(self, state):
+        self.keys = state["keys"]
+        for name in STATE_ARRAYS:
+            setattr(self, name, state[name])
+
+    @property
+    def output_columns(self):
+        return self.columns + [f"{c}_avg" for c in self.avg_columns]
+
+    def _allocate(self, n_series):
+        n_columns = len(self.columns)
+        self.recent = np.full((n_series, self.window, n_columns), np.nan)
+        self.pos = np.zeros(n_series, dtype=np.int64)
+        self.win_sum = np.zeros((n_series, n_columns))
+        self.win_count = np.zeros((n_series, n_columns), dtype=np.int64)
+
+    def _grow(self, n_series):
+        old = {name: getattr(self, name) for name in STATE_ARRAYS}
+        self._allocate(max(n_series, 2 * len(self.pos)))
+        for name, values in old.items():
+            getattr(self, name)[:len(values)] = values
+
+    def _slots(self, keys):
+        uniques, inverse = np.unique(keys, return_inverse=True)
+        slots = np.empty(len(uniques), dtype=np.int64)
+        for i, key in enumerate(uniques):
+            slots[i] = self.keys.setdefault(key, len(self.keys))
+        if len(self.keys) > len(self.pos):
+            self._grow(len(self.keys))
+        return slots[inverse]
+
+    def update(self, frame):
+        """
+        Feed new wide rows (timestamp, series, metric columns) and return them with the
+        `*_avg` columns filled in. Rows must be newer than anything fed before for their series.
+        """
+        if frame.empty:
+            return frame
+        frame = frame.sort_values("timestamp", kind="stable")
+        keys = frame["series"].astype(str).to_numpy() if "series" in frame.columns else np.full(len(frame), "")
+        slots = self._slots(keys)
+        values = np.full((len(frame), len(self.columns)), np.nan)
+        for j, column in enumerate(self.columns):
+            if column in frame.columns:
+                values[:, j] = frame[column].to_numpy(dtype=np.float64)
+
+        # Rank of every row within its series: rows of one rank touch each series at most
+        # once, so each rank is one vectorized O(1)-per-sample step
+        order = np.argsort(slots, kind="stable")
+        sorted_slots = slots[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+        sizes = np.diff(np.r_[starts, len(order)])
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - np.repeat(starts, sizes)
+
+        averages = np.empty_like(values)
+        for r in range(sizes.max()):
+            rows = np.flatnonzero(rank == r)
+            s, x = slots[rows], values[rows]
+            present = ~np.isnan(x)
+            x0 = np.where(present, x, 0.0)
+
+            # Window: add the new sample, drop the one it overwrites
+            p = self.pos[s]
+            old = self.recent[s, p]
+            old_present = ~np.isnan(old)
+            self.win_sum[s] += x0 - np.where(old_present, old, 0.0)
+            self.win_count[s] += present.astype(np.int64) - old_present
+            # Reset drifted sums whenever a window empties
+            self.win_sum[s] = np.where(self.win_count[s] > 0, self.win_sum[s], 0.0)
+            self.recent[s, p] = x
+            self.pos[s] = (p + 1) % self.window
+            with np.errstate(invalid="ignore", divide="ignore"):
+                averages[rows] = np.where(self.win_count[s] > 0, self.win_sum[s] / self.win_count[s], np.nan)
+
+        out = frame.copy()
+        for column in self.avg_columns:
+            out[f"{column}_avg"] = averages[:, self.columns.index(column)]
+        return out
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        state = {"columns": self.columns, "window": self.window, "keys": self.keys}
+        used = len(self.keys)
+        for name in STATE_ARRAYS:
+            state[name] = getattr(self, name)[:max(used, 1)]
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, self.path)
+
@@ -1,21 +1,30 @@
 import pandas as pd
 import numpy as np
-import joblib
 import requests
 import os
-from sklearn.impute import SimpleImputer
 import requests
 from jsonextractor import solution_implementation  # import your fix script
 from kubernetes import client, config
 import re
+from metrics_store import CSV_PATH, STORE_DIR, load_metrics
+from rolling_features import add_rolling_features
+from labeling import label_failures
+from quantile_sketch import QuantileSketches, sketch_thresholds
+from feature_cache import FeatureCache, pipeline_version
+from model_registry import load_current
+import labeling
+import quantile_sketch
+import rolling_features
+import schema
+import series_align
 from dotenv import load_dotenv
 
 
 # Constants
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-MODEL_PATH = "../models/k8s_failure_model_live.pkl"
-CSV_PATH = "../data/k8s_live_metrics.csv"
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../models/k8s_failure_model_live.pkl")
+ANALYSIS_WINDOW = "15min"  # only the most recent samples are analysed
 
 config.load_kube_config()  # Or config.load_incluster_config() if running inside cluster
 v1 = client.CoreV1Api()
@@ -34,40 +43,43 @@ def get_pod_name_for_deployment(deployment_name, namespace="default"):
         return None
 
 
-def load_and_preprocess_data(csv_path):
-    df = pd.read_csv(csv_path)
+def load_raw_data(csv_path):
+    return load_metrics(STORE_DIR, csv_path=csv_path, last=ANALYSIS_WINDOW)
+
+
+def preprocess_data(df, sketches=None):
+    df = df.copy()
     df.columns = df.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
     df["timestamp"] = pd.to_datetime(df["timestamp"])
     df.set_index("timestamp", inplace=True)
 
-    # Rolling averages for all numeric columns
+    # Per-series rolling averages for all numeric columns
     numeric_cols = df.select_dtypes(include=[np.number]).columns
-    for col in numeric_cols:
-        if f"{col}_avg" not in df.columns:
-            df[f"{col}_avg"] = df[col].rolling(window=5, min_periods=1).mean()
+    add_rolling_features(df, [col for col in numeric_cols if f"{col}_avg" not in df.columns])
+
+    # p99 of every row's own series, over the scraper's whole history when it has sketches
+    thresholds, overall = sketch_thresholds(df, sketches)
+    print(f"📊 p99 thresholds (all series) → CPU: {overall['cpu_usage']:.3f}, Memory: {overall['memory_usage']:.3f}, Restarts: {overall['container_restarts_avg']:.3f}")
 
-    # Dynamic thresholds
-    cpu_threshold = df['cpu_usage'].mean() + 2 * df['cpu_usage'].std()
-    memory_threshold = df['memory_usage'].mean() + 2 * df['memory_usage'].std()
-    restart_threshold = df['container_restarts_avg'].mean() + 2 * df['container_restarts_avg'].std()
+    # Failure flags, per series so a window never spans two pods
+    label_failures(df, thresholds, group_by="series")
+
+    return df
 
-    print(f"📊 Thresholds → CPU: {cpu_threshold:.3f}, Memory: {memory_threshold:.3f}, Restarts: {restart_threshold:.3f}")
 
-    # Failure flags
-    df['cpu_failure'] = df['cpu_usage'].rolling(window=2).apply(lambda x: np.any(x > cpu_threshold), raw=True).fillna(False)
-    df['memory_failure'] = df['memory_usage'].rolling(window=2).apply(lambda x: np.any(x > memory_threshold), raw=True).fillna(False)
-    df['restart_failure'] = df['container_restarts_avg'].rolling(window=2).apply(lambda x: np.any(x > restart_threshold), raw=True).fillna(False)
+def load_and_preprocess_data(csv_path):
+    return preprocess_data(load_raw_data(csv_path), QuantileSketches.load())
 
-    df['target'] = ((df['cpu_failure'] > 0) | (df['memory_failure'] > 0) | (df['restart_failure'] > 0)).astype(int)
 
-    return df
+def build_features(raw, sketches):
+    # Missing values are filled by the model's pipeline with its training means, not refitted here
+    df = preprocess_data(raw, sketches)
+    return {"features": df.select_dtypes(include=[np.number])}
 
 
-def impute_data(df):
-    df_numeric = df.select_dtypes(include=[np.number])
-    imputer = SimpleImputer(strategy="mean")
-    df_imputed = pd.DataFrame(imputer.fit_transform(df_numeric), columns=df_numeric.columns, index=df_numeric.index)
-    return df_imputed
+# Same input data and same preprocessing code -> reuse the last result
+feature_cache = FeatureCache(pipeline_version(preprocess_data, build_features, labeling, rolling_features,
+                                              quantile_sketch, schema, series_align))
 
 
 def get_remediation_advice(metrics_dict):
@@ -88,9 +100,7 @@ def get_remediation_advice(metrics_dict):
 
 
 def predict_failures(df, model):
-    df_imputed = impute_data(df)
-    X = df_imputed.drop(columns=["target"], errors="ignore")
-    return model.predict(X)
+    return model.predict(df)
 
 
 def parse_gemini_advice_to_json(advice_text, pod_name):
@@ -112,8 +122,11 @@ def parse_gemini_advice_to_json(advice_text, pod_name):
 
 def main():
     print("📥 Loading model and data...")
-    model = joblib.load(MODEL_PATH)
-    df = load_and_preprocess_data(CSV_PATH)
+    model = load_current(fallback_path=MODEL_PATH)
+    frames, hit = feature_cache.load_or_build(load_raw_data(CSV_PATH), build_features, QuantileSketches.load())
+    if hit:
+        print("⚡ Input unchanged since the last run, reusing cached features")
+    df = frames["features"]
 
     print("🤖 Running predictions...")
     predictions = predict_failures(df, model)
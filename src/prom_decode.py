@@ -0,0 +1,66 @@
+import json
+from itertools import chain
+import numpy as np
+import pandas as pd
+from series_align import SERIES_LABELS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(body):
+    """Parse a response body once, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _epoch_ms(seconds):
+    # Prometheus timestamps are float seconds with millisecond precision
+    return np.rint(seconds * 1000).astype(np.int64)
+
+
+def _frame(label, ts_ms, values, metrics, repeats=None, labels=SERIES_LABELS):
+    columns = {"timestamp": ts_ms.astype("datetime64[ms]"), label: values}
+    for name in labels:
+        column = [m.get(name) or None for m in metrics]
+        if any(v is not None for v in column):
+            column = np.array(column, dtype=object)
+            columns[name] = np.repeat(column, repeats) if repeats is not None else column
+    return pd.DataFrame(columns)
+
+
+def decode_vector(data, label, labels=SERIES_LABELS):
+    """
+    Instant-query response -> DataFrame(timestamp, <labels>, <label>).
+
+    Timestamps and values are pulled into numeric arrays in bulk: timestamps go straight
+    from float seconds to int64 epoch milliseconds (exposed as datetime64[ms]) and sample
+    strings are converted by numpy in one call, so nothing is formatted and re-parsed.
+    """
+    if isinstance(data, (bytes, str)):
+        data = loads(data)
+    result = data.get("data", {}).get("result", [])
+    if not result:
+        return pd.DataFrame()
+    n = len(result)
+    seconds = np.fromiter((item["value"][0] for item in result), dtype=np.float64, count=n)
+    values = np.array([item["value"][1] for item in result]).astype(np.float64)
+    return _frame(label, _epoch_ms(seconds), values, [item["metric"] for item in result], labels=labels)
+
+
+def decode_matrix(data, label, labels=SERIES_LABELS):
+    """Range-query response -> one long DataFrame with every series' samples"""
+    if isinstance(data, (bytes, str)):
+        data = loads(data)
+    result = [item for item in data.get("data", {}).get("result", []) if item.get("values")]
+    if not result:
+        return pd.DataFrame()
+    lengths = np.fromiter((len(item["values"]) for item in result), dtype=np.int64, count=len(result))
+    total = int(lengths.sum())
+    seconds = np.fromiter((p[0] for p in chain.from_iterable(item["values"] for item in result)),
+                          dtype=np.float64, count=total)
+    values = np.array([p[1] for p in chain.from_iterable(item["values"] for item in result)]).astype(np.float64)
+    return _frame(label, _epoch_ms(seconds), values, [item["metric"] for item in result], repeats=lengths, labels=labels)
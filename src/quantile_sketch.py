@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+import metrics_store
+from labeling import FAILURE_SOURCES
+from metrics_store import STORE_DIR
+
+SKETCH_PATH = os.path.join(STORE_DIR, "_quantile_sketches.joblib")
+THRESHOLD_QUANTILE = 0.99
+RELATIVE_ACCURACY = 0.01  # bucket width: a quantile is 0 to GAMMA - 1 (~2%) above the sample at its rank
+MIN_VALUE, MAX_VALUE = 1e-6, 1e13  # values below count as 0, values above as MAX_VALUE
+MIN_SERIES_SAMPLES = 100  # series with fewer samples use the quantile over all series
+COMPACT_DELTAS = 48  # save() rewrites the whole state after this many delta files (4h of scrape cycles)
+
+# Fixed log-spaced buckets, the same in every sketch, so merging is adding counts
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_INDEX = int(np.floor(np.log(MIN_VALUE) / np.log(GAMMA)))
+N_BUCKETS = int(np.ceil(np.log(MAX_VALUE) / np.log(GAMMA))) - MIN_INDEX + 1
+# Bucket 0 holds zeros (and anything below MIN_VALUE); bucket b covers (GAMMA^(i-1), GAMMA^i]
+# with i = b + MIN_INDEX. A quantile is reported as the upper edge of the bucket holding the
+# sample at rank floor(q * (n - 1)), so samples equal to it (e.g. integer restart counts) are
+# not above their own threshold. That sample is numpy's interpolation="lower" quantile; the
+# default linear one lies between it and the next sample and can be above the estimate.
+BUCKET_VALUES = np.r_[0.0, GAMMA ** (np.arange(1, N_BUCKETS) + MIN_INDEX)]
+
+
+def bucket_index(values):
+    """Bucket of every value; NaN (and negative) values get -1 and are not counted"""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        index = np.ceil(np.log(np.clip(values, MIN_VALUE, MAX_VALUE)) / np.log(GAMMA)) - MIN_INDEX
+        index = np.where(values > MIN_VALUE, np.clip(index, 1, N_BUCKETS - 1), 0)
+    return np.where(np.isnan(values) | (values < 0), -1, index).astype(np.int64)
+
+
+def _quantiles(counts, q):
+    """Quantile q of every sketch in `counts` (..., N_BUCKETS); NaN where a sketch is empty"""
+    cumulative = np.cumsum(counts, axis=-1, dtype=np.int64)
+    total = cumulative[..., -1]
+    rank = np.floor(q * np.maximum(total - 1, 0))
+    bucket = (cumulative > rank[..., None]).argmax(axis=-1)
+    return np.where(total > 0, BUCKET_VALUES[bucket], np.nan), total
+
+
+def _sparse_quantiles(cells, counts, n_sketches, q):
+    """
+    Quantile q of sketches 0..n_sketches-1 stored as sorted cells (sketch * N_BUCKETS + bucket)
+    with their counts; NaN where a sketch is empty. Also returns every sketch's total.
+    """
+    sketch = cells // N_BUCKETS
+    cumulative = np.cumsum(counts, dtype=np.int64)
+    total = np.bincount(sketch, weights=counts, minlength=n_sketches).astype(np.int64)
+    before = np.r_[0, cumulative][np.searchsorted(sketch, np.arange(n_sketches))]
+    rank = np.floor(q * np.maximum(total - 1, 0)).astype(np.int64)
+    # The first cell of each sketch whose running count passes its rank
+    first = np.minimum(np.searchsorted(cumulative, before + rank, side="right"), max(len(cells) - 1, 0))
+    values = BUCKET_VALUES[cells[first] % N_BUCKETS] if len(cells) else np.zeros(n_sketches)
+    return np.where(total > 0, values, np.nan), total
+
+
+class QuantileSketches:
+    """
+    Per-series log-bucket quantile sketches (DDSketch style) of the failure source columns.
+
+    Every series keeps one count per occupied bucket and column, so a new sample is one
+    increment, sketches of different partitions or workers merge by adding their counts,
+    and for samples between MIN_VALUE and MAX_VALUE any quantile comes out at most
+    GAMMA - 1 (~2%) above the exact interpolation="lower" one, never below it, however
+    heavy the tail. Counts are sparse (sorted cell ids, (series * columns + column) *
+    N_BUCKETS + bucket): a series' values only ever touch a few dozen of the N_BUCKETS
+    buckets.
+    Quantiles of all series are computed together once per change, after which asking for
+    one series' threshold is a lookup.
+
+    save() appends the counts added since the last save as a delta file next to the state
+    and rewrites the whole state only every COMPACT_DELTAS saves.
+    """
+
+    def __init__(self, columns=tuple(FAILURE_SOURCES.values()), path=SKETCH_PATH):
+        self.path = path
+        self.columns = list(columns)
+        self.keys = {}
+        self.cells = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self._tables = {}
+        self._digest = hashlib.blake2b(repr(self.columns).encode(), digest_size=16).digest()
+        self._unsaved = []  # (cells, counts) added since the last save
+        self._saved_keys = 0
+        self._deltas = 0  # delta files written since the whole state was
+
+    @classmethod
+    def load(cls, path=SKETCH_PATH):
+        """Saved sketches, or None if nothing was saved (or they used other buckets)"""
+        if not os.path.exists(path):
+            return None
+        state = joblib.load(path)
+        if state["buckets"] != (RELATIVE_ACCURACY, MIN_VALUE, MAX_VALUE) or "cells" not in state:
+            print(f"⚠️ Sketches in {path} use other buckets or an older format, ignoring them")
+            return None
+        sketches = cls(state["columns"], path=path)
+        sketches.keys = {key: slot for slot, key in enumerate(state["keys"])}
+        sketches.cells, sketches.counts, sketches._digest = state["cells"], state["counts"], state["digest"]
+        for name in sketches._delta_files(after=state["through"]):
+            delta = joblib.load(os.path.join(sketches._delta_dir, name))
+            for key in delta["keys"]:
+                sketches.keys.setdefault(key, len(sketches.keys))
+            sketches._add(delta["cells"], delta["counts"])
+            sketches._digest = delta["digest"]
+            sketches._deltas += 1
+        sketches._unsaved, sketches._saved_keys = [], len(sketches.keys)
+        return sketches
+
+    @property
+    def _delta_dir(self):
+        return self.path + ".deltas"
+
+    def _delta_files(self, after=""):
+        if not os.path.isdir(self._delta_dir):
+            return []
+        return sorted(name for name in os.listdir(self._delta_dir) if name.endswith(".joblib") and name > after)
+
+    def _dump(self, state, path):
+        tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    def save(self, full=False):
+        """Write the counts added since the last save (the whole state every COMPACT_DELTAS saves, or with `full`)"""
+        os.makedirs(self._delta_dir, exist_ok=True)
+        if full or not os.path.exists(self.path) or self._deltas >= COMPACT_DELTAS:
+            # Deltas up to `through` are in this file; a crash before they are deleted leaves them ignored
+            deltas = self._delta_files()
+            self._dump({"columns": self.columns, "buckets": (RELATIVE_ACCURACY, MIN_VALUE, MAX_VALUE),
+                        "keys": list(self.keys), "cells": self.cells, "counts": self.counts,
+                        "digest": self._digest, "through": deltas[-1] if deltas else ""}, self.path)
+            for name in deltas:
+                os.remove(os.path.join(self._delta_dir, name))
+            self._deltas = 0
+        elif self._unsaved or len(self.keys) > self._saved_keys:
+            cells, counts = self._combine(self._unsaved)
+            self._dump({"keys": list(self.keys)[self._saved_keys:], "cells": cells, "counts": counts,
+                        "digest": self._digest}, os.path.join(self._delta_dir, f"{time.time_ns():020d}.joblib"))
+            self._deltas += 1
+        self._unsaved, self._saved_keys = [], len(self.keys)
+        return self
+
+    def _slots(self, keys):
+        inverse, uniques = pd.factorize(keys)
+        known = len(self.keys)
+        slots = np.array([self.keys.setdefault(key, len(self.keys)) for key in uniques], dtype=np.int64)
+        if len(self.keys) > known:
+            self._digest = hashlib.blake2b(self._digest + repr(list(self.keys)[known:]).encode(),
+                                           digest_size=16).digest()
+        return slots[inverse]
+
+    @staticmethod
+    def _combine(parts):
+        """Sorted unique cells and summed counts of several (cells, counts)"""
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        cells, inverse = np.unique(np.concatenate([c for c, _ in parts]), return_inverse=True)
+        counts = np.zeros(len(cells), dtype=np.int64)
+        np.add.at(counts, inverse, np.concatenate([n for _, n in parts]))
+        return cells, counts
+
+    def _add(self, cells, counts):
+        """Add counts to cells (sorted and unique)"""
+        if not len(cells):
+            return
+        at = np.searchsorted(self.cells, cells)
+        found = at < len(self.cells)
+        found[found] = self.cells[at[found]] == cells[found]
+        self.counts[at[found]] += counts[found]
+        if not found.all():
+            # New buckets: insert them where they sort
+            self.cells = np.insert(self.cells, at[~found], cells[~found])
+            self.counts = np.insert(self.counts, at[~found], counts[~found])
+        if self.path is not None:
+            self._unsaved.append((cells, counts))
+        self._digest = hashlib.blake2b(self._digest + cells.tobytes() + counts.tobytes(), digest_size=16).digest()
+        self._tables.clear()
+
+    def update(self, frame):
+        """Count the samples of new rows (series + the sketched columns); order does not matter"""
+        if frame.empty:
+            return self
+        keys = frame["series"].astype(str).to_numpy() if "series" in frame.columns else np.full(len(frame), "")
+        slots = self._slots(keys)
+        parts = []
+        for j, column in enumerate(self.columns):
+            if column not in frame.columns:
+                continue
+            bucket = bucket_index(frame[column].to_numpy(dtype=np.float64))
+            counted = bucket >= 0
+            parts.append(np.unique((slots[counted] * len(self.columns) + j) * N_BUCKETS + bucket[counted],
+                                   return_counts=True))
+        self._add(*self._combine(parts))
+        return self
+
+    def merge(self, other):
+        """Add another sketch set (another partition, worker or time range) into this one"""
+        if other.columns != self.columns:
+            raise ValueError(f"cannot merge sketches of {other.columns} into {self.columns}")
+        if other.keys:
+            slots = self._slots(np.array(list(other.keys), dtype=object))
+            per_slot = len(self.columns) * N_BUCKETS
+            cells = slots[other.cells // per_slot] * per_slot + other.cells % per_slot
+            order = np.argsort(cells, kind="stable")
+            self._add(cells[order], other.counts[order])
+        return self
+
+    def table(self, q=THRESHOLD_QUANTILE):
+        """
+        (per-series quantiles, overall quantiles): one row per series slot and one column per
+        sketched column. Series with too few samples get the overall value.
+        """
+        if q not in self._tables:
+            n_columns = len(self.columns)
+            by_column = self.cells % (n_columns * N_BUCKETS)  # column * N_BUCKETS + bucket, over all series
+            overall_counts = np.bincount(by_column, weights=self.counts, minlength=n_columns * N_BUCKETS)
+            overall, _ = _quantiles(overall_counts.astype(np.int64).reshape(n_columns, N_BUCKETS), q)
+            per_series, n = _sparse_quantiles(self.cells, self.counts, len(self.keys) * n_columns, q)
+            per_series, n = per_series.reshape(-1, n_columns), n.reshape(-1, n_columns)
+            per_series = np.where(n >= MIN_SERIES_SAMPLES, per_series, overall)
+            self._tables[q] = (per_series, overall)
+        return self._tables[q]
+
+    def threshold(self, column, series=None, q=THRESHOLD_QUANTILE):
+        """Quantile q of one column for one series (overall for series=None or an unknown series)"""
+        per_series, overall = self.table(q)
+        j = self.columns.index(column)
+        slot = self.keys.get(series)
+        return float(overall[j] if slot is None else per_series[slot, j])
+
+    def thresholds(self, q=THRESHOLD_QUANTILE):
+        """Quantile q of every column over all series"""
+        _, overall = self.table(q)
+        return dict(zip(self.columns, overall.tolist()))
+
+    def row_thresholds(self, df, q=THRESHOLD_QUANTILE):
+        """{column: threshold of every row's series}, the per-row form label_failures accepts"""
+        per_series, overall = self.table(q)
+        if "series" in df.columns and self.keys:
+            slots = pd.Index(list(self.keys), dtype=object).get_indexer(df["series"].astype(str))
+        else:
+            slots = np.full(len(df), -1)
+        known = slots >= 0
+        return {
+            column: np.where(known, per_series[np.maximum(slots, 0), j] if len(per_series) else np.nan, overall[j])
+            for j, column in enumerate(self.columns)
+        }
+
+    def fingerprint(self):
+        """
+        Changes whenever any count does; used in feature cache keys. A hash chained over every
+        addition (and saved with it), so it costs nothing however many series there are.
+        """
+        return self._digest.hex()
+
+
+def sketch_thresholds(df, sketches=None, q=THRESHOLD_QUANTILE):
+    """
+    Per-row failure thresholds for `df`: quantile q of each row's series from `sketches`
+    (the scraper's full history), or from sketches of `df` itself when there are none.
+    Returns (per-row thresholds, overall thresholds) for label_failures and logging.
+    """
+    if sketches is None:
+        sketches = QuantileSketches(path=None).update(df)
+    return sketches.row_thresholds(df, q), sketches.thresholds(q)
+
+
+def alerts(df, sketches, q=THRESHOLD_QUANTILE):
+    """Rows of `df` whose value of a sketched column is above its series' quantile q"""
+    rows = []
+    thresholds = sketches.row_thresholds(df, q)
+    for column, threshold in thresholds.items():
+        if column not in df.columns:
+            continue
+        values = df[column].to_numpy(dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            above = values > threshold
+        hits = df.loc[above, [c for c in ("timestamp", "series") if c in df.columns]].copy()
+        hits["metric"] = column
+        hits["value"] = values[above]
+        hits["threshold"] = threshold[above]
+        rows.append(hits)
+    return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+
+
+def _sketch_partition(directory, columns):
+    files = [os.path.join(directory, f) for f in os.listdir(directory) if not f.startswith(".")]
+    part = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True) if files else pd.DataFrame()
+    return QuantileSketches(columns, path=None).update(part)
+
+
+def sketch_store(store_dir=STORE_DIR, start=None, end=None, columns=tuple(FAILURE_SOURCES.values()), n_jobs=-1):
+    """Sketches of the whole store: one per hourly partition, built in parallel and merged"""
+    partitions = metrics_store.list_partitions(store_dir, start, end)
+    parts = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_sketch_partition)(directory, columns) for _, directory in partitions
+    )
+    sketches = QuantileSketches(columns)
+    for part in parts:
+        sketches.merge(part)
+    return sketches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the per-series quantile sketches from the metrics store")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--start", help="first hour to include")
+    parser.add_argument("--end", help="last hour to include")
+    parser.add_argument("--out", default=SKETCH_PATH)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    args = parser.parse_args()
+
+    sketches = sketch_store(args.store, args.start, args.end, n_jobs=args.n_jobs)
+    sketches.path = args.out
+    sketches.save(full=True)
+    print(f"✅ Sketched {len(sketches.keys)} series into {args.out}")
+    print(f"📊 p{THRESHOLD_QUANTILE * 100:g} over all series → {sketches.thresholds()}")
+
+
+if __name__ == "__main__":
+    main()
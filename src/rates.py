@@ -0,0 +1,138 @@
+import re
+import numpy as np
+import pandas as pd
+from rolling_features import window_starts
+from series_align import LOOKBACK, SERIES_LABELS
+
+# Labels that tell raw counter series apart; cAdvisor splits counters by cgroup id, interface, cpu and device
+RAW_SERIES_LABELS = SERIES_LABELS + ("id", "interface", "cpu", "device")
+
+# rate(<counter>[<window>]) and avg(rate(<counter>[<window>]))
+RATE_QUERY = re.compile(r"^\s*(avg\s*\(\s*)?rate\(\s*([a-zA-Z_:][a-zA-Z0-9_:]*)\s*\[(\w+)\]\s*\)\s*(?(1)\))\s*$")
+
+
+def rate_queries(metrics):
+    """
+    {label: (counter, window, aggregate)} for every query in `metrics` that is a plain
+    rate() of a counter, or avg() of one; aggregate is "avg" or None. These can be
+    computed locally from the raw counter instead of by Prometheus.
+    """
+    found = {}
+    for label, query in metrics.items():
+        match = RATE_QUERY.match(query)
+        if match:
+            found[label] = (match.group(2), match.group(3), "avg" if match.group(1) else None)
+    return found
+
+
+def series_codes(df, by="series", time_col="timestamp"):
+    """
+    Integer series id per row: the `by` column, else every label column present. Rows
+    without any labels (bare exports like data/cpu_usage.csv) are told apart by their
+    position among the rows sharing a timestamp, which is how Prometheus orders them.
+    """
+    if by in df.columns:
+        return pd.factorize(df[by], use_na_sentinel=False)[0]
+    labels = [name for name in RAW_SERIES_LABELS if name in df.columns]
+    if labels:
+        return df.groupby(labels, dropna=False, sort=False).ngroup().to_numpy()
+    ts = df[time_col] if time_col in df.columns else pd.Series(df.index, index=df.index)
+    return ts.groupby(ts).cumcount().to_numpy()
+
+
+def per_second_rate(values, codes, ts, window=None, counter=True):
+    """
+    Rate of change per second for rows sorted by (series, time).
+
+    Between consecutive samples of a series the increase is divided by their real time
+    difference; samples sharing a timestamp give NaN, never inf. For counters, a drop
+    means the counter restarted from zero, so the increase is the new value (as in
+    Prometheus). With a `window` such as "1m" the rate at t is the increase over
+    (t - window, t] divided by the time between the first and last sample in it, i.e.
+    Prometheus' rate() without the extrapolation to the window edges.
+    """
+    n = len(values)
+    rate = np.full(n, np.nan)
+    if n < 2:
+        return rate
+    increase = np.diff(values)
+    if counter:
+        increase = np.where(increase < 0, values[1:], increase)
+    same = codes[1:] == codes[:-1]
+    elapsed = np.diff(ts) / 1e9
+
+    if window is None:
+        ok = same & (elapsed > 0) & ~np.isnan(increase)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate[1:] = np.where(ok, increase / elapsed, np.nan)
+        return rate
+
+    # Increase of every pair of neighbouring samples, summed over each row's window
+    pair = np.where(same & ~np.isnan(increase), increase, 0.0)
+    prefix = np.r_[0.0, 0.0, np.cumsum(pair)]  # prefix[i + 1] = increase from the first row to row i
+    group_start = np.maximum.accumulate(np.where(np.r_[True, ~same], np.arange(n), 0))
+    starts = window_starts(codes, ts, group_start, window)
+    rows = np.arange(n)
+    total = prefix[rows + 1] - prefix[starts + 1]
+    span = (ts - ts[starts]) / 1e9
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(span > 0, total / span, np.nan)
+
+
+def add_rates(df, columns, window=None, counter=True, by="series", time_col="timestamp"):
+    """
+    Add per-series rates of `columns` (a list, named `<column>_rate`, or {column: output
+    name}) without changing the row order. Series are sorted by time once for all columns.
+    """
+    if df.empty:
+        return df
+    names = columns if isinstance(columns, dict) else {column: f"{column}_rate" for column in columns}
+    codes = series_codes(df, by, time_col)
+    ts = np.asarray(pd.to_datetime(df[time_col] if time_col in df.columns else df.index),
+                    dtype="datetime64[ns]").view("int64")
+    order = np.lexsort((ts, codes))
+    for column, name in names.items():
+        values = df[column].to_numpy(dtype=np.float64)[order]
+        rate = per_second_rate(values, codes[order], ts[order], window, counter)
+        unsorted = np.empty(len(rate))
+        unsorted[order] = rate
+        df[name] = unsorted
+    return df
+
+
+def grid_average(df, column, step, lookback=LOOKBACK):
+    """
+    avg() across series as a Prometheus range query evaluates it: at every point t of the
+    `step` grid, the mean of each series' newest sample in (t - lookback, t]. Series
+    sampled at their own times (remote_write pushes) still average together; samples
+    already on the grid average exactly as they would per timestamp.
+    """
+    df = df.dropna(subset=[column])
+    if df.empty:
+        return pd.DataFrame({"timestamp": pd.Series(dtype="datetime64[ns]"), column: pd.Series(dtype=np.float64)})
+    step = pd.Timedelta(step)
+    grid = pd.to_datetime(df["timestamp"]).dt.ceil(step)
+    samples = pd.DataFrame({"t": grid.to_numpy(), "series": series_codes(df, by=None),
+                            "ts": pd.to_datetime(df["timestamp"]).to_numpy(), "v": df[column].to_numpy(dtype=np.float64)})
+    newest = samples.sort_values("ts", kind="stable").groupby(["t", "series"])["v"].last().unstack("series")
+    points = pd.date_range(newest.index.min(), newest.index.max(), freq=step)
+    newest = newest.reindex(points).ffill(limit=max(int(lookback / step) - 1, 0))
+    mean = newest.mean(axis=1).dropna()
+    return pd.DataFrame({"timestamp": mean.index, column: mean.to_numpy()})
+
+
+def local_rates(raw, counter, uses, step, keep_labels=SERIES_LABELS, lookback=LOOKBACK):
+    """
+    Turn one raw counter's long frame (decode_matrix with RAW_SERIES_LABELS) into the
+    long frames of every METRICS label computed from it, e.g. cpu_usage and cpu_usage_avg.
+    `uses` is {label: (window, aggregate)}; averages are taken on the `step` grid.
+    """
+    frames = {}
+    for label, (window, aggregate) in uses.items():
+        df = add_rates(raw.copy(), {counter: label}, window=pd.Timedelta(window), by=None)
+        df = df.dropna(subset=[label])
+        if aggregate == "avg":
+            frames[label] = grid_average(df, label, step, lookback)
+        else:
+            frames[label] = df[["timestamp", *[c for c in keep_labels if c in df.columns], label]]
+    return frames
@@ -0,0 +1,389 @@
+import re
+import struct
+import threading
+import time
+import numpy as np
+import pandas as pd
+from flask import Blueprint, Flask, jsonify, request
+import metrics_store
+import rollups
+from fetch_live_metrics import METRICS, SCRAPE_STEP
+from rates import RAW_SERIES_LABELS, grid_average, local_rates, rate_queries
+from series_align import LOOKBACK, SERIES_LABELS, align
+
+try:
+    import snappy
+except ImportError:
+    snappy = None
+
+BATCH_ROWS = 50000  # flush to the store once this many samples are buffered...
+FLUSH_INTERVAL = 10  # ...or once the oldest buffered sample is this many seconds old
+RECEIVER_PORT = 9201
+
+# A bare metric name (a gauge) and avg(<metric>)
+METRIC_NAME = re.compile(r"^\s*([a-zA-Z_:][a-zA-Z0-9_:]*)\s*$")
+AVG_QUERY = re.compile(r"^\s*avg\s*\(\s*([a-zA-Z_:][a-zA-Z0-9_:]*)\s*\)\s*$")
+
+
+def remote_write_columns(metrics=METRICS):
+    """Raw metric name -> METRICS label for the metrics queried as a bare name (gauges)"""
+    return {match.group(1): label for label, match in
+            ((label, METRIC_NAME.match(query)) for label, query in metrics.items()) if match}
+
+
+def remote_write_derived(metrics=METRICS):
+    """
+    Raw metric name -> {METRICS label: (rate window, aggregate)} for the labels computed from
+    pushed samples the way fetch_live_metrics computes them from scraped ones: rate() and
+    avg(rate()) of a counter (window "1m", aggregate None or "avg") and avg() of a metric
+    (window None). Queries of any other shape cannot be derived and are not received.
+    """
+    derived = {}
+    for label, (counter, window, aggregate) in rate_queries(metrics).items():
+        derived.setdefault(counter, {})[label] = (window, aggregate)
+    for label, query in metrics.items():
+        match = AVG_QUERY.match(query)
+        if match:
+            derived.setdefault(match.group(1), {})[label] = (None, "avg")
+    return derived
+
+
+# --- snappy (block format, as used by remote_write) ---
+
+def _read_varint(buf, pos):
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def snappy_decompress(data):
+    if snappy is not None:
+        return snappy.uncompress(data)
+    length, pos = _read_varint(data, 0)
+    out = bytearray()
+    while pos < len(data):
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+        if kind == 0:  # literal
+            n = tag >> 2
+            if n < 60:
+                n += 1
+            else:
+                width = n - 59
+                n = int.from_bytes(data[pos:pos + width], "little") + 1
+                pos += width
+            out += data[pos:pos + n]
+            pos += n
+            continue
+        if kind == 1:  # copy, 1-byte offset
+            n = ((tag >> 2) & 7) + 4
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        elif kind == 2:  # copy, 2-byte offset
+            n = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 2], "little")
+            pos += 2
+        else:  # copy, 4-byte offset
+            n = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 4], "little")
+            pos += 4
+        start = len(out) - offset
+        if offset >= n:
+            out += out[start:start + n]
+        else:  # overlapping copy repeats the pattern
+            for i in range(n):
+                out.append(out[start + i])
+    if len(out) != length:
+        raise ValueError(f"snappy: expected {length} bytes, got {len(out)}")
+    return bytes(out)
+
+
+def snappy_compress(data):
+    if snappy is not None:
+        return snappy.compress(data)
+    # Literal-only stream: valid snappy, just not smaller. Good enough for a replay tool.
+    out = bytearray(_varint(len(data)))
+    for i in range(0, len(data), 65536):
+        chunk = data[i:i + 65536]
+        n = len(chunk) - 1
+        if n < 60:
+            out.append(n << 2)
+        elif n < 256:
+            out += bytes((60 << 2, n))
+        else:
+            out += bytes((61 << 2,)) + n.to_bytes(2, "little")
+        out += chunk
+    return bytes(out)
+
+
+# --- protobuf (prometheus.WriteRequest) ---
+
+def _skip(buf, pos, wire_type):
+    if wire_type == 0:
+        return _read_varint(buf, pos)[1]
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 2:
+        n, pos = _read_varint(buf, pos)
+        return pos + n
+    if wire_type == 5:
+        return pos + 4
+    raise ValueError(f"unsupported protobuf wire type {wire_type}")
+
+
+def _fields(buf, pos, end):
+    """Yield (field number, wire type, value start, value end) for a message in buf[pos:end]"""
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 2:
+            n, pos = _read_varint(buf, pos)
+            yield field, wire_type, pos, pos + n
+            pos += n
+        else:
+            start = pos
+            pos = _skip(buf, pos, wire_type)
+            yield field, wire_type, start, pos
+
+
+def decode_write_request(payload, keep=None):
+    """
+    WriteRequest bytes -> list of (labels dict, timestamps ms list, values list).
+    With `keep`, series whose __name__ is not in it are skipped before their samples are decoded.
+    """
+    series = []
+    for field, _, start, end in _fields(payload, 0, len(payload)):
+        if field != 1:  # 1 = timeseries; metadata and anything newer is ignored
+            continue
+        labels, timestamps, values = {}, [], []
+        for ts_field, _, s_start, s_end in _fields(payload, start, end):
+            if ts_field == 1:  # Label
+                name = value = ""
+                for l_field, _, l_start, l_end in _fields(payload, s_start, s_end):
+                    if l_field == 1:
+                        name = payload[l_start:l_end].decode()
+                    elif l_field == 2:
+                        value = payload[l_start:l_end].decode()
+                labels[name] = value
+            elif ts_field == 2:  # Sample
+                if keep is not None and labels.get("__name__") not in keep:
+                    break
+                value, timestamp = 0.0, 0
+                for m_field, m_wire, m_start, _ in _fields(payload, s_start, s_end):
+                    if m_field == 1 and m_wire == 1:
+                        value = struct.unpack_from("<d", payload, m_start)[0]
+                    elif m_field == 2 and m_wire == 0:
+                        timestamp = _read_varint(payload, m_start)[0]
+                        if timestamp >= 1 << 63:
+                            timestamp -= 1 << 64
+                values.append(value)
+                timestamps.append(timestamp)
+        if keep is None or labels.get("__name__") in keep:
+            series.append((labels, timestamps, values))
+    return series
+
+
+def _len_field(field, body):
+    return _varint((field << 3) | 2) + _varint(len(body)) + body
+
+
+def encode_write_request(series):
+    """Inverse of decode_write_request, for the replay sender"""
+    out = bytearray()
+    for labels, timestamps, values in series:
+        body = bytearray()
+        for name in sorted(labels):
+            body += _len_field(1, _len_field(1, name.encode()) + _len_field(2, str(labels[name]).encode()))
+        for timestamp, value in zip(timestamps, values):
+            sample = _varint((1 << 3) | 1) + struct.pack("<d", value) + _varint(2 << 3) + _varint(int(timestamp) & ((1 << 64) - 1))
+            body += _len_field(2, sample)
+        out += _len_field(1, bytes(body))
+    return bytes(out)
+
+
+# --- receiver ---
+
+def to_frames(series, keep):
+    """Keep only the metrics in `keep` and turn them into {raw metric name: long frame}"""
+    grouped = {}
+    for labels, timestamps, values in series:
+        column = labels.get("__name__")
+        if column not in keep or not timestamps:
+            continue
+        grouped.setdefault(column, []).append((labels, timestamps, values))
+
+    frames = {}
+    for column, items in grouped.items():
+        lengths = [len(ts) for _, ts, _ in items]
+        frame = {
+            "timestamp": np.fromiter((t for _, ts, _ in items for t in ts), dtype=np.int64).astype("datetime64[ms]"),
+            column: np.fromiter((v for _, _, vs in items for v in vs), dtype=np.float64),
+        }
+        for name in RAW_SERIES_LABELS:
+            label_values = np.array([labels.get(name) or None for labels, _, _ in items], dtype=object)
+            if any(v is not None for v in label_values):
+                frame[name] = np.repeat(label_values, lengths)
+        frames[column] = pd.DataFrame(frame)
+    return frames
+
+
+class RemoteWriteBuffer:
+    """
+    Collects decoded samples and writes them to the metrics store in batches, as the
+    METRICS columns: gauges as they are, rates and averages derived on flush. Series
+    pushed under a METRICS label (recording rules, or a replay of recorded rows) are
+    stored as they are and take precedence over the same label derived here. Averages
+    are taken on the SCRAPE_STEP grid, since pushed series each carry their own
+    timestamps. Each metric's last rate window (and lookback, if averaged) is kept
+    between flushes, so the first samples of a batch get a full window, and a derived
+    label is written once per timestamp.
+    """
+
+    def __init__(self, store_dir=metrics_store.STORE_DIR, batch_rows=BATCH_ROWS, flush_interval=FLUSH_INTERVAL,
+                 rollup_dir=rollups.ROLLUP_DIR, metrics=METRICS):
+        self.store_dir = store_dir
+        self.rollup_dir = rollup_dir
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.columns = remote_write_columns(metrics)
+        self.derived = remote_write_derived(metrics)
+        self.recorded = set(metrics)
+        self.keep = set(self.columns) | set(self.derived) | self.recorded
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # derive() carries counter history from one flush to the next
+        self.pending = {}
+        self.rows = 0
+        self.oldest = None
+        self.flusher = None
+        self.step = f"{SCRAPE_STEP}s"  # grid the averages are taken on
+        self.history = {}  # raw metric -> its samples within the longest rate window plus, if averaged, the lookback
+        self.written = {}  # derived label -> newest timestamp written
+
+    def add(self, frames):
+        with self.lock:
+            for column, df in frames.items():
+                self.pending.setdefault(column, []).append(df)
+                self.rows += len(df)
+            if self.oldest is None and frames:
+                self.oldest = time.monotonic()
+            full = self.rows >= self.batch_rows
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self.flusher.start()
+        if full:
+            self.flush()
+
+    def _with_history(self, name, raw, lookback):
+        """`raw` after the samples of `name` kept from earlier flushes; keeps the last `lookback` of both"""
+        if name in self.history:
+            raw = pd.concat([self.history[name], raw], ignore_index=True)
+        self.history[name] = raw[raw["timestamp"] > raw["timestamp"].max() - lookback]
+        return raw
+
+    def _unwritten(self, label, df, until):
+        """The rows of a derived label not written yet, up to `until`"""
+        df = df[df["timestamp"] <= until]
+        if label in self.written:
+            df = df[df["timestamp"] > self.written[label]]
+        if df.empty:
+            return None
+        self.written[label] = df["timestamp"].max()
+        return df
+
+    def derive(self, raw):
+        """{raw metric name: long frame} -> {METRICS label: long frame}"""
+        frames = {}
+        for name, df in raw.items():
+            labels = ["timestamp", *[c for c in SERIES_LABELS if c in df.columns]]
+            if name in self.recorded:
+                continue
+            if name in self.columns:
+                label = self.columns[name]
+                frames[label] = df[labels + [name]].rename(columns={name: label})
+            uses = self.derived.get(name, {})
+            if not uses:
+                continue
+            # Rates need their window before each sample, averages the lookback before each grid point
+            averaged = any(aggregate == "avg" for _, aggregate in uses.values())
+            lookback = max([pd.Timedelta(window) for window, _ in uses.values() if window is not None],
+                           default=pd.Timedelta(0)) + (LOOKBACK if averaged else pd.Timedelta(0))
+            history = self._with_history(name, df, lookback)
+            newest = history["timestamp"].max()
+            derived = {label: grid_average(history, name, self.step).rename(columns={name: label})
+                       for label, (window, _) in uses.items() if window is None}
+            rates = {label: use for label, use in uses.items() if use[0] is not None}
+            if rates:
+                derived.update(local_rates(history, name, rates, self.step))
+            for label, frame in derived.items():
+                # The newest grid point may still miss samples of series that push a little later
+                until = newest.floor(self.step) if uses[label][1] == "avg" else newest
+                frame = self._unwritten(label, frame, until)
+                if frame is not None:
+                    frames[label] = frame
+        for name in self.recorded & set(raw):
+            df = raw[name]
+            frames[name] = df[["timestamp", *[c for c in SERIES_LABELS if c in df.columns], name]]
+        return frames
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                rows, self.rows, self.oldest = self.rows, 0, None
+            if not pending:
+                return 0
+            wide = align(self.derive({name: pd.concat(parts, ignore_index=True) for name, parts in pending.items()}))
+            if wide.empty:
+                return rows
+            rollups.ingest(wide, self.store_dir, self.rollup_dir)
+        print(f"✅ remote_write: flushed {rows} samples as {len(wide)} rows")
+        return rows
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(1)
+            if self.oldest is not None and time.monotonic() - self.oldest >= self.flush_interval:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"❌ remote_write flush failed: {e}")
+
+
+remote_write_bp = Blueprint("remote_write", __name__)
+remote_write_bp.buffer = RemoteWriteBuffer()
+
+
+@remote_write_bp.route("/api/v1/write", methods=["POST"])
+def receive():
+    try:
+        payload = request.get_data()
+        if request.headers.get("Content-Encoding", "snappy") == "snappy":
+            payload = snappy_decompress(payload)
+        keep = remote_write_bp.buffer.keep
+        frames = to_frames(decode_write_request(payload, keep=keep), keep)
+    except Exception as e:
+        return jsonify({"error": f"invalid remote_write payload: {e}"}), 400
+    remote_write_bp.buffer.add(frames)
+    return "", 204
+
+
+if __name__ == "__main__":
+    app = Flask(__name__)
+    app.register_blueprint(remote_write_bp)
+    print(f"📥 remote_write receiver on :{RECEIVER_PORT}/api/v1/write, keeping {sorted(remote_write_bp.buffer.keep)}")
+    app.run(host="0.0.0.0", port=RECEIVER_PORT, threaded=True)
@@ -0,0 +1,102 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import requests
+import metrics_store
+from remote_write import RECEIVER_PORT, encode_write_request, remote_write_derived, snappy_compress
+from series_align import SERIES_LABELS
+
+HEADERS = {
+    "Content-Encoding": "snappy",
+    "Content-Type": "application/x-protobuf",
+    "X-Prometheus-Remote-Write-Version": "0.1.0",
+}
+
+
+def to_series(df):
+    """
+    Wide recorded rows -> remote_write series named after their METRICS columns, the way a
+    recording rule pushes them. avg() columns are repeated on every row of a timestamp, so
+    they go out once per timestamp without series labels.
+    """
+    averaged = {label for uses in remote_write_derived().values() for label, (_, aggregate) in uses.items()
+                if aggregate == "avg"}
+    labels = [name for name in SERIES_LABELS if name in df.columns]
+    values = [c for c in df.select_dtypes(include=[np.number]).columns if c not in averaged]
+    ts_ms = np.asarray(pd.to_datetime(df["timestamp"]), dtype="datetime64[ms]").view("int64")
+
+    series = []
+    for column in [c for c in df.columns if c in averaged]:
+        per_ts = pd.Series(df[column].to_numpy(dtype=np.float64), index=ts_ms).dropna()
+        per_ts = per_ts[~per_ts.index.duplicated()].sort_index()
+        if not per_ts.empty:
+            series.append(({"__name__": column}, per_ts.index.tolist(), per_ts.tolist()))
+    groups = df.groupby(labels, dropna=False, sort=False).indices if labels else {(): np.arange(len(df))}
+    for key, idx in groups.items():
+        key = key if isinstance(key, tuple) else (key,)
+        base = {name: value for name, value in zip(labels, key) if isinstance(value, str) and value}
+        for column in values:
+            column_values = df[column].to_numpy(dtype=np.float64)[idx]
+            present = ~np.isnan(column_values)
+            if not present.any():
+                continue
+            series.append((
+                {"__name__": column, **base},
+                ts_ms[idx][present].tolist(),
+                column_values[present].tolist(),
+            ))
+    return series
+
+
+def batches(series, max_samples):
+    batch, size = [], 0
+    for labels, timestamps, values in series:
+        for i in range(0, len(timestamps), max_samples):
+            batch.append((labels, timestamps[i:i + max_samples], values[i:i + max_samples]))
+            size += len(timestamps[i:i + max_samples])
+            if size >= max_samples:
+                yield batch
+                batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def replay(df, url, max_samples=5000, interval=0.0):
+    session = requests.Session()
+    sent = 0
+    start = time.perf_counter()
+    for batch in batches(to_series(df), max_samples):
+        body = snappy_compress(encode_write_request(batch))
+        response = session.post(url, data=body, headers=HEADERS, timeout=30)
+        response.raise_for_status()
+        sent += sum(len(ts) for _, ts, _ in batch)
+        if interval:
+            time.sleep(interval)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Replayed {sent} samples in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):.0f} samples/s)")
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded samples into a remote_write receiver")
+    parser.add_argument("--url", default=f"http://localhost:{RECEIVER_PORT}/api/v1/write")
+    parser.add_argument("--csv", help="replay a CSV export instead of the metrics store")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--batch-samples", type=int, default=5000)
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds to wait between requests")
+    args = parser.parse_args()
+
+    if args.csv:
+        df = pd.read_csv(args.csv)
+    else:
+        df = metrics_store.read(start=args.start, end=args.end)
+    if df.empty:
+        print("⚠️ Nothing to replay.")
+        return
+    replay(df, args.url, args.batch_samples, args.interval)
+
+
+if __name__ == "__main__":
+    main()
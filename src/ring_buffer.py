@@ -0,0 +1,290 @@
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import pandas as pd
+from multiprocessing import resource_tracker, shared_memory
+from series_align import split_key
+
+RING_NAME = "k8s_metrics_ring"
+RING_CAPACITY = 120  # samples kept per series (30 minutes at a 15 s step)
+MAX_SERIES = 1024  # ~18 MB with 17 columns; Docker gives /dev/shm 64 MB unless --shm-size says otherwise
+KEY_BYTES = 512  # a full key: namespace (63) + pod (253) + container (63) + instance, as UTF-8
+VALUE_DTYPE = np.float32  # the precision the models score at; halves the block
+HEADER_WORDS = 8  # version, n_series, capacity, n_columns, max_series
+COLUMNS_BYTES = 4096  # JSON list of the metric column names
+SHM_DIR = "/dev/shm"  # where POSIX shared memory blocks show up as files (Linux)
+
+
+def _layout(capacity, n_columns, max_series):
+    """Byte offsets of every array inside the block"""
+    offsets = {}
+    pos = 0
+    for name, size in (
+        ("header", HEADER_WORDS * 8),
+        ("columns", COLUMNS_BYTES),
+        ("keys", max_series * KEY_BYTES),
+        ("count", max_series * 8),
+        ("ts", max_series * 2 * capacity * 8),
+        ("values", max_series * 2 * capacity * n_columns * np.dtype(VALUE_DTYPE).itemsize),
+    ):
+        offsets[name] = pos
+        pos += size
+    return offsets, pos
+
+
+def _attach_shm(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before 3.13 attaching registers the block with the resource tracker, which would
+        # unlink it when this process exits even though the scraper still owns it
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SeriesRing:
+    """
+    Last `capacity` samples of every series, in fixed-size arrays.
+
+    Each sample is written twice, at slot p and p + capacity, so the newest n samples of a
+    series are always one contiguous slice and windows are returned as views without
+    copying. The arrays can live in a named shared-memory block: the scraper creates it,
+    and the server attaches to it and reads windows from the same physical pages. There is
+    one writer; readers retry when the version counter shows a write in progress.
+    """
+
+    def __init__(self, buf, columns=None, capacity=None, max_series=None, shm=None):
+        self.shm = shm
+        header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=buf)
+        if columns is None:  # attaching: the layout comes from the block itself
+            capacity, n_columns, max_series = (int(x) for x in header[2:5])
+            raw = bytes(buf[HEADER_WORDS * 8:HEADER_WORDS * 8 + COLUMNS_BYTES]).rstrip(b"\0")
+            columns = json.loads(raw)
+        else:
+            header[:] = 0
+            header[2:5] = (capacity, len(columns), max_series)
+            encoded = json.dumps(list(columns)).encode()
+            buf[HEADER_WORDS * 8:HEADER_WORDS * 8 + len(encoded)] = encoded
+
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.max_series = max_series
+        offsets, _ = _layout(capacity, len(self.columns), max_series)
+        self.header = header
+        self.keys = np.ndarray((max_series,), dtype=f"S{KEY_BYTES}", buffer=buf, offset=offsets["keys"])
+        self.count = np.ndarray((max_series,), dtype=np.int64, buffer=buf, offset=offsets["count"])
+        self.ts = np.ndarray((max_series, 2 * capacity), dtype=np.int64, buffer=buf, offset=offsets["ts"])
+        self.values = np.ndarray((max_series, 2 * capacity, len(self.columns)), dtype=VALUE_DTYPE,
+                                 buffer=buf, offset=offsets["values"])
+        self._slots = {}
+        self._known = 0
+
+    @classmethod
+    def local(cls, columns, capacity=RING_CAPACITY, max_series=MAX_SERIES):
+        """Plain in-process ring"""
+        _, size = _layout(capacity, len(columns), max_series)
+        return cls(bytearray(size), columns, capacity, max_series)
+
+    @classmethod
+    def create(cls, columns, name=RING_NAME, capacity=RING_CAPACITY, max_series=MAX_SERIES):
+        """
+        Shared ring owned by this process; any previous block with the same name is replaced.
+        The block is only backed by pages when written, so a /dev/shm too small for it would
+        surface later as a SIGBUS; it is checked up front instead.
+        """
+        try:
+            stale = _attach_shm(name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        _, size = _layout(capacity, len(columns), max_series)
+        if os.path.isdir(SHM_DIR):
+            free = shutil.disk_usage(SHM_DIR).free
+            if free < size:
+                raise MemoryError(f"❌ ring needs {size / 2 ** 20:.0f} MB but {SHM_DIR} has {free / 2 ** 20:.0f} MB "
+                                  f"free; lower max_series ({max_series}) or raise the container's --shm-size")
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        ring = cls(shm.buf, columns, capacity, max_series, shm=shm)
+        atexit.register(ring.unlink)
+        return ring
+
+    @classmethod
+    def attach(cls, name=RING_NAME):
+        """Attach to the scraper's ring, or return None when no scraper is running"""
+        try:
+            shm = _attach_shm(name)
+        except FileNotFoundError:
+            return None
+        return cls(shm.buf, shm=shm)
+
+    def close(self):
+        """Detach from the block; the ring cannot be used afterwards"""
+        self.header = self.keys = self.count = self.ts = self.values = None
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:  # windows handed out by window() still use it; unmapped with them
+                pass
+
+    def unlink(self):
+        if self.shm is not None:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    @property
+    def n_series(self):
+        return int(self.header[1])
+
+    def _refresh_slots(self):
+        n = self.n_series
+        if n != self._known:
+            for slot in range(self._known, n):
+                self._slots[self.keys[slot].decode()] = slot
+            self._known = n
+
+    def slot(self, key, create=False):
+        self._refresh_slots()
+        if key in self._slots or not create:
+            return self._slots.get(key)
+        encoded = key.encode()
+        # A cut key could collide with another series and would not split back into its labels
+        if len(encoded) > KEY_BYTES:
+            raise ValueError(f"❌ series key is {len(encoded)} bytes, longer than {KEY_BYTES}: {key!r}")
+        slot = self.n_series
+        if slot >= self.max_series:
+            raise MemoryError(f"ring is full ({self.max_series} series)")
+        self.keys[slot] = encoded
+        self.header[1] = slot + 1
+        self._slots[key] = slot
+        self._known = slot + 1
+        return slot
+
+    def append(self, frame):
+        """Write a wide frame (timestamp, series, metric columns) in time order"""
+        if frame.empty:
+            return
+        frame = frame.sort_values("timestamp", kind="stable")
+        keys = frame["series"].astype(str).to_numpy() if "series" in frame.columns else np.full(len(frame), "")
+        too_long = [k for k in np.unique(keys) if len(k.encode()) > KEY_BYTES]
+        if too_long:
+            print(f"⚠️ Ring skips {len(too_long)} series with keys over {KEY_BYTES} bytes, e.g. {too_long[0]!r}")
+            kept = ~np.isin(keys, too_long)
+            frame, keys = frame[kept], keys[kept]
+            if frame.empty:
+                return
+        uniques, inverse = np.unique(keys, return_inverse=True)
+        row_slots = np.array([self.slot(k, create=True) for k in uniques], dtype=np.int64)[inverse]
+
+        # Position of every row within its series for this batch; only the newest `capacity` matter
+        order = np.argsort(row_slots, kind="stable")
+        sorted_slots = row_slots[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+        sizes = np.diff(np.r_[starts, len(order)])
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - np.repeat(starts, sizes)
+        per_row_size = np.empty(len(order), dtype=np.int64)
+        per_row_size[order] = np.repeat(sizes, sizes)
+        keep = rank >= per_row_size - self.capacity
+
+        slots, rank = row_slots[keep], rank[keep]
+        pos = (self.count[slots] + rank) % self.capacity
+        ts = np.asarray(pd.to_datetime(frame["timestamp"]), dtype="datetime64[ms]").view("int64")[keep]
+        values = np.full((len(frame), len(self.columns)), np.nan, dtype=VALUE_DTYPE)
+        for j, column in enumerate(self.columns):
+            if column in frame.columns:
+                values[:, j] = frame[column].to_numpy(dtype=VALUE_DTYPE)
+        values = values[keep]
+
+        self.header[0] += 1  # odd: write in progress
+        self.ts[slots, pos] = ts
+        self.ts[slots, pos + self.capacity] = ts
+        self.values[slots, pos] = values
+        self.values[slots, pos + self.capacity] = values
+        # Rows dropped by `keep` would have been overwritten anyway, but still advance the position
+        self.count += np.bincount(row_slots, minlength=self.max_series)
+        self.header[0] += 1
+
+    def window(self, key, n=None):
+        """Newest n samples of one series as (timestamps, values) views, oldest first"""
+        slot = self.slot(key)
+        if slot is None:
+            return None, None
+        count = int(self.count[slot])
+        n = min(n or self.capacity, count, self.capacity)
+        end = (count - 1) % self.capacity + 1 + self.capacity
+        return self.ts[slot, end - n:end], self.values[slot, end - n:end]
+
+    def latest_frame(self, n=None, retries=100):
+        """Newest n samples of every series as one DataFrame (a consistent copy), labels included"""
+        n = min(n or self.capacity, self.capacity)
+        for _ in range(retries):
+            version = int(self.header[0])
+            if version % 2:
+                time.sleep(0.001)
+                continue
+            n_series = self.n_series
+            count = self.count[:n_series].copy()
+            end = (count - 1) % self.capacity + 1 + self.capacity
+            idx = end[:, None] - n + np.arange(n)
+            slots = np.arange(n_series)[:, None]
+            ts = self.ts[slots, idx]
+            values = self.values[slots, idx]
+            if int(self.header[0]) == version:
+                break
+        else:
+            raise TimeoutError("ring kept changing while being read")
+
+        # Series with fewer than n samples only contribute the ones they have
+        valid = np.arange(n)[None, :] >= n - np.minimum(count, n)[:, None]
+        if not valid.any():
+            return pd.DataFrame()
+        keys = np.char.decode(self.keys[:n_series]).astype(object)
+        frame = pd.DataFrame(values[valid], columns=self.columns)
+        for i, (label, label_values) in enumerate(split_key(keys).items()):
+            if pd.notna(label_values).any():
+                frame.insert(i, label, np.broadcast_to(label_values[:, None], valid.shape)[valid])
+        frame.insert(0, "series", np.broadcast_to(keys[:, None], valid.shape)[valid])
+        frame.insert(0, "timestamp", ts[valid].astype("datetime64[ms]"))
+        return frame.sort_values(["timestamp", "series"], kind="stable").reset_index(drop=True)
+
+
+_attached = {}
+_attach_lock = threading.Lock()
+
+
+def _block_id(name):
+    """Inode of the shared memory block (None when there is none), or "" where it cannot be told"""
+    if not os.path.isdir(SHM_DIR):
+        return ""
+    try:
+        return os.stat(os.path.join(SHM_DIR, name)).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def attached(name=RING_NAME):
+    """
+    The scraper's ring, attached once per process and then reused (None when no scraper is
+    running). A block the scraper created anew after a restart is attached again, and the
+    mapping of the old one closed.
+    """
+    block = _block_id(name)
+    with _attach_lock:
+        cached = _attached.get(name)
+        if cached is not None and cached[0] == block:
+            return cached[1]
+        if cached is not None:
+            cached[1].close()
+            del _attached[name]
+        ring = SeriesRing.attach(name) if block is not None else None
+        if ring is not None:
+            _attached[name] = (block, ring)
+        return ring
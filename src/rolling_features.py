@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+from series_align import series_key
+
+ROLLING_WINDOW = 5  # rows, or a time span such as "5min"
+# stat -> column suffix; mean keeps the historical *_avg name
+STAT_SUFFIXES = {"mean": "avg", "max": "max", "std": "std", "slope": "slope"}
+
+
+def _epoch_ns(ts):
+    return np.asarray(pd.to_datetime(ts), dtype="datetime64[ns]").view("int64")
+
+
+def sort_by_series(df, by="series", time_col="timestamp"):
+    """
+    Sort once by (series, time). Returns the row order, the sorted series codes and times
+    (epoch ns), and for every sorted row the position where its series block starts.
+    Without a `by` column the key is built from the label columns; the index is used as
+    time when `time_col` is not a column.
+    """
+    if by in df.columns:
+        keys = df[by]  # a categorical column is factorized from its codes
+    else:
+        keys, _ = series_key(df)
+    codes, _ = pd.factorize(keys, use_na_sentinel=False)
+    ts = _epoch_ns(df[time_col] if time_col in df.columns else df.index)
+    order = np.lexsort((ts, codes))
+    codes, ts = codes[order], ts[order]
+    boundary = np.r_[True, codes[1:] != codes[:-1]]
+    group_start = np.maximum.accumulate(np.where(boundary, np.arange(len(order)), 0))
+    return order, codes, ts, group_start
+
+
+def window_starts(codes, ts, group_start, window):
+    """
+    First row of every row's window in the sorted arrays. An int window is that many rows;
+    a time span covers (t - span, t] like pandas' rolling("5min").
+    """
+    n = len(codes)
+    if isinstance(window, (int, np.integer)):
+        return np.maximum(np.arange(n) - window + 1, group_start)
+    span = pd.Timedelta(window).value
+    # Merge the window edges (code, t - span) into the sorted rows; the number of rows at or
+    # before each edge within its series is exactly where its window starts
+    all_codes = np.r_[codes, codes]
+    all_ts = np.r_[ts, ts - span]
+    is_edge = np.r_[np.zeros(n, dtype=bool), np.ones(n, dtype=bool)]
+    merged = np.lexsort((is_edge, all_ts, all_codes))
+    rows_before = np.cumsum(~is_edge[merged])
+    starts = np.empty(n, dtype=np.int64)
+    edge_pos = np.flatnonzero(is_edge[merged])
+    starts[merged[edge_pos] - n] = rows_before[edge_pos]
+    return starts
+
+
+def _window_max(values, starts):
+    """Max over [start, i] for every row with a sparse table: O(n log w) and NaN-skipping"""
+    n = len(values)
+    ends = np.arange(n)
+    lengths = ends - starts + 1
+    levels = [values]
+    while (1 << len(levels)) <= lengths.max():
+        prev, half = levels[-1], 1 << (len(levels) - 1)
+        levels.append(np.r_[np.fmax(prev[:-half], prev[half:]), prev[n - half:]])
+    k = np.floor(np.log2(lengths)).astype(np.int64)
+    table = np.stack(levels)
+    return np.fmax(table[k, starts], table[k, ends - (1 << k) + 1])
+
+
+def rolling_stats(values, codes, ts, starts, stats, min_periods=1):
+    """
+    Windowed stats of one sorted column; windows are [starts[i], i].
+
+    Count and mean come from prefix sums and max from a sparse table, so their cost does
+    not depend on the window. std and slope are taken around each row's own window mean
+    and time, one vectorized step per row offset in the longest window: prefix sums of
+    squares over a long series would cancel away the small in-window variation.
+    """
+    present = ~np.isnan(values)
+    # Centre every series on its own mean so the prefix sums stay small
+    count_by_code = np.bincount(codes, weights=present)
+    mean_by_code = np.bincount(codes, weights=np.where(present, values, 0.0)) / np.maximum(count_by_code, 1)
+    v = np.where(present, values - mean_by_code[codes], 0.0)
+    rows = np.arange(len(values))
+    end = rows + 1
+
+    def window_sum(x):
+        prefix = np.r_[0.0, np.cumsum(x)]
+        return prefix[end] - prefix[starts]
+
+    count = window_sum(present.astype(np.float64))
+    enough = count >= max(min_periods, 1)
+    out = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = window_sum(v) / count
+        if "mean" in stats:
+            out["mean"] = np.where(enough, mean + mean_by_code[codes], np.nan)
+        if "max" in stats:
+            out["max"] = np.where(enough, _window_max(np.where(present, values, np.nan), starts), np.nan)
+        if "std" in stats or "slope" in stats:
+            sdv = sdv2 = sdt = sdt2 = sdtdv = 0.0
+            for k in range(int((rows - starts).max()) + 1):
+                idx = rows - k
+                use = (idx >= starts) & present[np.maximum(idx, 0)]
+                idx = np.maximum(idx, 0)
+                dv = np.where(use, v[idx] - mean, 0.0)
+                dt = np.where(use, (ts[idx] - ts) / 1e9, 0.0)  # seconds before the current row
+                sdv, sdv2 = sdv + dv, sdv2 + dv * dv
+                sdt, sdt2, sdtdv = sdt + dt, sdt2 + dt * dt, sdtdv + dt * dv
+            if "std" in stats:
+                var = (sdv2 - sdv * sdv / count) / (count - 1)
+                out["std"] = np.where(enough & (count > 1), np.sqrt(np.maximum(var, 0.0)), np.nan)
+            if "slope" in stats:
+                # Least squares slope per second
+                denom = count * sdt2 - sdt * sdt
+                slope = (count * sdtdv - sdt * sdv) / denom
+                out["slope"] = np.where(enough & (count > 1) & (denom > 0), slope, np.nan)
+    return out
+
+
+def add_rolling_features(df, columns, window=ROLLING_WINDOW, stats=("mean",), by="series",
+                         time_col="timestamp", min_periods=1):
+    """
+    Add `<column>_<avg|max|std|slope>` computed per series over the last `window` rows
+    (or time span) of that series. Rows keep their original order; the frame is sorted
+    by series and time only once, whatever the number of columns and stats. Results are
+    computed in float64 and stored as float32 for float32 columns.
+    """
+    if df.empty or not columns:
+        return df
+    order, codes, ts, group_start = sort_by_series(df, by, time_col)
+    starts = window_starts(codes, ts, group_start, window)
+    for column in columns:
+        values = df[column].to_numpy(dtype=np.float64)[order]
+        dtype = np.float32 if df[column].dtype == np.float32 else np.float64
+        for stat, result in rolling_stats(values, codes, ts, starts, stats, min_periods).items():
+            unsorted = np.empty(len(result), dtype=dtype)
+            unsorted[order] = result
+            df[f"{column}_{STAT_SUFFIXES[stat]}"] = unsorted
+    return df
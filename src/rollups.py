@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import metrics_store
+from series_align import SERIES_LABELS, series_key
+
+# Append-only partial aggregates, one store per resolution (same layout as the metrics store,
+# coarser resolutions in daily partitions):
+#   data/rollups/5min/date=2025-04-16/hour=00/part-<ns>-<id>.parquet
+ROLLUP_DIR = os.path.join(os.path.dirname(__file__), "../data/rollups")
+RESOLUTIONS = ("1min", "5min", "1h")  # finest first
+PARTITION_FREQS = {"1min": "h", "5min": "D", "1h": "D"}
+PARTIALS = ("sum", "count", "min", "max", "last")  # per metric; mean = sum / count
+STATS = ("min", "max", "mean", "count", "last")
+COMPACT_AFTER = "2h"  # partitions that ended longer ago than this are complete and can be compacted
+
+
+def _metric_columns(df):
+    skip = {"timestamp", "series", "last_ts", *SERIES_LABELS}
+    return [c for c in df.columns if c not in skip and pd.api.types.is_numeric_dtype(df[c])]
+
+
+def partials(df, freq):
+    """
+    Partial aggregates of raw rows per series and `freq` bucket (timestamp = bucket start).
+    Partials of the same bucket from different appends combine into the exact aggregate.
+    `freq=None` keeps every timestamp as its own bucket.
+    """
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    if "series" not in df.columns:
+        df["series"], _ = series_key(df)
+    metrics = _metric_columns(df)
+    labels = [c for c in SERIES_LABELS if c in df.columns]
+    df = df.sort_values("timestamp", kind="stable")
+    df["last_ts"] = df["timestamp"]
+    if freq is not None:
+        df["timestamp"] = df["timestamp"].dt.floor(freq)
+
+    spec = {"last_ts": ("last_ts", "max")}
+    spec.update({label: (label, "first") for label in labels})
+    for metric in metrics:
+        for partial in PARTIALS:
+            spec[f"{metric}_{partial}"] = (metric, partial)  # "last" is the newest non-null value
+    return df.groupby(["series", "timestamp"], sort=False).agg(**spec).reset_index()
+
+
+def combine(parts):
+    """Merge partial aggregates of overlapping appends into one row per series and bucket"""
+    if parts.empty or not parts.duplicated(["series", "timestamp"]).any():
+        return parts  # compacted partitions: already one row per bucket
+    parts = parts.sort_values("last_ts", kind="stable")
+    grouped = parts.groupby(["series", "timestamp"], sort=False)
+    agg = {"last_ts": "max"}
+    for column in parts.columns:
+        if column in SERIES_LABELS:
+            agg[column] = "first"
+        elif column.endswith(("_sum", "_count")):
+            agg[column] = "sum"
+        elif column.endswith(("_min", "_max", "_last")):
+            agg[column] = column.rsplit("_", 1)[1]
+    return grouped.agg(agg).reset_index()
+
+
+def stats(parts, columns=None):
+    """min/max/mean/count/last of every metric from combined partial aggregates"""
+    metrics = sorted({c[:-6] for c in parts.columns if c.endswith("_count")})
+    if columns is not None:
+        metrics = [m for m in metrics if m in columns]
+    out = parts[["timestamp", "series", *[c for c in SERIES_LABELS if c in parts.columns]]].copy()
+    for metric in metrics:
+        count = parts[f"{metric}_count"].to_numpy()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[f"{metric}_mean"] = np.where(count > 0, parts[f"{metric}_sum"].to_numpy() / count, np.nan)
+        out[f"{metric}_count"] = count
+        for stat in ("min", "max", "last"):
+            out[f"{metric}_{stat}"] = parts[f"{metric}_{stat}"]
+    return out.sort_values(["timestamp", "series"], kind="stable").reset_index(drop=True)
+
+
+def append(df, rollup_dir=ROLLUP_DIR, resolutions=RESOLUTIONS):
+    """Add the partial aggregates of newly stored raw rows to every resolution"""
+    if df is None or df.empty:
+        return []
+    paths = []
+    for resolution in resolutions:
+        paths += metrics_store.append(partials(df, resolution), os.path.join(rollup_dir, resolution),
+                                      PARTITION_FREQS[resolution])
+    return paths
+
+
+def ingest(df, store_dir=metrics_store.STORE_DIR, rollup_dir=ROLLUP_DIR):
+    """
+    Store new raw rows and their rollups together; every writer goes through here so the
+    rollups never miss rows the store has. Returns the store's new files.
+    """
+    paths = metrics_store.append(df, store_dir)
+    append(df, rollup_dir)
+    return paths
+
+
+def _partition_files(directory):
+    """Parquet files of one partition, without the ones a compacted file already replaces"""
+    names = [f for f in os.listdir(directory) if f.endswith(".parquet") and not f.startswith(".")]
+    replaced = set()
+    for name in names:
+        if name.startswith("compact-"):
+            metadata = pq.read_schema(os.path.join(directory, name)).metadata or {}
+            replaced.update(json.loads(metadata.get(b"replaces", b"[]")))
+    return [os.path.join(directory, f) for f in sorted(names) if f not in replaced]
+
+
+def _read(path, columns, filters):
+    if columns is None:
+        return pq.read_table(path, filters=filters)
+    keep = {"timestamp", "series", "last_ts", *SERIES_LABELS, *[f"{m}_{p}" for m in columns for p in PARTIALS]}
+    return pq.read_table(path, columns=[c for c in pq.read_schema(path).names if c in keep], filters=filters)
+
+
+def read_partials(resolution, start=None, end=None, rollup_dir=ROLLUP_DIR, series=None, columns=None):
+    """Combined partial aggregates of one resolution with start <= bucket < end (only `columns`' metrics if given)"""
+    filters = []
+    if start is not None:
+        filters.append(("timestamp", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("timestamp", "<", pd.Timestamp(end)))
+    if series is not None:
+        filters.append(("series", "in", list(series)))
+
+    for attempt in range(3):
+        try:
+            tables = [
+                _read(path, columns, filters or None)
+                for _, directory in metrics_store.list_partitions(os.path.join(rollup_dir, resolution), start, end,
+                                                                  PARTITION_FREQS[resolution])
+                for path in _partition_files(directory)
+            ]
+            break
+        except FileNotFoundError:  # a compaction removed a file while we were listing; list again
+            time.sleep(0.05 * (attempt + 1))
+    else:
+        raise RuntimeError(f"rollups in {rollup_dir}/{resolution} kept changing while being read")
+    if not tables:
+        return pd.DataFrame()
+    return combine(pa.concat_tables(tables, promote_options="default").to_pandas())
+
+
+def pick_resolution(precision, resolutions=RESOLUTIONS):
+    """Coarsest resolution at least as fine as `precision`; None when only raw samples are fine enough"""
+    precision = pd.Timedelta(precision)
+    fine_enough = [r for r in resolutions if pd.Timedelta(r) <= precision]
+    return max(fine_enough, key=pd.Timedelta) if fine_enough else None
+
+
+def utc_now():
+    """Now as a naive UTC timestamp, the way the store's timestamps are kept"""
+    return pd.Timestamp.now(tz="UTC").tz_localize(None)
+
+
+def query(start=None, end=None, precision=None, points=None, columns=None, series=None, last=None,
+          rollup_dir=ROLLUP_DIR, store_dir=metrics_store.STORE_DIR):
+    """
+    min/max/mean/count/last of every metric per series and time bucket over [start, end).
+
+    `precision` is the coarsest bucket the caller can use (e.g. "5min"); alternatively
+    `points` asks for about that many buckets over the range. The coarsest stored
+    resolution that is fine enough is read; anything finer than RESOLUTIONS is aggregated
+    from raw samples instead. `last` is a window ending now, like "30D". Returns
+    (frame, resolution), resolution None meaning raw samples.
+    """
+    if last is not None:
+        start, end = utc_now() - pd.Timedelta(last), None
+    if precision is None and points:
+        span = (pd.Timestamp(end) if end is not None else utc_now()) - pd.Timestamp(start)
+        precision = span / points
+    resolution = pick_resolution(precision) if precision is not None else RESOLUTIONS[0]
+
+    if resolution is not None:
+        parts = read_partials(resolution, start, end, rollup_dir, series, columns)
+    else:
+        raw = metrics_store.read(store_dir, columns=None if columns is None else ["series", *SERIES_LABELS, *columns],
+                                 start=start, end=end)
+        if series is not None and not raw.empty:
+            raw = raw[raw["series"].isin(list(series))]
+        parts = partials(raw, None) if not raw.empty else pd.DataFrame()
+    if parts.empty:
+        return pd.DataFrame(), resolution
+    return stats(parts, columns), resolution
+
+
+def as_samples(rolled, stat="mean"):
+    """One row per series and bucket in the raw sample layout, each metric taken as `stat`"""
+    suffix = f"_{stat}"
+    keep = {c: c[:-len(suffix)] for c in rolled.columns if c.endswith(suffix)}
+    labels = ["timestamp", "series", *[c for c in SERIES_LABELS if c in rolled.columns]]
+    return rolled[labels + list(keep)].rename(columns=keep)
+
+
+def compact(resolution, rollup_dir=ROLLUP_DIR, before=None):
+    """
+    Merge the files of every partition that ended before `before` into one. The compacted
+    file lists the files it replaces, so readers ignore them until they are deleted right after.
+    """
+    before = pd.Timestamp(before) if before is not None else utc_now() - pd.Timedelta(COMPACT_AFTER)
+    freq = PARTITION_FREQS[resolution]
+    compacted = 0
+    for hour, directory in metrics_store.list_partitions(os.path.join(rollup_dir, resolution), freq=freq):
+        if hour + pd.Timedelta(1, freq) > before:
+            continue
+        files = _partition_files(directory)
+        if len(files) < 2:
+            continue
+        parts = combine(pa.concat_tables([pq.read_table(f) for f in files], promote_options="default").to_pandas())
+        table = pa.Table.from_pandas(parts.sort_values("timestamp", kind="stable"), preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"replaces": json.dumps([os.path.basename(f) for f in files]).encode(),
+        })
+        name = f"compact-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp_path = os.path.join(directory, "." + name)
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, os.path.join(directory, name))
+        for f in files:
+            os.remove(f)
+        compacted += 1
+    return compacted
+
+
+def rebuild(store_dir=metrics_store.STORE_DIR, rollup_dir=ROLLUP_DIR, start=None, end=None):
+    """
+    Roll up raw data already in the store, one hour partition at a time. Existing rollups
+    are deleted first (appending twice would count samples twice), so stop the scraper meanwhile.
+    """
+    if os.path.isdir(rollup_dir):
+        shutil.rmtree(rollup_dir)
+    rows = 0
+    for hour, _ in metrics_store.list_partitions(store_dir, start, end):
+        raw = metrics_store.read(store_dir, start=hour, end=hour + pd.Timedelta(1, metrics_store.PARTITION_FREQ))
+        append(raw, rollup_dir)
+        rows += len(raw)
+    for resolution in RESOLUTIONS:
+        compact(resolution, rollup_dir)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the 1min/5min/1h rollups of the metrics store")
+    parser.add_argument("command", choices=["rebuild", "compact"],
+                        help="rebuild: replace the rollups with ones of the raw data in the store; "
+                             "compact: merge the files of complete hours")
+    parser.add_argument("--start", help="with rebuild: first hour to roll up")
+    parser.add_argument("--end", help="with rebuild: last hour to roll up")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        rows = rebuild(start=args.start, end=args.end)
+        print(f"✅ Rolled up {rows} raw rows into {ROLLUP_DIR}")
+    else:
+        compacted = sum(compact(resolution) for resolution in RESOLUTIONS)
+        print(f"✅ Compacted {compacted} partition(s) in {ROLLUP_DIR}")
+
+
+if __name__ == "__main__":
+    main()
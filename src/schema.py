@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from series_align import SERIES_LABELS
+
+# Compact in-memory layout of the live metrics pipeline:
+#   metrics -> float32, labels (instance, pod, ...) -> categorical codes, timestamp -> datetime64
+METRIC_DTYPE = np.float32
+LABEL_COLUMNS = SERIES_LABELS + ("series", "id", "image", "interface", "cpu", "device", "job", "node")
+TARGET_COLUMNS = ("target",)  # left as they are (int labels)
+
+
+def clean_columns(df):
+    """The column name cleanup every pipeline step used to repeat: strip, '_' for spaces, lower case"""
+    df.columns = df.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
+    return df
+
+
+def apply_schema(df):
+    """
+    Convert `df` to the pipeline schema in place and return it: clean names, parsed
+    timestamps, categorical labels and float32 metrics. Columns already in the schema are
+    left alone, so applying it twice costs nothing.
+    """
+    clean_columns(df)
+    if "timestamp" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+    for column in df.columns:
+        dtype = df[column].dtype
+        if column in LABEL_COLUMNS or pd.api.types.is_string_dtype(dtype) or dtype == object:
+            if not isinstance(dtype, pd.CategoricalDtype) and column != "timestamp":
+                df[column] = df[column].astype("category")
+        elif column not in TARGET_COLUMNS and pd.api.types.is_numeric_dtype(dtype) and dtype != METRIC_DTYPE \
+                and not pd.api.types.is_bool_dtype(dtype):
+            df[column] = df[column].astype(METRIC_DTYPE)
+    return df
+
+
+def read_csv(path, **kwargs):
+    """A metrics CSV straight into the schema: labels are parsed as categories, metrics as float32"""
+    raw_header = pd.read_csv(path, nrows=0).columns
+    names = raw_header.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
+    dtype = {}
+    for raw, name in zip(raw_header, names):
+        if name in LABEL_COLUMNS:
+            dtype[raw] = "category"
+        elif name not in ("timestamp", *TARGET_COLUMNS):
+            dtype[raw] = METRIC_DTYPE
+    return apply_schema(pd.read_csv(path, dtype=dtype, **kwargs))
+
+
+def numeric_columns(df):
+    """Metric, feature and target columns (what select_dtypes(include=[np.number]) picks)"""
+    return [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c].dtype) and not pd.api.types.is_bool_dtype(df[c].dtype)]
+
+
+def feature_matrix(df, columns=None, impute=True):
+    """
+    One float32 matrix of the numeric columns (or `columns`) as a DataFrame, with NaNs
+    replaced by the column mean, like SimpleImputer(strategy="mean").fit_transform: columns
+    that are entirely NaN are dropped. The matrix is the only copy made; the imputation
+    happens in it.
+    """
+    columns = numeric_columns(df) if columns is None else list(columns)
+    values = np.empty((len(df), len(columns)), dtype=METRIC_DTYPE, order="F")
+    for j, column in enumerate(columns):
+        values[:, j] = df[column].to_numpy()
+    keep = list(range(len(columns)))
+    if impute:
+        keep = []
+        for j in range(len(columns)):
+            column = values[:, j]
+            missing = np.isnan(column)
+            present = len(column) - np.count_nonzero(missing)
+            if present == 0:
+                continue
+            keep.append(j)
+            if present < len(column):
+                column[missing] = np.sum(column, where=~missing, dtype=np.float64) / present
+    if len(keep) < len(columns):
+        values = values[:, keep]
+    return pd.DataFrame(values, index=df.index, columns=[columns[j] for j in keep], copy=False)
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True, index=True).sum() / 2**20
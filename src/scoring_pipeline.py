@@ -0,0 +1,90 @@
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+from tree_engine import compile_model
+
+FEATURE_DTYPE = np.float32  # both tree libraries compare feature values as float32
+
+
+class SchemaError(ValueError):
+    """Input without the columns of the frozen schema (HTTP 422 in the APIs)"""
+
+
+class ScoringPipeline:
+    """
+    The preprocessing fitted at training time and the model, saved and loaded as one object.
+
+    `features` is the frozen schema: the columns the model was fitted on, in that order.
+    transform() builds one float32 matrix in that order straight from the input's columns
+    (anything else, like labels or the target, is ignored) and fills NaNs with `fill` (the
+    training means); input without one of the features raises SchemaError. Nothing is
+    fitted on the data being scored, so a row gets the same prediction in any batch.
+    """
+
+    def __init__(self, features, fill, model):
+        self.features = list(features)
+        self.fill = np.zeros(len(self.features), dtype=FEATURE_DTYPE) if fill is None else \
+            np.nan_to_num(np.asarray(fill, dtype=FEATURE_DTYPE))  # all-NaN training columns: 0
+        self.model = model
+
+    @classmethod
+    def from_imputer(cls, imputer, model, features=None):
+        """From a SimpleImputer(strategy="mean") fitted on the training features"""
+        features = list(imputer.feature_names_in_) if features is None else list(features)
+        return cls(features, imputer.statistics_, model)
+
+    def compiled(self):
+        """The same pipeline with the model flattened by tree_engine"""
+        return ScoringPipeline(self.features, self.fill, compile_model(self.model))
+
+    def transform(self, X):
+        """
+        A DataFrame, a mapping of column -> value(s) (one request's fields) or an array
+        already in `features` order -> C-contiguous float32 matrix with no NaNs
+        """
+        if isinstance(X, (pd.DataFrame, Mapping)):
+            missing = [f for f in self.features if f not in X]
+            if missing:
+                raise SchemaError(f"❌ Missing feature(s) {', '.join(map(str, missing))}; "
+                                  f"the model needs {', '.join(map(str, self.features))}")
+            columns = [np.asarray(X[f], dtype=FEATURE_DTYPE) for f in self.features]
+            n_rows = len(X) if isinstance(X, pd.DataFrame) else max(c.size for c in columns)
+            values = np.empty((n_rows, len(self.features)), dtype=FEATURE_DTYPE)
+            for j, column in enumerate(columns):
+                values[:, j] = column
+        else:
+            # Used as it is when it already is a C-contiguous float32 matrix (a decoded batch)
+            values = np.ascontiguousarray(X, dtype=FEATURE_DTYPE)
+            if values.ndim not in (1, 2) or values.shape[-1] != len(self.features):
+                raise SchemaError(f"❌ Rows must have {len(self.features)} values, in this order: "
+                                  f"{', '.join(map(str, self.features))}")
+            values = values.reshape(-1, len(self.features))
+        missing = np.isnan(values)
+        if missing.any():
+            values = np.where(missing, self.fill, values)  # a new matrix: an input array is never modified
+        return values
+
+    def _model_input(self, X):
+        X = self.transform(X)
+        if hasattr(self.model, "feature_names_in_"):  # an sklearn model fitted on a DataFrame
+            X = pd.DataFrame(X, columns=self.features, copy=False)
+        return X
+
+    def predict(self, X, budget=None):
+        """Labels for X; an ensemble leaves out members that would not finish within `budget` seconds"""
+        X = self._model_input(X)
+        if budget is not None and hasattr(self.model, "vote"):
+            return self.model.predict(X, budget=budget)
+        return self.model.predict(X)
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(self._model_input(X))
+
+    def classify(self, X, budget=None):
+        """(labels, failure probabilities) from one pass of the model over X"""
+        X = self._model_input(X)
+        if hasattr(self.model, "vote"):
+            labels, proba, _ = self.model.vote(X, budget)
+            return labels, proba
+        proba = np.asarray(self.model.predict_proba(X))
+        return np.asarray(self.model.classes_)[np.argmax(proba, axis=1)], proba[:, 1]
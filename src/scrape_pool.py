@@ -0,0 +1,86 @@
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from prom_decode import loads
+
+# Concurrency / timeout defaults for a scrape cycle
+MAX_CONCURRENCY = 8
+QUERY_TIMEOUT = 10  # seconds, applied to every single query
+MAX_RETRIES = 2
+
+_session = None
+
+
+def make_session(pool_size=MAX_CONCURRENCY, retries=MAX_RETRIES):
+    """Build a keep-alive session whose connection pool matches the worker count"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",)
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """Shared session so connections survive across scrape cycles"""
+    global _session
+    if _session is None:
+        _session = make_session()
+    return _session
+
+
+def fetch_query(url, query, session=None, timeout=QUERY_TIMEOUT, params=None):
+    """Run one PromQL query. Returns (json_body or None, elapsed_seconds, error or None)"""
+    session = session or get_session()
+    start = time.perf_counter()
+    try:
+        response = session.get(url, params={"query": query, **(params or {})}, timeout=timeout)
+        response.raise_for_status()
+        data = loads(response.content)
+        error = None
+    except Exception as e:
+        data, error = None, e
+    return data, time.perf_counter() - start, error
+
+
+def fetch_all(url, queries, session=None, max_workers=MAX_CONCURRENCY, timeout=QUERY_TIMEOUT, params=None,
+              per_query_params=None):
+    """
+    Fetch every {label: query} in parallel through one pooled session. `params` go to every
+    query, `per_query_params` ({label: params}) only to that label's query.
+    Returns (results, timings, errors) keyed by label, in the order of `queries`.
+    """
+    per_query_params = per_query_params or {}
+    session = session or get_session()
+    workers = max(1, min(max_workers, len(queries)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            label: pool.submit(fetch_query, url, query, session, timeout,
+                               {**(params or {}), **per_query_params.get(label, {})})
+            for label, query in queries.items()
+        }
+
+    results, timings, errors = {}, {}, {}
+    for label, future in futures.items():
+        data, elapsed, error = future.result()
+        timings[label] = elapsed
+        if error is not None:
+            errors[label] = error
+        else:
+            results[label] = data
+    return results, timings, errors
+
+
+def format_timings(timings):
+    """One line per query, slowest first"""
+    return "\n".join(
+        f"   {label:<24} {elapsed * 1000:8.1f} ms"
+        for label, elapsed in sorted(timings.items(), key=lambda kv: kv[1], reverse=True)
+    )
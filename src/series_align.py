@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+# Labels that identify a series; anything else (id, image, interface, ...) is folded together
+SERIES_LABELS = ("namespace", "pod", "container", "instance")
+# How stale a sample may be and still count at a later time, as Prometheus' lookback delta
+LOOKBACK = pd.Timedelta("5min")
+
+
+def series_key(df, labels=SERIES_LABELS):
+    """Canonical 'namespace/pod/container@instance' key per row; missing labels become empty"""
+    parts = {}
+    for name in labels:
+        if name in df.columns:
+            parts[name] = df[name].astype(object).where(df[name].notna(), "").astype(str).to_numpy()
+        else:
+            parts[name] = np.full(len(df), "", dtype=object)
+    key = parts["namespace"] + "/" + parts["pod"] + "/" + parts["container"] + "@" + parts["instance"]
+    return key, parts
+
+
+def split_key(keys, labels=SERIES_LABELS):
+    """The labels back from series keys: {label: values}, None where a label was empty"""
+    parts = pd.Series(keys, dtype=object).str.extract(r"^([^/]*)/([^/]*)/([^@]*)@(.*)$")
+    parts.columns = ["namespace", "pod", "container", "instance"]
+    return {name: parts[name].where(parts[name] != "", None).to_numpy(dtype=object) for name in labels}
+
+
+def _epoch_ns(ts):
+    return np.asarray(pd.to_datetime(ts), dtype="datetime64[ns]").view("int64")
+
+
+def align(frames, labels=SERIES_LABELS, lookback=LOOKBACK):
+    """
+    Build one wide frame (one row per series key and timestamp) from {metric: long frame}.
+
+    Each long frame has a `timestamp` column, a value column named after the metric and
+    any of the label columns. Rows are placed by hashing (series key, timestamp) into a
+    preallocated matrix in a single pass, so the cost is linear in the number of samples
+    and duplicate keys can never multiply rows the way an outer merge does. Samples that
+    share a key within a metric (e.g. several network interfaces) are summed. Metrics
+    whose samples carry no labels at all (avg(...) aggregates) are broadcast to every row
+    with their newest value at or before the row's timestamp, at most `lookback` old, so
+    scalars pushed at their own times still reach the rows.
+    """
+    metric_names = list(frames)
+    keyed, scalar = [], []
+    for m, name in enumerate(metric_names):
+        df = frames[name]
+        if df is None or df.empty:
+            continue
+        key, parts = series_key(df, labels)
+        if not any((parts[label] != "").any() for label in labels):
+            scalar.append((name, df))
+        else:
+            keyed.append((m, df, key, parts))
+
+    if not keyed and not scalar:
+        return pd.DataFrame()
+
+    columns = {}
+    if keyed:
+        keys = np.concatenate([k for _, _, k, _ in keyed])
+        ts = np.concatenate([_epoch_ns(df["timestamp"]) for _, df, _, _ in keyed])
+        values = np.concatenate([df[metric_names[m]].to_numpy(dtype=np.float64) for m, df, _, _ in keyed])
+        metric_idx = np.concatenate([np.full(len(df), m, dtype=np.int64) for m, df, _, _ in keyed])
+
+        key_codes, key_uniques = pd.factorize(keys)
+        ts_codes, ts_uniques = pd.factorize(ts)
+        row_of, _ = pd.factorize(key_codes.astype(np.int64) * len(ts_uniques) + ts_codes)
+        n_rows, n_metrics = int(row_of.max()) + 1, len(metric_names)
+        # First sample of every row, used to recover its timestamp and labels
+        row_first = np.empty(n_rows, dtype=np.int64)
+        row_first[row_of[::-1]] = np.arange(len(row_of) - 1, -1, -1)
+
+        flat = row_of * n_metrics + metric_idx
+        present = ~np.isnan(values)
+        sums = np.bincount(flat[present], weights=values[present], minlength=n_rows * n_metrics)
+        counts = np.bincount(flat[present], minlength=n_rows * n_metrics).reshape(n_rows, n_metrics)
+        matrix = np.where(counts > 0, sums.reshape(n_rows, n_metrics), np.nan)
+
+        row_ts = ts[row_first]
+        columns["timestamp"] = pd.to_datetime(row_ts)
+        all_parts = {label: np.concatenate([p[label] for _, _, _, p in keyed]) for label in labels}
+        for label in labels:
+            label_values = all_parts[label][row_first]
+            if (label_values != "").any():
+                columns[label] = np.where(label_values == "", None, label_values)
+        columns["series"] = key_uniques[key_codes[row_first]]
+        for m, name in enumerate(metric_names):
+            if counts[:, m].any():
+                columns[name] = matrix[:, m]
+    else:
+        row_ts = np.unique(np.concatenate([_epoch_ns(df["timestamp"]) for _, df in scalar]))
+        columns["timestamp"] = pd.to_datetime(row_ts)
+
+    for name, df in scalar:
+        per_ts = pd.Series(df[name].to_numpy(dtype=np.float64), index=_epoch_ns(df["timestamp"])).groupby(level=0).mean()
+        scalar_ts = per_ts.index.to_numpy()
+        pos = np.searchsorted(scalar_ts, row_ts, side="right") - 1
+        hit = (pos >= 0) & (row_ts - scalar_ts[np.maximum(pos, 0)] <= lookback.value)
+        columns[name] = np.where(hit, per_ts.to_numpy()[np.maximum(pos, 0)], np.nan)
+
+    wide = pd.DataFrame(columns)
+    ordered = [c for c in wide.columns if c not in metric_names] + [c for c in metric_names if c in wide.columns]
+    return wide[ordered].sort_values(["timestamp", "series"] if "series" in wide.columns else ["timestamp"],
+                                     kind="stable").reset_index(drop=True)
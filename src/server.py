@@ -1,27 +1,40 @@
 from flask import Flask, jsonify
 from flask_socketio import SocketIO
 from flask_cors import CORS
-import pandas as pd
-import numpy as np
-import joblib
 import requests
 import os
 import random
 import time
 import threading
-from sklearn.impute import SimpleImputer
 import re
+from metrics_store import CSV_PATH, STORE_DIR, load_metrics
+from schema import apply_schema, numeric_columns
+from rolling_features import add_rolling_features
+from labeling import label_failures
 from kubernetes import client, config
 from jsonextractor import solution_implementation
+from remote_write import remote_write_bp
+from ring_buffer import attached
+from quantile_sketch import QuantileSketches, sketch_thresholds
+from feature_cache import FeatureCache, pipeline_version
+from model_registry import LiveModel
+import labeling
+import quantile_sketch
+import rolling_features
+import schema
+import series_align
 
 app = Flask(__name__)
 CORS(app)
+app.register_blueprint(remote_write_bp)  # Prometheus remote_write → metrics store
 socketio = SocketIO(app, cors_allowed_origins="*")
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-MODEL_PATH = "../models/k8s_failure_model_live.pkl"
-CSV_PATH = "../data/k8s_live_metrics.csv"
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../models/k8s_failure_model_live.pkl")
+ANALYSIS_WINDOW = "15min"  # only the most recent samples are analysed
+RING_SAMPLES = 5  # samples per series taken from the scraper's shared ring buffer
+live_model = LiveModel(fallback_path=MODEL_PATH)  # falls back to the single model file until one is published
 
 def emit_log(message):
     """Emit log message to frontend via Socket.IO"""
@@ -50,40 +63,46 @@ def get_pod_name_for_deployment(deployment_name, namespace="default"):
         emit_log(f"❌ Failed to fetch pod name: {e}")
         return None
 
-def load_and_preprocess_data(csv_path):
-    emit_log(f"📊 Loading data from {csv_path}")
-    df = pd.read_csv(csv_path)
-    df.columns = df.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
+def load_raw_data(csv_path):
+    """Recent samples plus the scraper's per-series quantile sketches of the whole history (None if it saved none)"""
+    sketches = QuantileSketches.load()
+    ring = attached()
+    if ring is not None and ring.n_series > 0:
+        # The scraper already computed the *_avg columns incrementally, so preprocessing skips them
+        emit_log(f"📊 Reading last {RING_SAMPLES} samples per series from the scraper's ring buffer")
+        return ring.latest_frame(RING_SAMPLES), sketches
+    emit_log(f"📊 Loading last {ANALYSIS_WINDOW} of data from {STORE_DIR}")
+    return load_metrics(STORE_DIR, csv_path=csv_path, last=ANALYSIS_WINDOW, typed=True), sketches
+
+def preprocess_data(df, sketches=None):
+    # Shallow copy: with copy-on-write only the columns changed below get new memory
+    df = apply_schema(df.copy(deep=False))
     df.set_index("timestamp", inplace=True)
 
-    # Rolling averages for all numeric columns
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    for col in numeric_cols:
-        if f"{col}_avg" not in df.columns:
-            df[f"{col}_avg"] = df[col].rolling(window=5, min_periods=1).mean()
+    # Per-series rolling averages for all numeric columns
+    numeric_cols = numeric_columns(df)
+    add_rolling_features(df, [col for col in numeric_cols if f"{col}_avg" not in df.columns])
 
-    # Dynamic thresholds
-    cpu_threshold = df['cpu_usage'].mean() + 2 * df['cpu_usage'].std()
-    memory_threshold = df['memory_usage'].mean() + 2 * df['memory_usage'].std()
-    restart_threshold = df['container_restarts_avg'].mean() + 2 * df['container_restarts_avg'].std()
+    # p99 of every row's own series, over the scraper's whole history when it has sketches
+    thresholds, overall = sketch_thresholds(df, sketches)
+    emit_log(f"📊 p99 thresholds (all series) → CPU: {overall['cpu_usage']:.3f}, Memory: {overall['memory_usage']:.3f}, Restarts: {overall['container_restarts_avg']:.3f}")
 
-    emit_log(f"📊 Thresholds → CPU: {cpu_threshold:.3f}, Memory: {memory_threshold:.3f}, Restarts: {restart_threshold:.3f}")
+    # Failure flags, per series so a window never spans two pods
+    label_failures(df, thresholds, group_by="series")
 
-    # Failure flags
-    df['cpu_failure'] = df['cpu_usage'].rolling(window=2).apply(lambda x: np.any(x > cpu_threshold), raw=True).fillna(False)
-    df['memory_failure'] = df['memory_usage'].rolling(window=2).apply(lambda x: np.any(x > memory_threshold), raw=True).fillna(False)
-    df['restart_failure'] = df['container_restarts_avg'].rolling(window=2).apply(lambda x: np.any(x > restart_threshold), raw=True).fillna(False)
+    return df
 
-    df['target'] = ((df['cpu_failure'] > 0) | (df['memory_failure'] > 0) | (df['restart_failure'] > 0)).astype(int)
+def load_and_preprocess_data(csv_path):
+    return preprocess_data(*load_raw_data(csv_path))
 
-    return df
+def build_features(raw, sketches):
+    # Missing values are filled by the model's own pipeline, with its training means
+    df = preprocess_data(raw, sketches)
+    return {"features": df[numeric_columns(df)]}
 
-def impute_data(df):
-    df_numeric = df.select_dtypes(include=[np.number])
-    imputer = SimpleImputer(strategy="mean")
-    df_imputed = pd.DataFrame(imputer.fit_transform(df_numeric), columns=df_numeric.columns, index=df_numeric.index)
-    return df_imputed
+# Same input data and same preprocessing code -> reuse the last result
+feature_cache = FeatureCache(pipeline_version(preprocess_data, build_features, labeling, rolling_features,
+                                              quantile_sketch, schema, series_align))
 
 def get_remediation_advice(metrics_dict):
     emit_log("🤖 Requesting Gemini remediation advice...")
@@ -106,9 +125,8 @@ def get_remediation_advice(metrics_dict):
         return f"❌ Error from Gemini: {str(e)}"
 
 def predict_failures(df, model):
-    df_imputed = impute_data(df)
-    X = df_imputed.drop(columns=["target"], errors="ignore")
-    return model.predict(X)
+    # The pipeline picks its frozen feature columns itself; labels and the target are ignored
+    return model.predict(df)
 
 def parse_gemini_advice_to_json(advice_text, pod_name):
     steps = re.findall(r"\* (.+)", advice_text)
@@ -147,8 +165,13 @@ def handle_start_analysis():
 def run_analysis():
     try:
         emit_log("📥 Loading model and data...")
-        model = joblib.load(MODEL_PATH)
-        df = load_and_preprocess_data(CSV_PATH)
+        model = live_model.get()  # the registry's current version, swapped in when a new one is promoted
+        emit_log(f"📦 Using model {model.version}")
+        raw, sketches = load_raw_data(CSV_PATH)
+        frames, hit = feature_cache.load_or_build(raw, build_features, sketches)
+        if hit:
+            emit_log("⚡ Input unchanged since the last analysis, reusing cached features")
+        df = frames["features"]
 
         emit_log("🤖 Running predictions...")
         predictions = predict_failures(df, model)
@@ -174,9 +197,9 @@ def run_analysis():
             if prediction == 1:
                 metrics_row = df.iloc[i]
                 metrics = {
-                    "cpu_usage": round(metrics_row.get("cpu_usage", 0), 3),
-                    "memory_usage": round(metrics_row.get("memory_usage", 0), 3),
-                    "container_restarts_avg": round(metrics_row.get("container_restarts_avg", 0), 3)
+                    "cpu_usage": round(float(metrics_row.get("cpu_usage", 0)), 3),
+                    "memory_usage": round(float(metrics_row.get("memory_usage", 0)), 3),
+                    "container_restarts_avg": round(float(metrics_row.get("container_restarts_avg", 0)), 3)
                 }
                 
                 # Send detailed metrics to frontend
@@ -0,0 +1,273 @@
+import argparse
+import os
+import resource
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import metrics_store
+from labeling import FAILURE_SOURCES, FIXED_THRESHOLDS, LABEL_WINDOW, label_failures
+from quantile_sketch import QuantileSketches
+from rolling_features import ROLLING_WINDOW, add_rolling_features
+from schema import LABEL_COLUMNS, METRIC_DTYPE, TARGET_COLUMNS
+from series_align import SERIES_LABELS, series_key
+
+HISTORY_CSV = os.path.join(os.path.dirname(__file__), "../data/k8s_history_metrics.csv")
+FEATURES_PATH = os.path.join(os.path.dirname(__file__), "../data/k8s_history_features.parquet")
+MAX_MEMORY_MB = 1024
+SAMPLE_ROWS = 10000  # first chunk, used to measure how much memory a row takes
+MIN_CHUNK_ROWS = 1000
+WORKING_SET = 10  # peak memory per chunk relative to its finished feature frame
+LABEL_DTYPES = {name: str for name in SERIES_LABELS + ("series",)}
+
+
+def compute_features(df, thresholds=FIXED_THRESHOLDS, window=ROLLING_WINDOW, columns=None):
+    """
+    The feature steps of the training pipeline on one frame: clean names, parse times,
+    per-series rolling averages and failure labels. `columns` fixes which columns get a
+    `*_avg` (by default every numeric column without one). `thresholds` is {column: value}
+    or QuantileSketches, whose per-series p99 is then used for every row.
+    """
+    df.columns = df.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    if "series" not in df.columns:
+        df["series"], _ = series_key(df)
+    if columns is None:
+        numeric_cols = df.select_dtypes(include=[np.number]).columns
+        columns = [col for col in numeric_cols if f"{col}_avg" not in df.columns]
+    add_rolling_features(df, columns, window)
+    if isinstance(thresholds, QuantileSketches):
+        thresholds = thresholds.row_thresholds(df)
+    label_failures(df, thresholds, group_by="series")
+    return df
+
+
+def _rss_bytes(field="VmRSS"):
+    """Current (VmRSS) or peak (VmHWM) resident set size of this process"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Not Linux: only the peak is available (and on Linux it would include the parent's)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def csv_chunks(path):
+    """
+    Generator primed with next(); send it a row count and it yields that many rows, with
+    float32 metrics as in the store and in training
+    """
+    raw_header = pd.read_csv(path, nrows=0).columns
+    names = raw_header.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
+    dtype = {raw: str if name in LABEL_DTYPES or name in LABEL_COLUMNS else METRIC_DTYPE
+             for raw, name in zip(raw_header, names) if name not in ("timestamp", *TARGET_COLUMNS)}
+    reader = pd.read_csv(path, iterator=True, dtype=dtype)
+    rows = yield
+    while True:
+        try:
+            chunk = reader.get_chunk(rows)
+        except StopIteration:
+            return
+        rows = yield chunk
+
+
+def store_chunks(store_dir=metrics_store.STORE_DIR, start=None, end=None):
+    """Same protocol as csv_chunks, reading the store one hour partition at a time (in time order)"""
+    rows = yield
+    for hour, _ in metrics_store.list_partitions(store_dir, start, end):
+        part = metrics_store.read(store_dir, start=hour, end=hour + pd.Timedelta(1, metrics_store.PARTITION_FREQ))
+        part = part.sort_values("timestamp", kind="stable").reset_index(drop=True)
+        pos = 0
+        while pos < len(part):
+            chunk = part.iloc[pos:pos + rows].copy()
+            pos += rows
+            rows = yield chunk
+
+
+def _tail(df, window, label_window):
+    """Raw rows the next chunk still needs: the last rows of every series its windows reach back to"""
+    if isinstance(window, (int, np.integer)):
+        keep = max(window, label_window) - 1
+        return df.groupby("series", sort=False).tail(keep)
+    newest = df.groupby("series", sort=False)["timestamp"].transform("max")
+    in_span = df["timestamp"] > newest - pd.Timedelta(window)
+    in_label = df.groupby("series", sort=False).cumcount(ascending=False) < label_window - 1
+    return df[in_span | in_label]
+
+
+def streaming_thresholds(source, rows, k=2):
+    """mean + k*std of every failure column over all chunks (Chan et al. merge of chunk moments)"""
+    columns = list(FAILURE_SOURCES.values())
+    n = mean = m2 = None
+    next(source)
+    while True:
+        try:
+            chunk = source.send(rows)
+        except StopIteration:
+            break
+        chunk.columns = chunk.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
+        values = chunk[columns].to_numpy(dtype=np.float64)
+        c_n = (~np.isnan(values)).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            c_mean = np.nansum(values, axis=0) / c_n
+            c_m2 = np.nansum((values - c_mean) ** 2, axis=0)
+        c_mean, c_m2 = np.nan_to_num(c_mean), np.nan_to_num(c_m2)
+        if n is None:
+            n, mean, m2 = c_n, c_mean, c_m2
+            continue
+        total = n + c_n
+        delta = c_mean - mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(total > 0, mean + delta * c_n / total, 0.0)
+            m2 = m2 + c_m2 + np.where(total > 0, delta * delta * n * c_n / total, 0.0)
+        n = total
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(m2 / (n - 1))
+    return dict(zip(columns, (mean + k * std).tolist()))
+
+
+def streaming_sketches(source, rows):
+    """Per-series quantile sketches of the failure columns, one chunk at a time"""
+    sketches = QuantileSketches(path=None)
+    next(source)
+    while True:
+        try:
+            chunk = source.send(rows)
+        except StopIteration:
+            return sketches
+        chunk.columns = chunk.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
+        if "series" not in chunk.columns:
+            chunk["series"], _ = series_key(chunk)
+        sketches.update(chunk)
+
+
+class _Writer:
+    """Chunk-by-chunk output to Parquet (one row group per chunk) or CSV"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.parquet = not path.endswith(".csv")
+        self.writer = None
+        self.schema = None
+        self.rows = 0
+
+    def write(self, df):
+        if self.parquet:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                self.schema = table.schema
+                self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression="zstd")
+            self.writer.write_table(table.cast(self.schema))
+        else:
+            df.to_csv(self.tmp_path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+
+
+def stream_features(source, out_path, thresholds=FIXED_THRESHOLDS, window=ROLLING_WINDOW,
+                    label_window=LABEL_WINDOW, max_memory_mb=MAX_MEMORY_MB, chunk_rows=None):
+    """
+    Run compute_features over `source` (csv_chunks/store_chunks) in bounded chunks and write
+    the result to `out_path` as it goes. Each chunk is processed together with the tail of
+    raw rows the previous chunks leave in every series' windows, so the output is the same
+    as one in-memory run over the whole input. Input must be in time order per series.
+
+    Without `chunk_rows`, the chunk size is derived from `max_memory_mb` (the peak RSS to
+    stay under) and the memory the first chunk's rows actually took.
+    """
+    started = time.perf_counter()
+    budget = max_memory_mb * 1024 * 1024 - _rss_bytes()
+    if budget <= 0 and chunk_rows is None:
+        raise MemoryError(f"the process already uses more than {max_memory_mb} MB")
+
+    writer = _Writer(out_path)
+    carry = None  # raw rows of the previous chunks still inside a window
+    columns = None
+    last_seen = None  # newest timestamp per series
+    rows = chunk_rows or SAMPLE_ROWS
+    n_chunks = 0
+    next(source)
+    try:
+        while True:
+            try:
+                chunk = source.send(rows)
+            except StopIteration:
+                break
+            chunk.columns = chunk.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
+            chunk["timestamp"] = pd.to_datetime(chunk["timestamp"])
+            if "series" not in chunk.columns:
+                chunk["series"], _ = series_key(chunk)
+
+            if last_seen is not None:
+                previous = chunk["series"].map(last_seen)
+                if (chunk["timestamp"] < previous).any():
+                    raise ValueError("input is not in time order per series; sort it before streaming")
+
+            n_context = 0 if carry is None else len(carry)
+            raw = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+            features = compute_features(raw.copy(), thresholds, window, columns)
+            if columns is None:
+                columns = [c[:-4] for c in features.columns if c.endswith("_avg") and c not in raw.columns]
+            writer.write(features.iloc[n_context:])
+
+            carry = _tail(raw, window, label_window)
+            newest = chunk.groupby("series", sort=False)["timestamp"].max()
+            last_seen = newest if last_seen is None else newest.combine(last_seen, max, fill_value=pd.Timestamp.min)
+            n_chunks += 1
+
+            if chunk_rows is None and n_chunks == 1:
+                per_row = features.memory_usage(deep=True).sum() / max(len(features), 1)
+                rows = max(MIN_CHUNK_ROWS, int(budget / (per_row * WORKING_SET)))
+                print(f"📏 {per_row:.0f} bytes per row → chunks of {rows} rows for a {max_memory_mb} MB budget")
+            del raw, features
+    finally:
+        writer.close()
+
+    print(f"✅ Wrote {writer.rows} rows in {n_chunks} chunks to {out_path} "
+          f"({time.perf_counter() - started:.1f}s, peak RSS {_rss_bytes('VmHWM') / 2**20:.0f} MB)")
+    return writer.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute training features over a large metrics dump in bounded memory")
+    parser.add_argument("--input", default=HISTORY_CSV, help="CSV export, or 'store' for the metrics store")
+    parser.add_argument("--start", help="with --input store: first hour to read")
+    parser.add_argument("--end", help="with --input store: last hour to read")
+    parser.add_argument("--out", default=FEATURES_PATH, help=".parquet (default) or .csv")
+    parser.add_argument("--max-memory-mb", type=int, default=MAX_MEMORY_MB, help="peak RSS to stay under")
+    parser.add_argument("--chunk-rows", type=int, help="fixed chunk size instead of one derived from --max-memory-mb")
+    parser.add_argument("--window", default=str(ROLLING_WINDOW), help="rolling window: rows or a span such as 5min")
+    parser.add_argument("--dynamic-thresholds", action="store_true",
+                        help="label with mean + 2*std over the whole input (one extra pass) instead of fixed thresholds")
+    parser.add_argument("--quantile-thresholds", action="store_true",
+                        help="label with every series' own p99 over the whole input (one extra pass)")
+    args = parser.parse_args()
+
+    window = int(args.window) if args.window.isdigit() else args.window
+
+    def source():
+        return store_chunks(start=args.start, end=args.end) if args.input == "store" else csv_chunks(args.input)
+
+    thresholds = FIXED_THRESHOLDS
+    if args.dynamic_thresholds:
+        thresholds = streaming_thresholds(source(), args.chunk_rows or 100000)
+        print(f"📊 Thresholds → {thresholds}")
+    elif args.quantile_thresholds:
+        thresholds = streaming_sketches(source(), args.chunk_rows or 100000)
+        print(f"📊 p99 over all series → {thresholds.thresholds()}")
+    stream_features(source(), args.out, thresholds, window,
+                    max_memory_mb=args.max_memory_mb, chunk_rows=args.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
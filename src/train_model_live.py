@@ -1,134 +1,504 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
-import os
 import joblib
+import pyarrow.parquet as pq
+import matplotlib
+matplotlib.use("Agg")  # headless: plots are written to files, never shown
 import matplotlib.pyplot as plt
 import seaborn as sns
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import SimpleImputer
 from sklearn.model_selection import train_test_split
+from sklearn.neighbors import NearestNeighbors
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 from imblearn.over_sampling import BorderlineSMOTE
 from xgboost import XGBClassifier
-from sklearn.impute import SimpleImputer
+import metrics_store
+import model_registry
+from ensemble import POLICIES, EnsemblePredictor
+from scoring_pipeline import ScoringPipeline
+from metrics_store import load_metrics
+from schema import LABEL_COLUMNS, apply_schema, feature_matrix, memory_mb, read_csv
+from rollups import as_samples, query
+from labeling import FIXED_THRESHOLDS
+from stream_features import compute_features
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "../models")
+MODEL_PATH = os.path.join(MODELS_DIR, "k8s_failure_model_live.pkl")
+REPORT_PATH = os.path.join(MODELS_DIR, "training_report.json")
+# Both fitted models plus what incremental retraining needs to continue from them
+STATE_PATH = os.path.join(MODELS_DIR, "k8s_failure_models_state.joblib")
+
+# Incremental retraining: every run adds trees fitted on the data that arrived since the last one
+TREES_PER_INCREMENT = 20  # random forest trees added per run (warm_start)
+ROUNDS_PER_INCREMENT = 20  # XGBoost boosting rounds added per run
+MAX_TREES = 1000  # the oldest forest trees are dropped beyond this
+MAX_ROUNDS = 1000  # the booster is refitted on the window beyond this
+MAX_AGE = "7D"  # sliding window: model parts whose data ended longer ago than this are dropped
+CONTEXT = "15min"  # samples before the new data re-read so rolling features and labels are complete
+POLICY = "hard"  # ensemble vote: both members must predict a failure, i.e. (rf + xgb) // 2
+
+
+class PhaseTimer:
+    """Wall time of every named phase, in the order they ran"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            print(f"⏱️ {name}: {self.seconds[name]:.2f}s")
+
+
+def load_data(csv_path=metrics_store.CSV_PATH, store_dir=metrics_store.STORE_DIR, precision=None, window="30D",
+              start=None):
+    """
+    Raw samples from the store (or the CSV snapshot while it is empty). With `precision`
+    (e.g. "5min") per-series bucket means from the rollups over `window` are used instead.
+    `start` keeps only samples from then on (only the partitions after it are read).
+    """
+    df = pd.DataFrame()
+    if precision:
+        if start is not None:
+            rolled, resolution = query(start=start, precision=precision, store_dir=store_dir)
+        else:
+            rolled, resolution = query(last=window, precision=precision, store_dir=store_dir)
+        df = as_samples(rolled)
+        print(f"📦 {len(df)} rows of {resolution or 'raw'} rollups since {start or f'the last {window}'}")
+    if df.empty:
+        df = load_metrics(store_dir, csv_path=csv_path, typed=True, start=start)
+    # Clean column names, parse timestamps, float32 metrics and categorical labels
+    df = apply_schema(df)
+    if start is not None and not df.empty:
+        df = df[df["timestamp"] >= pd.Timestamp(start)]  # the CSV snapshot is read whole
+    print(f"📦 {len(df)} rows, {memory_mb(df):.1f} MB in memory")
+    return df
+
+
+def label_data(df, thresholds=FIXED_THRESHOLDS, impute=True):
+    """
+    Features and failure labels; returns the feature matrix X (imputed unless `impute` is
+    False) and target y, indexed by timestamp
+    """
+    # Per-series rolling averages and failure labels (fixed thresholds: 80% CPU, 100MB memory,
+    # more than 3 restarts over a 2-sample window), the steps stream_features.py runs chunk by chunk
+    compute_features(df, thresholds)
+    df.set_index("timestamp", inplace=True)
+    # Numeric columns only (drops labels like 'instance'), as one float32 matrix with NaNs
+    # replaced by the column mean; this is the only copy of the data made for training
+    df_imputed = feature_matrix(df, impute=impute)
+    return df_imputed.drop(columns=["target"]), df_imputed["target"]
+
+
+def load_features(path):
+    """
+    X and y from a file written by stream_features.py (Parquet or CSV), i.e. history too
+    large to label in memory; only the timestamp and numeric columns are read
+    """
+    if path.endswith(".csv"):
+        df = read_csv(path)
+    else:
+        df = apply_schema(pd.read_parquet(path, columns=[c for c in pq.read_schema(path).names if c not in LABEL_COLUMNS]))
+    df.set_index("timestamp", inplace=True)
+    df = feature_matrix(df)
+    print(f"📦 {len(df)} rows of features from {path}, {memory_mb(df):.1f} MB in memory")
+    return df.drop(columns=["target"]), df["target"]
+
 
-# CSV path
-CSV_PATH = "/home/pavithra/k8s-failure-prediction/data/k8s_live_metrics.csv"
-df = pd.read_csv(CSV_PATH)
-
-# Clean column names
-df.columns = df.columns.str.strip().str.replace(r'\s+', '_', regex=True).str.lower()
-
-# Convert timestamp and set index
-df["timestamp"] = pd.to_datetime(df["timestamp"])
-df.set_index("timestamp", inplace=True)
-
-# Compute rolling averages only on numeric columns (if not already present)
-numeric_cols = df.select_dtypes(include=[np.number]).columns
-for col in numeric_cols:
-    if f"{col}_avg" not in df.columns:
-        df[f"{col}_avg"] = df[col].rolling(window=5, min_periods=1).mean()
-
-# *** Custom Logic for 'target' ***
-# Define custom conditions for failure prediction based on metrics such as CPU, Memory, and Restart Counts
-# Custom Logic for 'target' variable based on defined thresholds
-cpu_threshold = 0.8  # 80% CPU usage
-memory_threshold = 100000000  # 100MB memory usage
-restart_threshold = 3  # More than 3 restarts indicating failure# Create a boolean condition for failure based on rolling averages or specific thresholds
-df['cpu_failure'] = df['cpu_usage'].rolling(window=2).apply(lambda x: np.any(x > cpu_threshold), raw=True).fillna(False)
-df['memory_failure'] = df['memory_usage'].rolling(window=2).apply(lambda x: np.any(x > memory_threshold), raw=True).fillna(False)
-df['restart_failure'] = df['container_restarts_avg'].rolling(window=2).apply(lambda x: np.any(x > restart_threshold), raw=True).fillna(False)
-
-# Combine these conditions to form the target variable (1: Failure, 0: Normal)
-
-df['target'] = ((df['cpu_failure'] > 0) | (df['memory_failure'] > 0) | (df['restart_failure'] > 0)).astype(int)
-# Drop non-numeric columns like 'instance'
-df = df.select_dtypes(include=[np.number])
-
-# Handle missing values (NaNs) by imputation (you can also drop rows with NaNs if you prefer)
-imputer = SimpleImputer(strategy="mean")  # Use mean imputation
-df_imputed = pd.DataFrame(imputer.fit_transform(df), columns=df.columns)
-
-# Split features and target
-X = df_imputed.drop(columns=["target"])
-y = df_imputed["target"]
-
-# Handle class imbalance with BorderlineSMOTE
-# Check class distribution before applying SMOTE
-print("Class distribution before resampling:\n", y.value_counts())
-
-# Handle class imbalance with BorderlineSMOTE
-if y.value_counts().min() >= 5 and len(y.value_counts()) > 1:
-    smote = BorderlineSMOTE(sampling_strategy='auto', random_state=42)
-    X_resampled, y_resampled = smote.fit_resample(X, y)
-    print("\nClass distribution after resampling:\n", y_resampled.value_counts())
-else:
+def resample(X, y, n_jobs=-1):
+    """Balance the classes with BorderlineSMOTE when both have enough samples"""
+    print("Class distribution before resampling:\n", y.value_counts())
+    if y.value_counts().min() >= 5 and len(y.value_counts()) > 1:
+        # Same 5/10 neighbours as the defaults, with the neighbour searches on all cores
+        smote = BorderlineSMOTE(sampling_strategy='auto', random_state=42,
+                                k_neighbors=NearestNeighbors(n_neighbors=6, n_jobs=n_jobs),
+                                m_neighbors=NearestNeighbors(n_neighbors=11, n_jobs=n_jobs))
+        X_resampled, y_resampled = smote.fit_resample(X, y)
+        print("\nClass distribution after resampling:\n", y_resampled.value_counts())
+        return X_resampled, y_resampled
     # If there's only one class, don't apply SMOTE
     print("\nClass imbalance issue: One class detected. Using original data.")
-    X_resampled, y_resampled = X, y
-
-# Train/test split
-X_train, X_test, y_train, y_test = train_test_split(X_resampled, y_resampled, test_size=0.2, random_state=42)
-
-# Model 1: Random Forest
-rf = RandomForestClassifier(
-    n_estimators=300,
-    max_depth=10,
-    min_samples_split=20,
-    min_samples_leaf=10,
-    bootstrap=True,
-    random_state=42
-)
-
-# Model 2: XGBoost
-xgb = XGBClassifier(
-    n_estimators=200,
-    learning_rate=0.05,
-    max_depth=7,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    random_state=42,
-    use_label_encoder=False,  # To suppress warnings
-    eval_metric='logloss'  # Specify the evaluation metric explicitly
-)
-
-# Train models
-rf.fit(X_train, y_train)
-xgb.fit(X_train, y_train)
-
-# Predict
-y_pred_rf = rf.predict(X_test)
-y_pred_xgb = xgb.predict(X_test)
-
-# Ensemble prediction
-y_pred_ensemble = (y_pred_rf + y_pred_xgb) // 2
-
-# Accuracy
-train_acc = rf.score(X_train, y_train) * 100
-test_acc = accuracy_score(y_test, y_pred_ensemble) * 100
-print(f"\n🎯 Train Accuracy: {train_acc:.2f} %")
-print(f"🎯 Test Accuracy: {test_acc:.2f} %")
-print("\n🔹 Classification Report:\n", classification_report(y_test, y_pred_ensemble))
-
-# Save model
-MODEL_PATH = "../models/k8s_failure_model_live.pkl"
-joblib.dump(rf, MODEL_PATH)
-model = joblib.load(MODEL_PATH)
-print(f"\n✅ Model saved at {MODEL_PATH}")
-print("\n📊 Model features:\n", model.feature_names_in_)
-
-# Plot confusion matrix
-cm = confusion_matrix(y_test, y_pred_ensemble)
-plt.figure(figsize=(6, 4))
-sns.heatmap(cm, annot=True, fmt='d', cmap="Blues", xticklabels=["No Failure", "Failure"], yticklabels=["No Failure", "Failure"])
-plt.title("Confusion Matrix")
-plt.xlabel("Predicted")
-plt.ylabel("Actual")
-plt.show()
-
-# Plot feature importance
-feature_importances = pd.DataFrame({'Feature': X_train.columns, 'Importance': rf.feature_importances_})
-feature_importances = feature_importances.sort_values(by='Importance', ascending=False).head(15)
-plt.figure(figsize=(10, 6))
-sns.barplot(x='Importance', y='Feature', data=feature_importances, palette="viridis")
-plt.title("Top 15 Important Features")
-plt.show()
+    return X, y
+
+
+def split_cores(n_jobs):
+    """Cores for (random forest, XGBoost) when both are trained at the same time"""
+    total = (os.cpu_count() or 1) if n_jobs in (None, -1) else n_jobs
+    rf_jobs = max(1, total // 2)
+    return rf_jobs, max(1, total - rf_jobs)
+
+
+def make_models(n_jobs=-1):
+    rf_jobs, xgb_jobs = split_cores(n_jobs)
+    # Model 1: Random Forest
+    rf = RandomForestClassifier(
+        n_estimators=300,
+        max_depth=10,
+        min_samples_split=20,
+        min_samples_leaf=10,
+        bootstrap=True,
+        random_state=42,
+        n_jobs=rf_jobs
+    )
+    # Model 2: XGBoost
+    xgb = XGBClassifier(
+        n_estimators=200,
+        learning_rate=0.05,
+        max_depth=7,
+        subsample=0.8,
+        colsample_bytree=0.8,
+        random_state=42,
+        tree_method="hist",  # histogram-based splits, much faster than exact on large data
+        n_jobs=xgb_jobs,
+        eval_metric='logloss'  # Specify the evaluation metric explicitly
+    )
+    return rf, xgb
+
+
+def fit_parallel(models, X_train, y_train):
+    """Fit all models at once, one thread each; both libraries release the GIL while fitting"""
+    with ThreadPoolExecutor(max_workers=len(models)) as pool:
+        futures = [pool.submit(model.fit, X_train, y_train) for model in models]
+        return [future.result() for future in futures]
+
+
+def evaluate(ensemble, X_train, y_train, X_test, y_test):
+    """Scores of the ensemble exactly as it is saved and served"""
+    y_pred_ensemble = ensemble.predict(X_test)
+
+    # Accuracy
+    train_acc = accuracy_score(y_train, ensemble.predict(X_train)) * 100
+    test_acc = accuracy_score(y_test, y_pred_ensemble) * 100
+    print(f"\n🎯 Train Accuracy: {train_acc:.2f} %")
+    print(f"🎯 Test Accuracy: {test_acc:.2f} %")
+    print("\n🔹 Classification Report:\n", classification_report(y_test, y_pred_ensemble))
+    return y_pred_ensemble, {"train_accuracy": train_acc, "test_accuracy": test_acc}
+
+
+def save_plots(rf, X_train, y_test, y_pred_ensemble, plots_dir):
+    os.makedirs(plots_dir, exist_ok=True)
+    paths = []
+
+    # Plot confusion matrix
+    cm = confusion_matrix(y_test, y_pred_ensemble, labels=[0, 1])
+    plt.figure(figsize=(6, 4))
+    sns.heatmap(cm, annot=True, fmt='d', cmap="Blues", xticklabels=["No Failure", "Failure"], yticklabels=["No Failure", "Failure"])
+    plt.title("Confusion Matrix")
+    plt.xlabel("Predicted")
+    plt.ylabel("Actual")
+    paths.append(os.path.join(plots_dir, "confusion_matrix.png"))
+    plt.savefig(paths[-1], bbox_inches="tight")
+    plt.close()
+
+    # Plot feature importance
+    feature_importances = pd.DataFrame({'Feature': X_train.columns, 'Importance': rf.feature_importances_})
+    feature_importances = feature_importances.sort_values(by='Importance', ascending=False).head(15)
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x='Importance', y='Feature', data=feature_importances, hue='Feature', palette="viridis", legend=False)
+    plt.title("Top 15 Important Features")
+    paths.append(os.path.join(plots_dir, "feature_importance.png"))
+    plt.savefig(paths[-1], bbox_inches="tight")
+    plt.close()
+    return paths
+
+
+def load_state(state_path=STATE_PATH):
+    """The models and bookkeeping of the last training run, or None before the first one"""
+    if not os.path.exists(state_path):
+        return None
+    return joblib.load(state_path)
+
+
+def save_state(state, state_path=STATE_PATH):
+    """Write the state next to the model, replacing the previous one atomically"""
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    joblib.dump(state, tmp_path)
+    os.replace(tmp_path, state_path)
+
+
+def new_state(rf, xgb, X, policy=POLICY):
+    """
+    `trained_until` is the newest sample the models have seen. `rf_batches` lists
+    [trees, newest sample] per fit, oldest first, so stale trees can be dropped;
+    `xgb_until` is the newest sample the booster's first rounds were fitted on. The mean
+    imputer is fitted on the training features and saved in the model's pipeline.
+    """
+    until = X.index.max()
+    return {"rf": rf, "xgb": xgb, "features": list(X.columns), "trained_until": until,
+            "imputer": SimpleImputer(strategy="mean").fit(X), "policy": policy,
+            "rf_batches": [[len(rf.estimators_), until]], "xgb_until": until}
+
+
+def model_columns(X, state):
+    """
+    X with the models' features in training order. A feature missing from X entirely gets
+    its training mean from the saved imputer, the value the served pipeline fills in for it.
+    """
+    missing = [column for column in state["features"] if column not in X.columns]
+    X = X.reindex(columns=state["features"])
+    if missing:
+        fill = ScoringPipeline.from_imputer(state["imputer"], None, state["features"]).fill \
+            if "imputer" in state else np.zeros(len(state["features"]), dtype=np.float32)  # states saved before it
+        for column in missing:
+            X[column] = fill[state["features"].index(column)]
+    return X
+
+
+def save_models(state, model_path=MODEL_PATH, state_path=STATE_PATH, registry_dir=model_registry.REGISTRY_DIR,
+                metrics=None, info=None):
+    """
+    Save the state, and the ensemble of its models (what was evaluated) behind the fitted
+    imputer, as one pipeline with the features frozen in training order, as the model file
+    and as the registry's new current version
+    """
+    ensemble = EnsemblePredictor({"rf": state["rf"], "xgb": state["xgb"]}, state["policy"], state["features"])
+    pipeline = ScoringPipeline.from_imputer(state["imputer"], ensemble, state["features"])
+    os.makedirs(os.path.dirname(os.path.abspath(model_path)), exist_ok=True)
+    joblib.dump(pipeline, model_path)
+    save_state(state, state_path)
+    version = model_registry.publish(pipeline, metrics, registry_dir,
+                                     info={"trained_until": state["trained_until"], "policy": state["policy"],
+                                           **(info or {})})
+    model_registry.prune(registry_dir=registry_dir)
+    return version
+
+
+def grow_forest(rf, X, y, n_trees=TREES_PER_INCREMENT):
+    """Add `n_trees` trees fitted on X, y to the forest; the existing trees are kept as they are"""
+    rf.set_params(warm_start=True, n_estimators=len(rf.estimators_) + n_trees)
+    return rf.fit(X, y)
+
+
+def prune_forest(rf, batches, oldest, max_trees=MAX_TREES):
+    """Drop the oldest batches of trees whose data ended before `oldest`, or beyond `max_trees`"""
+    dropped = 0
+    while len(batches) > 1 and (batches[0][1] < oldest or sum(n for n, _ in batches) > max_trees):
+        n, _ = batches.pop(0)
+        rf.estimators_ = rf.estimators_[n:]
+        dropped += n
+    rf.n_estimators = len(rf.estimators_)
+    return dropped
+
+
+def boost(xgb, X, y, rounds=ROUNDS_PER_INCREMENT):
+    """Continue boosting `xgb` for `rounds` more rounds on X, y"""
+    more = clone(xgb).set_params(n_estimators=rounds)
+    return more.fit(X, y, xgb_model=xgb.get_booster())
+
+
+def train(csv_path=metrics_store.CSV_PATH, store_dir=metrics_store.STORE_DIR, model_path=MODEL_PATH,
+          report_path=REPORT_PATH, plots_dir=MODELS_DIR, precision=None, window="30D", n_jobs=-1,
+          state_path=STATE_PATH, registry_dir=model_registry.REGISTRY_DIR, policy=POLICY, features_path=None):
+    timer = PhaseTimer()
+    if features_path:
+        with timer.phase("load"):
+            X, y = load_features(features_path)
+    else:
+        with timer.phase("load"):
+            df = load_data(csv_path, store_dir, precision, window)
+        with timer.phase("label"):
+            X, y = label_data(df)
+            del df
+    with timer.phase("smote"):
+        X_resampled, y_resampled = resample(X, y, n_jobs)
+
+    # Train/test split
+    X_train, X_test, y_train, y_test = train_test_split(X_resampled, y_resampled, test_size=0.2, random_state=42)
+
+    with timer.phase("fit"):
+        rf, xgb = fit_parallel(make_models(n_jobs), X_train, y_train)
+    with timer.phase("evaluate"):
+        ensemble = EnsemblePredictor({"rf": rf, "xgb": xgb}, policy)
+        y_pred_ensemble, scores = evaluate(ensemble, X_train, y_train, X_test, y_test)
+
+    with timer.phase("save"):
+        version = save_models(new_state(rf, xgb, X, policy), model_path, state_path, registry_dir, scores,
+                              {"mode": "full"})
+    print(f"\n✅ Model saved at {model_path} and published as {version}")
+    print("\n📊 Model features:\n", rf.feature_names_in_)
+
+    with timer.phase("plots"):
+        plots = save_plots(rf, X_train, y_test, y_pred_ensemble, plots_dir)
+    print(f"🖼️ Plots saved: {', '.join(plots)}")
+
+    report = {
+        "mode": "full",
+        "data": {"csv": csv_path, "store": store_dir, "precision": precision, "features_file": features_path,
+                 "rows": int(len(X)), "train_rows": int(len(X_train)), "test_rows": int(len(X_test)),
+                 "features": int(X.shape[1])},
+        "model_path": model_path,
+        "model_version": version,
+        "policy": policy,
+        "plots": plots,
+        "n_jobs": n_jobs,
+        "scores": scores,
+        "phases_seconds": timer.seconds,
+        "total_seconds": sum(timer.seconds.values()),
+    }
+    write_report(report, report_path)
+    return report
+
+
+def write_report(report, report_path):
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"🧾 Training report written to {report_path}")
+
+
+def train_incremental(csv_path=metrics_store.CSV_PATH, store_dir=metrics_store.STORE_DIR, model_path=MODEL_PATH,
+                      report_path=REPORT_PATH, plots_dir=MODELS_DIR, precision=None, max_age=MAX_AGE, n_jobs=-1,
+                      state_path=STATE_PATH, registry_dir=model_registry.REGISTRY_DIR, policy=None):
+    """
+    Continue from the saved models using only the samples newer than the ones they were
+    trained on: the forest gets TREES_PER_INCREMENT more trees (warm_start) and XGBoost
+    ROUNDS_PER_INCREMENT more rounds. Sliding window: forest trees whose data ended more than
+    `max_age` before the newest sample are dropped, and once the booster's first rounds are
+    that old (or it has MAX_ROUNDS rounds) it is refitted on the last `max_age` of data.
+    The ensemble keeps the saved state's voting policy unless `policy` is given.
+    Without a saved state this is a full training run.
+    """
+    state = load_state(state_path)
+    if state is None:
+        print("⚠️ No saved models yet, training from scratch")
+        return train(csv_path, store_dir, model_path, report_path, plots_dir, precision, max_age, n_jobs, state_path,
+                     registry_dir, policy or POLICY)
+    state["policy"] = policy or state.get("policy", POLICY)
+
+    timer = PhaseTimer()
+    trained_until = state["trained_until"]
+    with timer.phase("load"):
+        df = load_data(csv_path, store_dir, precision, start=trained_until - pd.Timedelta(CONTEXT))
+    if df.empty:
+        print(f"✅ No new data since {trained_until}")
+        return None
+    with timer.phase("label"):
+        X, y = label_data(df)
+        del df
+        new = X.index > trained_until
+        X = model_columns(X[new], state)
+        y = y[new]
+    if X.empty:
+        print(f"✅ No new data since {trained_until}")
+        return None
+    if y.nunique() < 2:
+        # Both models need both classes in every fit; keep the data for the next run
+        print(f"⏳ {len(X)} new rows with a single class, waiting for more data")
+        return None
+
+    rf, xgb = state["rf"], state["xgb"]
+    newest = X.index.max()
+    oldest = newest - pd.Timedelta(max_age)
+    rf_jobs, xgb_jobs = split_cores(n_jobs)
+    rf.set_params(n_jobs=rf_jobs)
+    xgb.set_params(n_jobs=xgb_jobs)
+
+    with timer.phase("evaluate"):
+        # Test-then-train: the saved models scored on data they have not seen yet
+        y_pred_ensemble = EnsemblePredictor({"rf": rf, "xgb": xgb}, state["policy"]).predict(X)
+        scores = {"prequential_accuracy": accuracy_score(y, y_pred_ensemble) * 100}
+        print(f"🎯 Accuracy on the new data before updating: {scores['prequential_accuracy']:.2f} %")
+    with timer.phase("smote"):
+        X_resampled, y_resampled = resample(X, y, n_jobs)
+
+    rebase = state["xgb_until"] < oldest or xgb.get_booster().num_boosted_rounds() >= MAX_ROUNDS
+    with timer.phase("fit"):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            rf_future = pool.submit(grow_forest, rf, X_resampled, y_resampled)
+            xgb_future = None if rebase else pool.submit(boost, xgb, X_resampled, y_resampled)
+            rf = rf_future.result()
+            state["rf_batches"].append([TREES_PER_INCREMENT, newest])
+            dropped = prune_forest(rf, state["rf_batches"], oldest)
+            if xgb_future is not None:
+                xgb = xgb_future.result()
+    if rebase:
+        with timer.phase("rebase"):
+            # The booster's rounds build on each other, so old ones cannot be dropped: refit on the window
+            print(f"🔁 Refitting XGBoost on the samples since {oldest}")
+            window_X, window_y = label_data(load_data(csv_path, store_dir, precision, start=oldest))
+            window_X = model_columns(window_X, state)
+            xgb = make_models(n_jobs)[1].fit(*resample(window_X, window_y, n_jobs))
+            state["xgb_until"] = newest
+    print(f"🌲 Forest: {len(rf.estimators_)} trees ({dropped} stale dropped), "
+          f"XGBoost: {xgb.get_booster().num_boosted_rounds()} rounds")
+
+    with timer.phase("save"):
+        state.update(rf=rf, xgb=xgb, trained_until=newest)
+        state.setdefault("imputer", SimpleImputer(strategy="mean").fit(X))
+        version = save_models(state, model_path, state_path, registry_dir, scores, {"mode": "incremental"})
+    print(f"✅ Models updated with {len(X)} new rows up to {newest}, saved at {model_path} and published as {version}")
+
+    report = {
+        "mode": "incremental",
+        "data": {"csv": csv_path, "store": store_dir, "precision": precision, "rows": int(len(X)),
+                 "train_rows": int(len(X_resampled)), "features": int(X.shape[1]),
+                 "trained_until": newest, "max_age": max_age},
+        "model_path": model_path,
+        "state_path": state_path,
+        "model_version": version,
+        "policy": state["policy"],
+        "rf_trees": len(rf.estimators_),
+        "rf_trees_dropped": dropped,
+        "xgb_rounds": xgb.get_booster().num_boosted_rounds(),
+        "xgb_refitted": bool(rebase),
+        "n_jobs": n_jobs,
+        "scores": scores,
+        "phases_seconds": timer.seconds,
+        "total_seconds": sum(timer.seconds.values()),
+    }
+    write_report(report, report_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the failure prediction models (headless)")
+    parser.add_argument("--csv", default=metrics_store.CSV_PATH, help="CSV snapshot used while the store is empty")
+    parser.add_argument("--store", default=metrics_store.STORE_DIR, help="metrics store directory")
+    parser.add_argument("--precision", help="train on rollup bucket means of this size (e.g. 5min) instead of raw samples")
+    parser.add_argument("--window", default="30D", help="with --precision: how far back to train")
+    parser.add_argument("--features", help="train on a features file from stream_features.py instead (history too "
+                                           "large to label in memory)")
+    parser.add_argument("--model-out", default=MODEL_PATH)
+    parser.add_argument("--report", default=REPORT_PATH, help="JSON report with per-phase timings")
+    parser.add_argument("--plots-dir", default=MODELS_DIR)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="cores to use in total (-1: all)")
+    parser.add_argument("--state", default=STATE_PATH, help="saved models and bookkeeping for --incremental")
+    parser.add_argument("--registry", default=model_registry.REGISTRY_DIR, help="model registry every run publishes to")
+    parser.add_argument("--incremental", action="store_true",
+                        help="continue from the saved models with the data added since they were trained")
+    parser.add_argument("--max-age", default=MAX_AGE, help="with --incremental: sliding window of data the models keep")
+    parser.add_argument("--every", type=int, help="with --incremental: run again every this many seconds")
+    parser.add_argument("--policy", choices=POLICIES,
+                        help="how the saved ensemble combines the models: hard (both must predict a failure) or "
+                             f"soft (mean probability); default {POLICY}, or the saved one with --incremental")
+    args = parser.parse_args()
+    if args.features and args.incremental:
+        parser.error("--features trains from scratch; it cannot be combined with --incremental")
+
+    if not args.incremental:
+        train(args.csv, args.store, args.model_out, args.report, args.plots_dir, args.precision, args.window,
+              args.n_jobs, args.state, args.registry, args.policy or POLICY, args.features)
+        return
+    while True:
+        train_incremental(args.csv, args.store, args.model_out, args.report, args.plots_dir, args.precision,
+                          args.max_age, args.n_jobs, args.state, args.registry, args.policy)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
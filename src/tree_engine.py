@@ -0,0 +1,218 @@
+import json
+import numpy as np
+import pandas as pd
+
+# Rows scored per step of a batch: (rows, trees) node indices stay within the CPU caches
+BATCH_ROWS = 1024
+# With at least this many (row, tree) pairs, the ones that reached a leaf are dropped from the
+# arrays when that saves more work over the remaining levels than it costs, so shallow paths
+# do not cost as much as the deepest tree
+COMPACT_MIN = 8192
+# From this many rows a batch goes to the original model instead: its compiled traversal
+# wins once its fixed cost per call is spread over enough rows (bench_tree_engine.py, 1 core:
+# a 300-tree forest at ~2k rows, a 200-round booster at ~256 rows)
+NATIVE_MIN_ROWS = {"mean": 2048, "logistic": 256}
+
+
+class TreeEnsemble:
+    """
+    A fitted random forest or XGBoost model flattened into arrays, one entry per node of
+    every tree. Leaves point back to themselves, so all rows descend all trees together
+    for `depth` steps of array indexing, with no Python or estimator code per row or tree.
+
+    kind "mean" (random forest): probabilities = mean of the leaves' class fractions.
+    kind "logistic" (XGBoost): probability = sigmoid(base + sum of leaf values).
+    A row goes right when x > threshold (x >= threshold with `strict`, XGBoost's x < split
+    going left); NaNs go where `missing_left` says, like in the original models.
+
+    The flat arrays are for small batches (one request's rows), where the original models'
+    per-call overhead dominates; batches of NATIVE_MIN_ROWS or more are scored by `native`,
+    the original model, when it is kept.
+    """
+
+    def __init__(self, features, feature, threshold, children, missing_left, value, roots, depth,
+                 kind, strict, base=0.0, classes=(0, 1), native=None):
+        self.features = list(features)
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children  # [left, right] of node i at 2i and 2i + 1, as positions 2 * child
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.kind = kind
+        self.strict = strict
+        self.base = base
+        self.classes_ = np.asarray(classes)
+        self.native = native if hasattr(native, "predict_proba") else None
+        self.leaf = (children[0::2] == np.arange(0, len(children), 2)).repeat(2)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted binary RandomForestClassifier (or any forest of DecisionTreeClassifiers)"""
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        offsets = np.r_[0, np.cumsum([tree.node_count for tree in trees])[:-1]].astype(np.int32)
+        left = np.concatenate([tree.children_left + offset for tree, offset in zip(trees, offsets)])
+        right = np.concatenate([tree.children_right + offset for tree, offset in zip(trees, offsets)])
+        left[np.concatenate([tree.children_left == -1 for tree in trees])] = -1
+        feature = np.concatenate([tree.feature for tree in trees])
+        # Each tree's predict_proba: the leaf's class counts normalised to fractions
+        counts = np.concatenate([tree.value[:, 0, :] for tree in trees]).astype(np.float64)
+        value = counts / counts.sum(axis=1, keepdims=True)
+        missing_left = np.concatenate([np.asarray(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count)))
+                                       for tree in trees]).astype(bool)
+        # sklearn compares the float32 feature value against a float64 threshold: for float32
+        # values, x <= t is the same as x <= (t rounded down to float32)
+        threshold = np.concatenate([tree.threshold for tree in trees])
+        threshold32 = threshold.astype(np.float32)
+        above = threshold32 > threshold
+        threshold32[above] = np.nextafter(threshold32[above], np.float32(-np.inf))
+        features = getattr(model, "feature_names_in_", range(model.n_features_in_))
+        return cls(features, *_link(feature, threshold32, left, right, missing_left), value, offsets,
+                   int(max(tree.max_depth for tree in trees)), "mean", False, classes=model.classes_, native=model)
+
+    @classmethod
+    def from_xgboost(cls, model):
+        """Flatten a fitted binary:logistic XGBClassifier (or its Booster) from its JSON model"""
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        if learner["objective"]["name"] != "binary:logistic":
+            raise ValueError(f"❌ Only binary:logistic models can be flattened, not {learner['objective']['name']}")
+        trees = learner["gradient_booster"]["model"]["trees"]
+        offsets = np.r_[0, np.cumsum([len(tree["left_children"]) for tree in trees])[:-1]].astype(np.int32)
+        left = np.concatenate([np.asarray(tree["left_children"]) + offset for tree, offset in zip(trees, offsets)])
+        right = np.concatenate([np.asarray(tree["right_children"]) + offset for tree, offset in zip(trees, offsets)])
+        leaf = np.concatenate([np.asarray(tree["left_children"]) == -1 for tree in trees])
+        left[leaf] = -1
+        feature = np.concatenate([tree["split_indices"] for tree in trees])
+        # split_conditions holds the threshold of a split node and the (already scaled) value of a leaf
+        conditions = np.concatenate([tree["split_conditions"] for tree in trees]).astype(np.float32)
+        value = np.where(leaf, conditions, np.float32(0))
+        missing_left = np.concatenate([tree["default_left"] for tree in trees]).astype(bool)
+
+        # base_score is a probability ("5E-1", or "[5E-1]" in XGBoost 3); the margin starts at
+        # its logit, -logf(1 / p - 1) in float32 like XGBoost (logf rounded from the float64 log)
+        base_score = np.float32(learner["learner_model_param"]["base_score"].strip("[]"))
+        base = -np.float32(np.log(np.float64(np.float32(1) / base_score - np.float32(1))))
+        depth = max(_depth(np.asarray(tree["left_children"]), np.asarray(tree["right_children"])) for tree in trees)
+        features = booster.feature_names or range(int(learner["learner_model_param"]["num_feature"]))
+        return cls(features, *_link(feature, conditions, left, right, missing_left), value, offsets, depth,
+                   "logistic", True, base=base, native=model)
+
+    def _matrix(self, X):
+        if isinstance(X, pd.DataFrame):
+            if list(X.columns) != self.features:
+                X = X[self.features]
+            X = X.to_numpy(dtype=np.float32)
+        # float32 like both libraries: sklearn and XGBoost compare the float32 value of a feature
+        return np.ascontiguousarray(X, dtype=np.float32).reshape(-1, len(self.features))
+
+    def _leaves(self, X):
+        """Leaf node index of every tree (axis 0) for every row (axis 1) of a float32 matrix"""
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        # Nodes are tracked as 2 * index, so the next one is one lookup at position + (0 or 1)
+        position = np.repeat(2 * self.roots[:, None].astype(np.intp), n_rows, axis=1).ravel()
+        row = np.tile(np.arange(0, n_rows * n_features, n_features, dtype=np.intp), len(self.roots))
+        nan = np.isnan(flat).any()
+        out, pending = position, None  # pending: where the still descending pairs go in `out`
+        for level in range(self.depth):
+            x = flat.take(row + self.feature.take(position))
+            threshold = self.threshold.take(position)
+            right = x >= threshold if self.strict else x > threshold
+            if nan:
+                missing = np.isnan(x)
+                right[missing] = ~self.missing_left.take(position[missing])
+            position = self.children.take(position + right)
+            levels_left = self.depth - level - 1
+            if len(position) >= COMPACT_MIN and levels_left > 1:
+                done = self.leaf.take(position)
+                if np.count_nonzero(done) * levels_left > len(position):
+                    if pending is None:
+                        out, pending = position, np.arange(len(position))
+                    out[pending[done]] = position[done]
+                    position, row, pending = position[~done], row[~done], pending[~done]
+        if pending is None:
+            out = position
+        else:
+            out[pending] = position
+        return out.reshape(len(self.roots), n_rows) // 2
+
+    def _scores(self, X):
+        leaves = self._leaves(X)
+        # Summed over axis 0, tree after tree, in the order sklearn and XGBoost accumulate them
+        if self.kind == "mean":
+            return self.value.take(leaves, axis=0).sum(axis=0) / len(self.roots)
+        values = self.value.take(leaves)
+        values[0] += self.base
+        return values.sum(axis=0, dtype=np.float32)
+
+    def apply(self, X):
+        """Leaf node index of every row (axis 0) in every tree (axis 1)"""
+        X = self._matrix(X)
+        return np.concatenate([self._leaves(X[i:i + BATCH_ROWS]).T for i in range(0, max(len(X), 1), BATCH_ROWS)])
+
+    def _native_proba(self, X):
+        if isinstance(X, pd.DataFrame):
+            if list(X.columns) != self.features:
+                X = X[self.features]
+        else:
+            X = np.asarray(X).reshape(-1, len(self.features))
+            if hasattr(self.native, "feature_names_in_"):  # fitted on a DataFrame: give it the names back
+                X = pd.DataFrame(X, columns=self.features, copy=False)
+        return np.asarray(self.native.predict_proba(X))
+
+    def predict_proba(self, X):
+        if self.native is not None and np.ndim(X) == 2 and len(X) >= NATIVE_MIN_ROWS[self.kind]:
+            return self._native_proba(X)
+        return self.flat_proba(X)
+
+    def flat_proba(self, X):
+        """predict_proba through the flat arrays, whatever the batch size"""
+        X = self._matrix(X)
+        scores = np.concatenate([self._scores(X[i:i + BATCH_ROWS]) for i in range(0, max(len(X), 1), BATCH_ROWS)])
+        if self.kind == "mean":
+            return scores
+        # expf rounded from the float64 exp, as in XGBoost's sigmoid
+        positive = np.float32(1) / (np.float32(1) + np.exp(-scores.astype(np.float64)).astype(np.float32))
+        return np.column_stack([np.float32(1) - positive, positive])
+
+    def predict(self, X):
+        proba = self.predict_proba(X)
+        if self.kind == "mean":
+            return self.classes_[np.argmax(proba, axis=1)]
+        return (proba[:, 1] > 0.5).astype(np.int64)
+
+
+def _link(feature, threshold, left, right, missing_left):
+    """
+    Node arrays indexed by 2 * node (+ 1), so the evaluator never multiplies: every per-node
+    value is stored twice and children as 2 * child. Leaves (left == -1) point back to themselves.
+    """
+    leaf = left == -1
+    own = np.arange(len(left))
+    feature = np.where(leaf, 0, feature).astype(np.intp).repeat(2)
+    children = 2 * np.column_stack([np.where(leaf, own, left), np.where(leaf, own, right)]).ravel().astype(np.intp)
+    return feature, threshold.repeat(2), children, missing_left.repeat(2)
+
+
+def _depth(left, right):
+    """Longest root-to-leaf path of one tree given as child arrays (-1 for none)"""
+    depth, nodes = 0, np.array([0])
+    while True:
+        children = np.r_[left[nodes], right[nodes]]
+        nodes = children[children >= 0]
+        if not len(nodes):
+            return depth
+        depth += 1
+
+
+def compile_model(model):
+    """The flat engine for a fitted random forest or XGBoost classifier; other models are returned unchanged"""
+    if hasattr(model, "compiled"):  # an ensemble flattens its own members
+        return model.compiled()
+    if hasattr(model, "estimators_") and all(hasattr(e, "tree_") for e in model.estimators_):
+        return TreeEnsemble.from_sklearn(model)
+    if hasattr(model, "get_booster") or type(model).__name__ == "Booster":
+        return TreeEnsemble.from_xgboost(model)
+    return model
@@ -0,0 +1,72 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from metrics_store import STORE_DIR
+from series_align import series_key
+
+# {metric: {series key: epoch ms of the newest stored sample}}
+WATERMARK_PATH = os.path.join(STORE_DIR, "_watermarks.json")
+
+
+def _epoch_ms(ts):
+    return np.asarray(pd.to_datetime(ts), dtype="datetime64[ms]").view("int64")
+
+
+class Watermarks:
+    """Per metric, per series 'last timestamp stored' marks that survive restarts"""
+
+    def __init__(self, path=WATERMARK_PATH):
+        self.path = path
+        self.marks = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.marks = json.load(f)
+
+    def latest(self, metric):
+        """Newest sample stored for any series of `metric`, in epoch ms (None if never scraped)"""
+        marks = self.marks.get(metric)
+        return max(marks.values()) if marks else None
+
+    def next_start(self, metric, step, floor):
+        """
+        Start (epoch seconds) of the next range query for `metric`: one step after the newest
+        stored sample, aligned to the step grid, and never earlier than `floor`.
+        """
+        latest = self.latest(metric)
+        start = floor if latest is None else max(latest / 1000 + step, floor)
+        return int(np.ceil(start / step) * step)
+
+    def filter_new(self, metric, df):
+        """Keep only samples newer than their series' watermark, one per series and timestamp"""
+        if df.empty:
+            return df
+        keys, _ = series_key(df)
+        ts = _epoch_ms(df["timestamp"])
+        marks = self.marks.get(metric, {})
+        if marks:
+            known = pd.Index(list(marks))
+            pos = known.get_indexer(keys)
+            mark_values = np.fromiter(marks.values(), dtype=np.int64, count=len(marks))
+            mark = np.where(pos >= 0, mark_values[pos], -1)
+        else:
+            mark = np.full(len(df), -1, dtype=np.int64)
+        fresh = ts > mark
+        fresh &= ~pd.DataFrame({"k": keys, "t": ts}).duplicated().to_numpy()
+        return df[fresh]
+
+    def advance(self, metric, df):
+        if df.empty:
+            return
+        keys, _ = series_key(df)
+        newest = pd.Series(_epoch_ms(df["timestamp"])).groupby(keys).max()
+        marks = self.marks.setdefault(metric, {})
+        for key, ts in newest.items():
+            marks[key] = max(int(ts), marks.get(key, -1))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.marks, f)
+        os.replace(tmp_path, self.path)
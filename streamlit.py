@@ -8,6 +8,7 @@ import threading
 import time
 import subprocess
 sys.path.append(os.path.abspath('./src'))
+from metrics_store import load_metrics
 from jsonextractor import solution_implementation
 from predictgeministreamlit import run_predictions
 
@@ -30,12 +31,11 @@ if "prediction_done" not in st.session_state:
 # Function to load metrics from CSV
 def load_metrics_from_csv():
     try:
-        # Read metrics from the CSV file
-        df = pd.read_csv(CSV_PATH)
+        # Read metrics from the metrics store (falls back to the CSV snapshot)
+        df = load_metrics(csv_path=CSV_PATH)
         if df.empty:
-            st.warning("⚠️ The CSV file is empty or does not contain valid data.")
+            st.warning("⚠️ The metrics store is empty or does not contain valid data.")
             return pd.DataFrame()
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
         return df
     except Exception as e:
         st.error(f"❌ Error loading metrics from CSV: {e}")
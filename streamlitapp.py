@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
 import os
-from datetime import datetime
+import sys
 import threading
 import time
 import subprocess
+sys.path.append(os.path.abspath('./src'))
+from metrics_store import load_metrics
+from rollups import query
 
 # Constants
 CSV_PATH = os.path.join(os.path.dirname(__file__), "../data/k8s_live_metrics.csv")
@@ -25,12 +28,11 @@ if "prediction_done" not in st.session_state:
 # Function to load metrics from CSV
 def load_metrics_from_csv():
     try:
-        # Read metrics from the CSV file
-        df = pd.read_csv(CSV_PATH)
+        # Read metrics from the metrics store (falls back to the CSV snapshot)
+        df = load_metrics(csv_path=CSV_PATH)
         if df.empty:
-            st.warning("⚠️ The CSV file is empty or does not contain valid data.")
+            st.warning("⚠️ The metrics store is empty or does not contain valid data.")
             return pd.DataFrame()
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
         return df
     except Exception as e:
         st.error(f"❌ Error loading metrics from CSV: {e}")
@@ -110,6 +112,25 @@ def visualize_output():
 if st.button("📊 Visualize Output") and st.session_state.model_trained:
     visualize_output()
 
+# Metric history charts, read from the rollups at a resolution that fits the chart
+CHART_RANGES = {"Last hour": "1h", "Last day": "1D", "Last week": "7D", "Last 30 days": "30D"}
+CHART_POINTS = 300
+
+def show_history():
+    st.markdown("### Metrics History")
+    span = st.selectbox("Range", list(CHART_RANGES), index=1)
+    metric = st.selectbox("Metric", ["cpu_usage", "memory_usage", "network_rx", "network_tx", "filesystem_usage"])
+    rolled, resolution = query(last=CHART_RANGES[span], points=CHART_POINTS, columns=[metric])
+    if rolled.empty or f"{metric}_mean" not in rolled.columns:
+        st.info("No rolled-up metrics for this range yet.")
+        return
+    chart = rolled.pivot_table(index="timestamp", columns="series", values=f"{metric}_mean")
+    st.line_chart(chart)
+    st.caption(f"{resolution or 'raw'} buckets, {len(rolled)} rows")
+
+if st.checkbox("📈 Show metrics history"):
+    show_history()
+
 # Prediction logic with timeout handling
 def run_prediction():
     if not st.session_state.model_trained:
@@ -0,0 +1,103 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+import metrics_store
+from fetch_live_metrics import METRICS
+from remote_write import RemoteWriteBuffer, remote_write_bp, snappy_compress, encode_write_request
+from remote_write_replay import HEADERS, batches, to_series
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data/k8s_live_metrics.csv")
+
+
+@pytest.fixture
+def receiver(tmp_path, monkeypatch):
+    buffer = RemoteWriteBuffer(store_dir=str(tmp_path / "store"), rollup_dir=str(tmp_path / "rollups"),
+                               batch_rows=10 ** 9, flush_interval=3600)
+    monkeypatch.setattr(remote_write_bp, "buffer", buffer)
+    app = Flask(__name__)
+    app.register_blueprint(remote_write_bp)
+    return app.test_client(), buffer
+
+
+def push(client, df, max_samples=500):
+    for batch in batches(to_series(df), max_samples):
+        response = client.post("/api/v1/write", data=snappy_compress(encode_write_request(batch)), headers=HEADERS)
+        assert response.status_code == 204
+
+
+def recorded(n_pods=3, n_steps=20):
+    """Wide rows as fetch_live_metrics records them: every METRICS column, avg columns per timestamp"""
+    rng = np.random.default_rng(0)
+    ts = pd.date_range("2026-01-05 10:00", periods=n_steps, freq="15s")
+    df = pd.DataFrame({
+        "timestamp": np.repeat(ts, n_pods),
+        "namespace": "default",
+        "pod": np.tile([f"pod-{i}" for i in range(n_pods)], n_steps),
+        "container": "app",
+        "instance": "node-1",
+    })
+    for column in METRICS:
+        if column.endswith("_avg"):
+            df[column] = np.repeat(rng.random(n_steps), n_pods)
+        else:
+            df[column] = rng.random(len(df))
+    return df
+
+
+def test_replayed_rows_land_in_the_store(receiver):
+    client, buffer = receiver
+    df = recorded()
+    push(client, df)
+    buffer.flush()
+    stored = metrics_store.read(buffer.store_dir).sort_values(["timestamp", "pod"]).reset_index(drop=True)
+    assert len(stored) == len(df)
+    for column in METRICS:
+        np.testing.assert_allclose(stored[column].to_numpy(dtype=np.float64), df[column].to_numpy(), err_msg=column)
+
+
+def test_replayed_export_keeps_every_column(receiver):
+    client, buffer = receiver
+    df = pd.read_csv(CSV_PATH)
+    push(client, df)
+    buffer.flush()
+    stored = metrics_store.read(buffer.store_dir)
+    for column in df.columns.drop(["timestamp", "instance"]):
+        assert stored[column].notna().all(), column
+    for column in ("cpu_usage_avg", "memory_usage_avg", "container_restarts_avg"):
+        assert stored[column].iloc[0] == pytest.approx(df[column].iloc[0])
+
+
+def test_unaligned_pushes_average_on_the_step_grid(receiver):
+    """Every pod and kube-state-metrics push at their own offsets; averages still combine them"""
+    client, buffer = receiver
+    start = int(pd.Timestamp("2026-01-05 10:00").value // 10 ** 6)
+    pods, steps = range(3), np.arange(40)
+    series = []
+    for pod in pods:
+        labels = {"namespace": "default", "pod": f"pod-{pod}", "container": "app", "instance": "node-1"}
+        ts = (start + steps * 15000 + 3000 + pod * 4000).tolist()
+        series.append(({"__name__": "container_memory_usage_bytes", **labels}, ts, (100.0 * pod + steps).tolist()))
+        series.append(({"__name__": "container_cpu_usage_seconds_total", **labels}, ts, (steps * 1.5 * (pod + 1)).tolist()))
+        series.append(({"__name__": "kube_pod_container_status_restarts_total", **labels, "instance": "ksm"},
+                       (start + steps * 15000 + 9000).tolist(), [2.0 * (pod + 1)] * len(steps)))
+    for half in (slice(0, 20), slice(20, 40)):
+        batch = [(labels, ts[half], values[half]) for labels, ts, values in series]
+        response = client.post("/api/v1/write", data=snappy_compress(encode_write_request(batch)), headers=HEADERS)
+        assert response.status_code == 204
+        buffer.flush()
+
+    stored = metrics_store.read(buffer.store_dir)
+    rows = stored[stored["memory_usage"].notna()].copy()
+    assert len(rows) == len(pods) * len(steps)
+    # Each row sees the grid point at or before it, where every pod's newest sample is from the step before
+    k = ((rows["timestamp"] - pd.Timestamp("2026-01-05 10:00")) // pd.Timedelta("15s")).to_numpy()
+    later = k >= 1
+    np.testing.assert_allclose(rows["memory_usage_avg"].to_numpy()[later], 100.0 + k[later] - 1)
+    np.testing.assert_allclose(rows["container_restarts_avg"].to_numpy()[later], 4.0)
+    np.testing.assert_allclose(rows["cpu_usage_avg"].to_numpy()[k >= 2], 0.1 * 2)
+    np.testing.assert_allclose(rows["cpu_usage"].dropna().to_numpy(),
+                               0.1 * (rows["pod"].str[-1].astype(int) + 1).to_numpy()[rows["cpu_usage"].notna()])
@@ -0,0 +1,106 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from xgboost import DMatrix, XGBClassifier
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+from ensemble import EnsemblePredictor
+from scoring_pipeline import ScoringPipeline
+from tree_engine import NATIVE_MIN_ROWS, TreeEnsemble, compile_model
+
+FEATURES = ["cpu_usage", "memory_usage", "container_restarts_avg", "cpu_usage_avg", "memory_usage_avg"]
+
+
+def synthetic(n, seed=0):
+    """Feature rows with a nonlinear failure rule, one column in 1e8s and ~2% missing values"""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.gamma(2.0, 0.2, (n, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    y = ((X.iloc[:, 0] + X.iloc[:, 2] * X.iloc[:, -1] + rng.normal(0, 0.1, n)) > 0.6).astype(int)
+    X["memory_usage"] *= np.float32(1e8)
+    X.iloc[rng.random(n) < 0.02, 2] = np.nan
+    return X, y
+
+
+@pytest.fixture(scope="module")
+def data():
+    return synthetic(3000, seed=1), synthetic(NATIVE_MIN_ROWS["mean"] + 500, seed=2)[0]
+
+
+@pytest.fixture(scope="module")
+def forest(data):
+    (X, y), _ = data
+    return RandomForestClassifier(n_estimators=40, max_depth=8, random_state=0, n_jobs=1).fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def booster(data):
+    (X, y), _ = data
+    return XGBClassifier(n_estimators=40, max_depth=6, learning_rate=0.1, n_jobs=1).fit(X, y)
+
+
+def test_forest_flat_arrays_match_sklearn(data, forest):
+    _, X = data
+    engine = compile_model(forest)
+    assert isinstance(engine, TreeEnsemble)
+    # Same float32 thresholds and the same leaf averaging: bit for bit
+    np.testing.assert_array_equal(engine.flat_proba(X), forest.predict_proba(X))
+    # Leaves are indices into the flat arrays: each tree's nodes start at its root
+    np.testing.assert_array_equal(engine.apply(X) - engine.roots, forest.apply(X))
+
+
+def test_booster_flat_arrays_match_xgboost(data, booster):
+    _, X = data
+    engine = compile_model(booster)
+    margins = booster.get_booster().predict(DMatrix(X), output_margin=True)
+    np.testing.assert_array_equal(engine._scores(engine._matrix(X)), margins)
+    # XGBoost's own expf may round the sigmoid a float32 step or two differently
+    proba = booster.predict_proba(X)[:, 1]
+    steps = np.abs(engine.flat_proba(X)[:, 1].astype(np.float64) - proba) / np.spacing(proba)
+    assert steps.max() <= 2
+
+
+@pytest.mark.parametrize("name", ["forest", "booster"])
+def test_labels_match_on_both_paths(request, data, name):
+    _, X = data
+    model = request.getfixturevalue(name)
+    engine = compile_model(model)
+    expected = model.predict(X)
+    small = NATIVE_MIN_ROWS[engine.kind] - 1
+    np.testing.assert_array_equal(np.concatenate([engine.predict(X.iloc[i:i + small])
+                                                  for i in range(0, len(X), small)]), expected)
+    np.testing.assert_array_equal(engine.predict(X.to_numpy()), expected)  # one batch: the model's predict
+
+
+@pytest.mark.parametrize("name", ["forest", "booster"])
+def test_large_batches_go_to_the_model(request, data, name):
+    _, X = data
+    model = request.getfixturevalue(name)
+    engine = compile_model(model)
+    rows = X.to_numpy()[:NATIVE_MIN_ROWS[engine.kind]]
+    np.testing.assert_array_equal(engine.predict_proba(rows), model.predict_proba(X.iloc[:len(rows)]))
+    one = rows[:1]
+    np.testing.assert_array_equal(engine.predict_proba(one), engine.flat_proba(one))
+
+
+def test_compiled_pipeline_matches_the_fitted_one(data, forest, booster):
+    (X_train, _), X = data
+    pipeline = ScoringPipeline(FEATURES, X_train.mean().to_numpy(),
+                               EnsemblePredictor({"rf": forest, "xgb": booster}))
+    compiled = pipeline.compiled()
+    assert all(isinstance(m, TreeEnsemble) for m in compiled.model.members.values())
+    for part in (X.iloc[:1], X.iloc[:100], X):
+        labels, proba = pipeline.classify(part)
+        compiled_labels, compiled_proba = compiled.classify(part)
+        np.testing.assert_array_equal(compiled_labels, labels)
+        np.testing.assert_allclose(compiled_proba, proba, rtol=0, atol=1e-6)
+
+
+def test_compiled_engine_pickles_with_its_model(tmp_path, data, booster):
+    import joblib
+    _, X = data
+    path = tmp_path / "engine.joblib"
+    joblib.dump(compile_model(booster), path)
+    engine = joblib.load(path, mmap_mode="r")
+    np.testing.assert_array_equal(engine.predict(X), booster.predict(X))